@@ -0,0 +1,415 @@
+# Benchmark for tenon and mortise builders.
+#
+# Run it with Blender in background mode from the repository root :
+#   blender --background --factory-startup --python benchmarks/joint_builders.py
+#   blender --background --python benchmarks/joint_builders.py -- \
+#       --output results.json --densities 0,16,64 --repeat 3
+#
+# A workpiece is created with WorkpieceOperator.create_piece. Mesh density is
+# raised with an unconnected grid of density x density faces added to the
+# same mesh, the joint face stays the same. Builders only visit the joint
+# region, so tenon and blind mortise timings should not depend on the grid.
+# Through mortises build a tree of all mesh faces (once per operator or
+# batch call) to find opposite faces : their cost grows with the total face
+# count.
+# Every property combination (haunches on height or thickness sides) is
+# timed for tenons (on the end face) and for blind and through mortises (on
+# the top face). Through mortises created in one batch call on the top faces
+# of several workpieces (sharing the face tree) are timed too. A tenon
+# created again from the redo cache with another size is timed against its
+# first creation.
+# Results (total and per stage timings, in seconds) are written to a JSON
+# file.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from statistics import median
+
+import bpy
+import bmesh
+from mathutils import Matrix, Vector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woodwork.piece import WorkpieceOperator
+from woodwork.tenon_mortise_builder import (TenonMortiseBuilder,
+                                            TenonMortiseBuilderProps,
+                                            FaceToBeTransformed,
+                                            JointSizing)
+from woodwork.joint_batch import JointBatch
+from woodwork.joint_profiler import JointProfiler
+from woodwork.joint_cache import JointCache
+from woodwork.joint_redo import JointRedoCache
+
+
+# Workpiece size (same attributes as WorkpieceSize property group)
+class PieceSize:
+    def __init__(self, length, width, thickness):
+        self.length = length
+        self.width = width
+        self.thickness = thickness
+
+
+PIECE_SIZE = PieceSize(0.5, 0.1, 0.03)
+
+# Workpieces in the mesh of the through mortises batch case
+BATCH_PIECE_COUNT = 8
+
+# Stages timed by JointProfiler in TenonMortiseBuilder.create. set_depth
+# includes through mortise time.
+STAGES = ("setup",
+          "remove_wood",
+          "subdivide",
+          "find_tenon",
+          "set_size",
+          "set_depth",
+          "clean_up",
+          "destroy")
+
+
+def parse_arguments():
+    argv = sys.argv
+    if "--" in argv:
+        argv = argv[argv.index("--") + 1:]
+    else:
+        argv = []
+    parser = argparse.ArgumentParser(
+        description="Benchmark woodwork joint builders")
+    parser.add_argument("--output", default="joint_builders.json",
+                        help="JSON file where results are written")
+    parser.add_argument("--densities", default="0,8,32,128",
+                        help="Comma separated sizes of the extra face grid")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs for each case (minimum and median kept)")
+    parser.add_argument("--clean-up", action="store_true",
+                        help="Dissolve coplanar faces after each joint")
+    parser.add_argument("--batch-pieces", type=int,
+                        default=BATCH_PIECE_COUNT,
+                        help="Workpieces with a through mortise in the "
+                             "batch case")
+    return parser.parse_args(argv)
+
+
+# Mesh used as template for each run : workpieces side by side and a grid
+# of density x density faces
+def create_template_mesh(density, piece_count=1):
+    bm = WorkpieceOperator.create_piece(PIECE_SIZE, Vector((0.0, 0.0, 0.0)))
+    piece_geom = bm.verts[:] + bm.edges[:] + bm.faces[:]
+    for piece_index in range(1, piece_count):
+        duplicate = bmesh.ops.duplicate(bm, geom=piece_geom)
+        bmesh.ops.translate(
+            bm,
+            vec=Vector((0.0, 2.0 * PIECE_SIZE.width * piece_index, 0.0)),
+            verts=[element for element in duplicate["geom"]
+                   if isinstance(element, bmesh.types.BMVert)])
+    if density > 0:
+        grid_matrix = Matrix.Translation((0.0, 0.0, -1.0))
+        bmesh.ops.create_grid(bm,
+                              x_segments=density + 1,
+                              y_segments=density + 1,
+                              size=0.5,
+                              matrix=grid_matrix)
+    mesh = bpy.data.meshes.new("benchmark_template_%d_%d" % (density,
+                                                             piece_count))
+    bm.to_mesh(mesh)
+    bm.free()
+    return mesh
+
+
+# Faces with normal along axis, on the workpieces
+def workpiece_faces(bm, axis):
+    return [face for face in bm.faces
+            if face.normal[axis] > 0.99 and
+            face.calc_center_median().z > -0.5]
+
+
+# Largest face with normal along axis, on the workpiece
+def find_face(bm, axis):
+    best_face = None
+    for face in workpiece_faces(bm, axis):
+        if best_face is None or face.calc_area() > best_face.calc_area():
+            best_face = face
+    return best_face
+
+
+def haunch_properties(haunch, angle):
+    haunch.type = "percentage"
+    haunch.depth_value = 0.0
+    haunch.depth_percentage = 1.0 / 3.0
+    haunch.angle = angle
+
+
+def side_properties(side, size_type, centered, haunches):
+    side.type = size_type
+    side.value = 0.5
+    side.percentage = 0.5
+    side.centered = centered
+    side.shoulder_type = "percentage"
+    side.shoulder_value = 0.0
+    side.shoulder_percentage = 0.25
+    side.reverse_shoulder = False
+    side.haunched_first_side = len(haunches) > 0
+    side.haunched_second_side = len(haunches) > 1
+    angle = haunches[0] if len(haunches) > 0 else "straight"
+    haunch_properties(side.haunch_first_side, angle)
+    haunch_properties(side.haunch_second_side, angle)
+
+
+# Property combinations : (description, properties). Haunches are on one
+# side at a time (height or thickness).
+def property_cases(joint, clean_up=False):
+    size_types = ("value", "percentage", "max")
+    haunch_variants = ((), ("straight",), ("sloped",),
+                       ("straight", "straight"), ("sloped", "sloped"))
+    haunch_sides = [((), haunches) for haunches in haunch_variants] + \
+        [(haunches, ()) for haunches in haunch_variants[1:]]
+    for (thickness_type, thickness_centered, height_type, height_centered,
+         (thickness_haunches, haunches)) in itertools.product(
+            size_types, (True, False), size_types, (True, False),
+            haunch_sides):
+        if height_centered and len(haunches) > 0:
+            continue
+        if thickness_centered and len(thickness_haunches) > 0:
+            continue
+        properties = TenonMortiseBuilderProps()
+        side_properties(properties.thickness_properties,
+                        thickness_type, thickness_centered,
+                        thickness_haunches)
+        side_properties(properties.height_properties,
+                        height_type, height_centered, haunches)
+        properties.depth_value = 0.0
+        properties.remove_wood = False
+        properties.clean_up = clean_up
+        description = {"joint": joint,
+                       "thickness": thickness_type,
+                       "thickness_centered": thickness_centered,
+                       "height": height_type,
+                       "height_centered": height_centered,
+                       "haunches": list(haunches),
+                       "thickness_haunches": list(thickness_haunches),
+                       "clean_up": clean_up}
+        yield description, properties
+
+
+def run_case(obj, template_mesh, joint, properties, profiler):
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.clear()
+    bm.from_mesh(template_mesh)
+    matrix_world = obj.matrix_world
+
+    if joint == "tenon":
+        face = find_face(bm, 0)
+    else:
+        face = find_face(bm, 2)
+    face_to_be_transformed = FaceToBeTransformed(face)
+    face_to_be_transformed.extract_features(matrix_world)
+    shortest_length = face_to_be_transformed.shortest_length
+    longest_length = face_to_be_transformed.longest_length
+
+    properties.thickness_properties.value = shortest_length / 3.0
+    properties.height_properties.value = longest_length / 3.0
+    if joint == "tenon":
+        properties.depth_value = 0.05
+    elif joint == "blind mortise":
+        properties.depth_value = PIECE_SIZE.thickness / 2.0
+    else:
+        properties.depth_value = PIECE_SIZE.thickness * 1.5
+    JointSizing.compute_values(properties, shortest_length, longest_length)
+    message = JointSizing.check_values(properties,
+                                       shortest_length,
+                                       longest_length)
+    if message is not None:
+        return "skipped", message, 0.0
+    if joint != "tenon":
+        properties.negate_depths()
+
+    profiler.profiles = []
+    start = time.perf_counter()
+    try:
+        TenonMortiseBuilder(properties).create(bm,
+                                               matrix_world,
+                                               face_to_be_transformed)
+    except Exception as exception:
+        return "error", repr(exception), time.perf_counter() - start
+    return "ok", None, time.perf_counter() - start
+
+
+# Tenon created with the redo cache on the template mesh, as the tenon
+# operator does. Returns the time spent creating it.
+def create_redo_tenon(obj, template_mesh, thickness_factor):
+    bm = bmesh.from_edit_mesh(obj.data)
+    bm.clear()
+    bm.from_mesh(template_mesh)
+    matrix_world = obj.matrix_world
+
+    face = find_face(bm, 0)
+    face_to_be_transformed = FaceToBeTransformed(face)
+    face_to_be_transformed.extract_features(matrix_world)
+    shortest_length = face_to_be_transformed.shortest_length
+    longest_length = face_to_be_transformed.longest_length
+
+    properties = next(property_cases("tenon"))[1]
+    properties.thickness_properties.type = "value"
+    properties.thickness_properties.value = \
+        shortest_length * thickness_factor
+    properties.height_properties.type = "value"
+    properties.height_properties.value = longest_length / 3.0
+    properties.depth_value = 0.05
+    JointSizing.compute_values(properties, shortest_length, longest_length)
+
+    start = time.perf_counter()
+    JointRedoCache.create("benchmark", bm, matrix_world,
+                          face_to_be_transformed, properties)
+    return time.perf_counter() - start
+
+
+# Redo panel : the tenon is created a first time (built), then the mesh is
+# restored and the tenon is created again with another thickness, as when a
+# size is changed in the redo panel (stamped from the redo cache)
+def run_redo_case(obj, template_mesh, repeat):
+    build_runs = []
+    redo_runs = []
+    for run in range(repeat):
+        JointCache.clear()
+        JointRedoCache.clear()
+        build_runs.append(create_redo_tenon(obj, template_mesh, 1.0 / 3.0))
+        redo_runs.append(create_redo_tenon(obj, template_mesh, 1.0 / 4.0))
+    return {"build_median": median(build_runs),
+            "redo_median": median(redo_runs)}
+
+
+# Through mortises on the top faces of all workpieces, created in one batch
+# call as the mortise operator does on selected faces
+def run_through_batch_case(obj, template_mesh, repeat):
+    runs = []
+    created = 0
+    for run in range(repeat):
+        JointCache.clear()
+        bm = bmesh.from_edit_mesh(obj.data)
+        bm.clear()
+        bm.from_mesh(template_mesh)
+        faces = workpiece_faces(bm, 2)
+
+        properties = next(property_cases("through mortise"))[1]
+        properties.thickness_properties.type = "percentage"
+        properties.height_properties.type = "percentage"
+        properties.depth_value = PIECE_SIZE.thickness * 1.5
+
+        start = time.perf_counter()
+        results = JointBatch(properties, is_mortise=True).create(
+            bm, obj.matrix_world, faces)
+        runs.append(time.perf_counter() - start)
+        created = sum(1 for result in results if result.success)
+    return {"mortise_count": created,
+            "batch_median": median(runs),
+            "mortise_median": median(runs) / max(created, 1)}
+
+
+def main():
+    arguments = parse_arguments()
+    densities = [int(density) for density in arguments.densities.split(",")]
+
+    scene = bpy.context.scene
+    mesh = bpy.data.meshes.new("benchmark")
+    obj = bpy.data.objects.new("benchmark", mesh)
+    scene.objects.link(obj)
+    scene.objects.active = obj
+    obj.select = True
+    bpy.ops.object.mode_set(mode='EDIT')
+
+    cases = []
+    scaling = []
+    redo = []
+    through_batch = []
+    with JointProfiler() as profiler:
+        for density in densities:
+            template_mesh = create_template_mesh(density)
+            face_count = len(template_mesh.polygons)
+            totals = []
+            for joint in ("tenon", "blind mortise", "through mortise"):
+                for description, properties in property_cases(
+                        joint, arguments.clean_up):
+                    runs = []
+                    stage_runs = []
+                    for repeat in range(arguments.repeat):
+                        run_properties = TenonMortiseBuilderProps.from_properties(
+                            properties)
+                        status, message, total = run_case(obj,
+                                                          template_mesh,
+                                                          joint,
+                                                          run_properties,
+                                                          profiler)
+                        if status != "ok":
+                            break
+                        runs.append(total)
+                        stage_runs.append(dict(
+                            (stage.name, stage.time)
+                            for stage in profiler.profiles[0].stages))
+
+                    case = {"density": density,
+                            "face_count": face_count,
+                            "properties": description,
+                            "status": status}
+                    if status == "ok":
+                        case["total_min"] = min(runs)
+                        case["total_median"] = median(runs)
+                        case["stages"] = dict(
+                            (name, median(run.get(name, 0.0)
+                                          for run in stage_runs))
+                            for name in STAGES)
+                        totals.append(case["total_median"])
+                    else:
+                        case["message"] = message
+                    cases.append(case)
+
+            scaling.append({"density": density,
+                            "face_count": face_count,
+                            "cases": len(totals),
+                            "total_median": median(totals) if totals else None,
+                            "total_sum": sum(totals)})
+            redo_case = run_redo_case(obj, template_mesh, arguments.repeat)
+            redo_case["density"] = density
+            redo_case["face_count"] = face_count
+            redo.append(redo_case)
+            bpy.data.meshes.remove(template_mesh)
+
+            batch_mesh = create_template_mesh(density, arguments.batch_pieces)
+            batch_case = run_through_batch_case(obj, batch_mesh,
+                                                arguments.repeat)
+            batch_case["density"] = density
+            batch_case["face_count"] = len(batch_mesh.polygons)
+            through_batch.append(batch_case)
+            bpy.data.meshes.remove(batch_mesh)
+            print("density %d (%d faces): %d cases, median %.6f s, "
+                  "redo %.6f s (build %.6f s), "
+                  "%d through mortises %.6f s" % (
+                      density, face_count, len(totals),
+                      median(totals) if totals else 0.0,
+                      redo_case["redo_median"],
+                      redo_case["build_median"],
+                      batch_case["mortise_count"],
+                      batch_case["batch_median"]))
+
+    bpy.ops.object.mode_set(mode='OBJECT')
+
+    results = {"blender_version": bpy.app.version_string,
+               "python_version": platform.python_version(),
+               "platform": platform.platform(),
+               "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+               "repeat": arguments.repeat,
+               "scaling": scaling,
+               "redo": redo,
+               "through_batch": through_batch,
+               "cases": cases}
+    with open(arguments.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print("Results written to %s" % arguments.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import pytest
+
+bmesh = pytest.importorskip("bmesh")
+
+from mathutils import Matrix
+
+from woodwork.joint_kernel import JointSizing, TenonMortiseBuilderProps
+from woodwork.tenon_mortise_builder import (FaceToBeTransformed,
+                                            TenonMortiseBuilder)
+
+
+def side_properties(side, side_type, centered, haunch_angle):
+    side.type = side_type
+    side.value = 0.0
+    side.percentage = 0.5
+    side.centered = centered
+    side.shoulder_type = "percentage"
+    side.shoulder_value = 0.0
+    side.shoulder_percentage = 0.25
+    side.reverse_shoulder = False
+    side.haunched_first_side = haunch_angle is not None
+    side.haunched_second_side = False
+    for haunch in (side.haunch_first_side, side.haunch_second_side):
+        haunch.type = "percentage"
+        haunch.depth_value = 0.0
+        haunch.depth_percentage = 1.0 / 3.0
+        haunch.angle = haunch_angle or "straight"
+
+
+def joint_properties(is_mortise, height_type, haunch_angle):
+    properties = TenonMortiseBuilderProps()
+    # Blind mortise in the 0.1 thick box
+    properties.depth_value = 0.02 if is_mortise else 0.05
+    properties.remove_wood = False
+    properties.clean_up = False
+    side_properties(properties.thickness_properties, "percentage", True,
+                    None)
+    side_properties(properties.height_properties, height_type, False,
+                    haunch_angle)
+    return properties
+
+
+# Haunches and shouldered max sizes merge vertices (automerge, pointmerge) :
+# faces and edges saved by the builder are found again without scanning the
+# whole mesh
+@pytest.mark.parametrize("is_mortise, height_type, haunch_angle",
+                         [(False, "percentage", "straight"),
+                          (False, "percentage", "sloped"),
+                          (True, "percentage", "straight"),
+                          (False, "max", None),
+                          (True, "max", None)])
+def test_builder_does_not_scan_mesh(is_mortise, height_type, haunch_angle):
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm, size=1.0, matrix=Matrix.Scale(0.1, 4))
+    for vert in bm.verts:
+        vert.co.x *= 3.0
+    bm.normal_update()
+    face = max(bm.faces, key=lambda face: face.normal.z)
+
+    matrix_world = Matrix.Identity(4)
+    face_to_be_transformed = FaceToBeTransformed(face)
+    face_to_be_transformed.extract_features(matrix_world)
+    properties = joint_properties(is_mortise, height_type, haunch_angle)
+    JointSizing.compute_values(properties,
+                               face_to_be_transformed.shortest_length,
+                               face_to_be_transformed.longest_length)
+    if is_mortise:
+        properties.negate_depths()
+
+    builder = TenonMortiseBuilder(properties)
+    face_count = len(bm.faces)
+    builder.create(bm, matrix_world, face_to_be_transformed)
+    assert len(bm.faces) > face_count
+    assert builder.geometry_retriever.scan_count == 0
+    bm.free()
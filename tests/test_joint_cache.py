@@ -0,0 +1,157 @@
+import pytest
+
+bmesh = pytest.importorskip("bmesh")
+
+from mathutils import Matrix
+
+from woodwork.joint_cache import JointCache
+from woodwork.joint_kernel import (JointFrame,
+                                   JointSizing,
+                                   TenonMortiseBuilderProps)
+from woodwork.tenon_mortise_builder import FaceToBeTransformed
+
+
+def side_properties(side, centered, shoulder, haunched):
+    side.type = "percentage"
+    side.value = 0.0
+    side.percentage = 0.5
+    side.centered = centered
+    side.shoulder_type = "percentage"
+    side.shoulder_value = 0.0
+    side.shoulder_percentage = shoulder
+    side.reverse_shoulder = False
+    side.haunched_first_side = haunched
+    side.haunched_second_side = False
+    for haunch in (side.haunch_first_side, side.haunch_second_side):
+        haunch.type = "percentage"
+        haunch.depth_value = 0.0
+        haunch.depth_percentage = 1.0 / 3.0
+        haunch.angle = "straight"
+
+
+def tenon_properties(centered, shoulder, haunched):
+    properties = TenonMortiseBuilderProps()
+    properties.depth_value = 0.05
+    properties.remove_wood = False
+    properties.clean_up = False
+    side_properties(properties.thickness_properties, True, 0.0, False)
+    side_properties(properties.height_properties, centered, shoulder,
+                    haunched)
+    return properties
+
+
+# 0.3 x 0.1 x 0.1 box with its +Z face (tenon face) returned. The mirrored
+# face is the same face with its vertex order starting on the next corner :
+# its frame has the other handedness.
+def create_box(mirrored=False):
+    bm = bmesh.new()
+    bmesh.ops.create_cube(bm,
+                          size=1.0,
+                          matrix=Matrix.Scale(0.1, 4))
+    for vert in bm.verts:
+        vert.co.x *= 3.0
+    bm.normal_update()
+    face = max(bm.faces, key=lambda face: face.normal.z)
+    if mirrored:
+        verts = list(face.verts)
+        bm.faces.remove(face)
+        face = bm.faces.new(verts[1:] + verts[:1])
+        bm.normal_update()
+    return bm, face
+
+
+def counts(bm):
+    return (len(bm.verts), len(bm.edges), len(bm.faces))
+
+
+def rounded(vector):
+    return tuple(round(co, 5) for co in vector)
+
+
+# Mesh counts, vertex positions, face centers and normals
+def mesh_state(bm):
+    bm.normal_update()
+    return (counts(bm),
+            sorted(rounded(vert.co) for vert in bm.verts),
+            sorted((rounded(face.calc_center_median()), rounded(face.normal))
+                   for face in bm.faces))
+
+
+# Returns the mesh state and the joint built or stamped from the cache
+def create_joint(properties, use_cache, mirrored=False):
+    bm, face = create_box(mirrored)
+    matrix_world = Matrix.Identity(4)
+    face_to_be_transformed = FaceToBeTransformed(face)
+    face_to_be_transformed.extract_features(matrix_world)
+    JointSizing.compute_values(properties,
+                               face_to_be_transformed.shortest_length,
+                               face_to_be_transformed.longest_length)
+    frame = JointFrame.from_quad([tuple(matrix_world * vert.co)
+                                  for vert in face.verts])
+    if use_cache:
+        entry = JointCache.create(bm, matrix_world, face_to_be_transformed,
+                                  properties)
+    else:
+        entry = JointCache.build(bm, matrix_world, face_to_be_transformed,
+                                 properties, frame)
+    result = mesh_state(bm)
+    bm.free()
+    return result, entry
+
+
+JOINT_CASES = [(True, 0.0, False),
+               (False, 0.25, False),
+               (False, 0.25, True)]
+
+
+@pytest.mark.parametrize("centered, shoulder, haunched", JOINT_CASES)
+def test_stamped_joint_matches_built_joint(centered, shoulder, haunched):
+    JointCache.clear()
+    built_state, built_entry = create_joint(
+        tenon_properties(centered, shoulder, haunched), False)
+    assert built_entry is not None
+
+    # First joint is built and cached, second one is stamped : the cached
+    # joint is returned
+    JointCache.clear()
+    first_state, first_entry = create_joint(
+        tenon_properties(centered, shoulder, haunched), True)
+    second_state, second_entry = create_joint(
+        tenon_properties(centered, shoulder, haunched), True)
+
+    assert first_entry is not None
+    assert second_entry is first_entry
+    assert first_state == built_state
+    assert second_state == built_state
+
+    bm = create_box()[0]
+    initial_counts = counts(bm)
+    bm.free()
+    assert built_entry.mesh_delta() == tuple(
+        count - initial_count
+        for count, initial_count in zip(built_state[0], initial_counts))
+
+
+@pytest.mark.parametrize("centered, shoulder, haunched", JOINT_CASES)
+def test_joint_on_mirrored_face_matches_built_joint(centered, shoulder,
+                                                    haunched):
+    JointCache.clear()
+    mirrored_built_state = create_joint(
+        tenon_properties(centered, shoulder, haunched), False, True)[0]
+
+    # Joint cached on the face with the other handedness is not stamped
+    JointCache.clear()
+    entry = create_joint(tenon_properties(centered, shoulder, haunched),
+                         True)[1]
+    mirrored_state, mirrored_entry = create_joint(
+        tenon_properties(centered, shoulder, haunched), True, True)
+    assert entry is not None
+    assert mirrored_entry is not None
+    assert mirrored_entry is not entry
+    assert mirrored_state == mirrored_built_state
+
+    # Joint cached on a mirrored face is stamped on mirrored faces
+    stamped_state, stamped_entry = create_joint(
+        tenon_properties(centered, shoulder, haunched), True, True)
+    assert stamped_entry is mirrored_entry
+    assert stamped_state == mirrored_built_state
@@ -0,0 +1,217 @@
+import pytest
+
+from woodwork.joint_kernel import (JointFrame,
+                                   JointKernel,
+                                   JointSizing,
+                                   TenonMortiseBuilderProps)
+
+# Reference quads : 0.3 x 0.1 rectangle in XY plane, with the longest side
+# first or second in loop order
+LONGEST_FIRST = [(0.0, 0.0, 0.0),
+                 (0.3, 0.0, 0.0),
+                 (0.3, 0.1, 0.0),
+                 (0.0, 0.1, 0.0)]
+SHORTEST_FIRST = [(0.0, 0.0, 0.0),
+                  (0.1, 0.0, 0.0),
+                  (0.1, 0.3, 0.0),
+                  (0.0, 0.3, 0.0)]
+
+
+def side_properties(side, side_type="value", value=0.1, centered=True,
+                    shoulder_value=0.0, reverse_shoulder=False,
+                    haunched_first_side=False, haunch_angle="straight"):
+    side.type = side_type
+    side.value = value
+    side.percentage = 0.0
+    side.centered = centered
+    side.shoulder_type = "value"
+    side.shoulder_value = shoulder_value
+    side.shoulder_percentage = 0.0
+    side.reverse_shoulder = reverse_shoulder
+    side.haunched_first_side = haunched_first_side
+    side.haunched_second_side = False
+    for haunch in (side.haunch_first_side, side.haunch_second_side):
+        haunch.type = "value"
+        haunch.depth_value = 0.02
+        haunch.depth_percentage = 0.0
+        haunch.angle = haunch_angle
+    return side
+
+
+def tenon_properties(**height_values):
+    properties = TenonMortiseBuilderProps()
+    properties.depth_value = 0.05
+    properties.remove_wood = False
+    properties.clean_up = False
+    side_properties(properties.thickness_properties, value=0.04)
+    side_properties(properties.height_properties, **height_values)
+    return properties
+
+
+# pytest.approx doesn't compare nested sequences
+def flat(points):
+    return [co for point in points for co in point]
+
+
+def compute(coords, properties):
+    frame = JointFrame.from_quad(coords)
+    JointSizing.compute_values(properties,
+                               frame.shortest_length,
+                               frame.longest_length)
+    return JointKernel.compute(frame, properties)
+
+
+@pytest.mark.parametrize("coords, origin, longest_axis, shortest_axis",
+                         [(LONGEST_FIRST,
+                           (0.3, 0.0, 0.0),
+                           (-1.0, 0.0, 0.0),
+                           (0.0, 1.0, 0.0)),
+                          (SHORTEST_FIRST,
+                           (0.1, 0.0, 0.0),
+                           (0.0, 1.0, 0.0),
+                           (-1.0, 0.0, 0.0))])
+def test_frame_from_quad(coords, origin, longest_axis, shortest_axis):
+    frame = JointFrame.from_quad(coords)
+    assert frame.origin == pytest.approx(origin)
+    assert frame.longest_axis == pytest.approx(longest_axis)
+    assert frame.shortest_axis == pytest.approx(shortest_axis)
+    assert frame.normal == pytest.approx((0.0, 0.0, 1.0))
+    assert frame.longest_length == pytest.approx(0.3)
+    assert frame.shortest_length == pytest.approx(0.1)
+
+
+def test_frame_handedness():
+    # Same rectangle, vertex order starting on another edge
+    assert JointFrame.from_quad(LONGEST_FIRST).handedness() == -1
+    assert JointFrame.from_quad(LONGEST_FIRST[1:] +
+                                LONGEST_FIRST[:1]).handedness() == 1
+    assert JointFrame.from_quad(SHORTEST_FIRST).handedness() == 1
+
+
+def test_frame_local_coords():
+    frame = JointFrame.from_quad(LONGEST_FIRST)
+    point = frame.point(0.2, 0.05, 0.01)
+    assert point == pytest.approx((0.1, 0.05, 0.01))
+    assert frame.local_coords(point) == pytest.approx((0.2, 0.05, 0.01))
+
+
+@pytest.mark.parametrize("values, start, end, is_max",
+                         [(dict(), 0.1, 0.2, False),
+                          (dict(side_type="max"), 0.0, 0.3, True),
+                          (dict(centered=False, shoulder_value=0.05),
+                           0.05, 0.15, False),
+                          (dict(centered=False, shoulder_value=0.05,
+                                reverse_shoulder=True),
+                           0.15, 0.25, False),
+                          # Shoulder and tenon reach the border
+                          (dict(value=0.2, centered=False,
+                                shoulder_value=0.1),
+                           0.1, 0.3, True),
+                          (dict(side_type="max", centered=False,
+                                shoulder_value=0.1),
+                           0.1, 0.3, True)])
+def test_side(values, start, end, is_max):
+    side = JointKernel.side(
+        side_properties(TenonMortiseBuilderProps().height_properties,
+                        **values),
+        0.3)
+    assert side.start == pytest.approx(start)
+    assert side.end == pytest.approx(end)
+    assert side.length == pytest.approx(0.3)
+    assert side.is_max == is_max
+
+
+def test_max_side_cuts():
+    side = JointKernel.side(
+        side_properties(TenonMortiseBuilderProps().height_properties,
+                        side_type="max"),
+        0.3)
+    assert side.cuts() == pytest.approx([0.0, 0.3])
+
+
+def test_compute_centered():
+    geometry = compute(LONGEST_FIRST, tenon_properties())
+    assert len(geometry.grid()) == 4
+    assert len(geometry.grid()[0]) == 4
+    assert geometry.haunches == []
+    assert flat(geometry.tenon_top()) == pytest.approx(
+        flat([(0.2, 0.03, 0.05),
+              (0.1, 0.03, 0.05),
+              (0.1, 0.07, 0.05),
+              (0.2, 0.07, 0.05)]))
+
+
+@pytest.mark.parametrize("haunch_angle, depths",
+                         [("straight", (0.02, 0.02, 0.02, 0.02)),
+                          ("sloped", (0.0, 0.02, 0.02, 0.0))])
+def test_compute_haunched(haunch_angle, depths):
+    geometry = compute(LONGEST_FIRST,
+                       tenon_properties(centered=False,
+                                        shoulder_value=0.05,
+                                        haunched_first_side=True,
+                                        haunch_angle=haunch_angle))
+    assert len(geometry.haunches) == 1
+    haunch = geometry.haunches[0]
+    frame = geometry.frame
+    # Haunch fills the first shoulder, under the tenon thickness
+    assert flat(frame.local_coords(point)[:2] for point in haunch.base) == \
+        pytest.approx(flat([(0.0, 0.03),
+                            (0.05, 0.03),
+                            (0.05, 0.07),
+                            (0.0, 0.07)]))
+    assert [frame.local_coords(point)[2] for point in haunch.top] == \
+        pytest.approx(list(depths))
+
+
+def test_compute_remove_wood():
+    properties = tenon_properties()
+    properties.remove_wood = True
+    geometry = compute(LONGEST_FIRST, properties)
+    assert geometry.frame.origin == pytest.approx((0.3, 0.0, -0.05))
+    assert geometry.tenon_top()[0][2] == pytest.approx(0.0)
+
+
+def signature(coords, properties):
+    return JointKernel.topology_signature(properties,
+                                          compute(coords, properties))
+
+
+def test_signature_ignores_sizes():
+    scaled = [tuple(co * 2.0 for co in point) for point in LONGEST_FIRST]
+    assert signature(LONGEST_FIRST, tenon_properties()) == \
+        signature(scaled, tenon_properties())
+    assert signature(LONGEST_FIRST, tenon_properties()) == \
+        signature(LONGEST_FIRST, tenon_properties(value=0.15))
+
+
+@pytest.mark.parametrize("values",
+                         [dict(side_type="max"),
+                          dict(centered=False, shoulder_value=0.05),
+                          dict(centered=False, shoulder_value=0.05,
+                               reverse_shoulder=True),
+                          dict(centered=False, shoulder_value=0.05,
+                               haunched_first_side=True),
+                          dict(centered=False, shoulder_value=0.05,
+                               haunched_first_side=True,
+                               haunch_angle="sloped")])
+def test_signature_changes_with_topology(values):
+    assert signature(LONGEST_FIRST, tenon_properties()) != \
+        signature(LONGEST_FIRST, tenon_properties(**values))
+
+
+def test_signature_merged_points():
+    # Sloped haunch top stays on the face on the border side : its points
+    # are merged with grid points
+    properties = tenon_properties(centered=False,
+                                  shoulder_value=0.05,
+                                  haunched_first_side=True,
+                                  haunch_angle="sloped")
+    merged_points = signature(LONGEST_FIRST, properties)[3]
+    assert (("grid", 0, 1), ("haunch", 0, 0)) in merged_points
+    assert (("grid", 0, 2), ("haunch", 0, 3)) in merged_points
+
+
+def test_signature_changes_with_handedness():
+    mirrored = LONGEST_FIRST[1:] + LONGEST_FIRST[:1]
+    assert signature(LONGEST_FIRST, tenon_properties()) != \
+        signature(mirrored, tenon_properties())
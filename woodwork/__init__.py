@@ -4,7 +4,7 @@ bl_info = {
     "description": "Help joining timber for woodworkers",
     "author": "Christophe Chabanois",
     "version": (1, 0),
-    "blender": (2, 71, 0),
+    "blender": (2, 76, 0),
     "location": "View3D > Tool Shelf > Woodworking",
     "warning": "",
     "wiki_url": "https://github.com/Khrisbie/blender-woodworking",
@@ -16,14 +16,27 @@ if "bpy" in locals():
     print("Reloading WoodWorking v %d.%d" % bl_info["version"])
     import imp
 
+    imp.reload(joint_kernel)
+    imp.reload(joint_plan)
+    imp.reload(joint_profiler)
+    imp.reload(tenon_mortise_builder)
+    imp.reload(joint_cache)
+    imp.reload(joint_batch)
+    imp.reload(face_index)
+    imp.reload(joint_redo)
+
     imp.reload(mortise_properties)
     imp.reload(mortise)
     imp.reload(tenon_properties)
     imp.reload(tenon)
+    imp.reload(joint_marks)
+    imp.reload(joint_pair)
     imp.reload(joints_panel)
 
     imp.reload(piece_properties)
     imp.reload(piece)
+    imp.reload(cutting_list)
+    imp.reload(joint_stack)
     imp.reload(components_panel)
 
     imp.reload(scene_woodwork)
@@ -34,32 +47,61 @@ if "bpy" in locals():
 else:
     print("Loading WoodWorking v %d.%d" % bl_info["version"])
 
-    from . import mortise_properties
-    from . import mortise
-    from . import tenon_properties
-    from . import tenon
-    from . import joints_panel
+    # Outside Blender, only modules which don't need bpy can be imported
+    # (joint_kernel, joint_plan...)
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
+
+    from . import joint_kernel
+    from . import joint_plan
+
+    if bpy is not None:
+        from . import joint_profiler
+        from . import tenon_mortise_builder
+        from . import joint_cache
+        from . import joint_batch
+        from . import face_index
+        from . import joint_redo
 
-    from . import piece_properties
-    from . import piece
-    from . import components_panel
+        from . import mortise_properties
+        from . import mortise
+        from . import tenon_properties
+        from . import tenon
+        from . import joint_marks
+        from . import joint_pair
+        from . import joints_panel
 
-    from . import scene_woodwork
-    from . import object_woodwork
+        from . import piece_properties
+        from . import piece
+        from . import cutting_list
+        from . import joint_stack
+        from . import components_panel
 
-    from . import translations
+        from . import scene_woodwork
+        from . import object_woodwork
+
+        from . import translations
 
 
 # registration
 def register():
+    joint_cache.JointCache.clear()
+    face_index.MeshFaceIndexCache.clear()
+
     tenon_properties.register()
     tenon.register()
+    joint_marks.register()
+    joint_pair.register()
     mortise_properties.register()
     mortise.register()
     joints_panel.register()
 
     piece_properties.register()
     piece.register()
+    cutting_list.register()
+    joint_stack.register()
     components_panel.register()
 
     scene_woodwork.register()
@@ -69,18 +111,26 @@ def register():
 
 
 def unregister():
+    joint_redo.JointRedoCache.clear()
+    joint_cache.JointCache.clear()
+    face_index.MeshFaceIndexCache.clear()
+
     translations.unregister(__name__)
 
     object_woodwork.unregister()
     scene_woodwork.unregister()
 
     components_panel.unregister()
+    joint_stack.unregister()
+    cutting_list.unregister()
     piece.unregister()
     piece_properties.unregister()
 
     joints_panel.unregister()
     mortise.unregister()
     mortise_properties.unregister()
+    joint_pair.unregister()
+    joint_marks.unregister()
     tenon.unregister()
     tenon_properties.unregister()
 
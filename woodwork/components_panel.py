@@ -15,6 +15,8 @@ class ComponentsPanel(bpy.types.Panel):
         box = layout.box()
         row = box.row()
         row.operator("mesh.woodwork_workpiece")
+        row = box.row()
+        row.operator("object.woodwork_cutting_list_export")
 
 
 def register():
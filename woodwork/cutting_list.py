@@ -0,0 +1,153 @@
+import csv
+import json
+
+import bpy
+from bpy.props import (
+    BoolProperty,
+    EnumProperty,
+    StringProperty
+)
+from bpy_extras.io_utils import ExportHelper
+
+
+# Cutting list of workpieces. Rows are generated one object at a time and
+# written as soon as they are generated, so the whole list of rows is never
+# held in memory.
+class CuttingList:
+    FIELDS = ("name",
+              "type",
+              "length",
+              "width",
+              "thickness",
+              "groups",
+              "count",
+              "comments")
+
+    @staticmethod
+    def is_woodwork_object(scene_object):
+        woodwork = scene_object.woodwork
+        return scene_object.type == 'MESH' and (
+            woodwork.is_workpiece or woodwork.cutting_list_type != "")
+
+    # Workpiece dimensions sorted as length, width and thickness. Object
+    # dimensions come from the evaluated mesh bounding box (modifiers and
+    # scale are taken into account).
+    @staticmethod
+    def dimensions(scene_object):
+        return sorted(scene_object.dimensions, reverse=True)
+
+    # count : number of exported objects sharing the object mesh
+    @staticmethod
+    def row(scene_object, count=1):
+        woodwork = scene_object.woodwork
+        length, width, thickness = CuttingList.dimensions(scene_object)
+        groups = [group.name for group in scene_object.users_group]
+        return {"name": scene_object.name,
+                "type": woodwork.cutting_list_type,
+                "length": length,
+                "width": width,
+                "thickness": thickness,
+                "groups": ";".join(groups),
+                "count": count,
+                "comments": woodwork.comments}
+
+    # Linked copies share the same mesh : one row for all of them, counting
+    # only the copies that are exported (mesh users may be hidden, in other
+    # scenes or not selected)
+    @staticmethod
+    def rows(objects):
+        woodwork_objects = [scene_object for scene_object in objects
+                            if CuttingList.is_woodwork_object(scene_object)]
+        mesh_counts = dict()
+        for scene_object in woodwork_objects:
+            mesh_name = scene_object.data.name
+            mesh_counts[mesh_name] = mesh_counts.get(mesh_name, 0) + 1
+
+        exported_meshes = set()
+        for scene_object in woodwork_objects:
+            mesh_name = scene_object.data.name
+            if mesh_name in exported_meshes:
+                continue
+            exported_meshes.add(mesh_name)
+            yield CuttingList.row(scene_object, mesh_counts[mesh_name])
+
+    @staticmethod
+    def write_csv(rows, output_file):
+        writer = csv.DictWriter(output_file, fieldnames=CuttingList.FIELDS)
+        writer.writeheader()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+
+    @staticmethod
+    def write_json_lines(rows, output_file):
+        count = 0
+        for row in rows:
+            output_file.write(json.dumps(row, sort_keys=True) + "\n")
+            count += 1
+        return count
+
+    # Usable from scripts, e.g. in background mode :
+    #   blender --background project.blend --python-expr \
+    #   "import bpy; from woodwork.cutting_list import CuttingList; \
+    #   CuttingList.export(bpy.context.scene.objects, 'parts.csv', 'csv')"
+    # Returns the number of rows written.
+    @staticmethod
+    def export(objects, filepath, file_format="csv"):
+        with open(filepath, "w", newline="") as output_file:
+            rows = CuttingList.rows(objects)
+            if file_format == "csv":
+                return CuttingList.write_csv(rows, output_file)
+            else:
+                return CuttingList.write_json_lines(rows, output_file)
+
+
+class CuttingListExportOperator(bpy.types.Operator, ExportHelper):
+    bl_description = "Export cutting list of workpieces"
+    bl_idname = "object.woodwork_cutting_list_export"
+    bl_label = "Export cutting list"
+    bl_category = 'Woodwork'
+
+    filename_ext = ".csv"
+    filter_glob = StringProperty(default="*.csv;*.jsonl", options={'HIDDEN'})
+
+    file_format = EnumProperty(
+        items=[('csv',
+                "CSV",
+                "Comma separated values"),
+               ('jsonl',
+                "JSON lines",
+                "One JSON object per line")],
+        name="Format",
+        default='csv')
+
+    selected_only = BoolProperty(
+        name="Selected only",
+        description="Export only selected workpieces",
+        default=False)
+
+    # File extension follows the chosen format
+    def check(self, context):
+        self.filename_ext = "." + self.file_format
+        return ExportHelper.check(self, context)
+
+    def execute(self, context):
+        if self.selected_only:
+            objects = context.selected_objects
+        else:
+            objects = context.scene.objects
+
+        count = CuttingList.export(objects, self.filepath, self.file_format)
+        self.report({'INFO'},
+                    str(count) + " workpiece(s) exported to " + self.filepath)
+        return {'FINISHED'}
+
+
+def register():
+    bpy.utils.register_class(CuttingListExportOperator)
+
+
+def unregister():
+    bpy.utils.unregister_class(CuttingListExportOperator)
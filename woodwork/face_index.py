@@ -0,0 +1,191 @@
+import hashlib
+from collections import OrderedDict
+
+import bmesh
+from mathutils import Vector
+
+from . joint_kernel import JointFrame
+from . woodwork_geom_utils import GeomUtils, FaceArrays, numpy
+
+# Faces of a whole mesh classified at once : where a tenon or a mortise can
+# be created and which faces are end grain faces. Sizes are given in world
+# space, as joint sizes.
+
+
+class MeshFaceIndex:
+    # Tolerance on the dot product between face normal and workpiece length
+    END_GRAIN_TOLERANCE = 1.e-4
+
+    def __init__(self, quad, planar, rectangular, longest_lengths,
+                 shortest_lengths, end_grain):
+        self.quad = quad
+        self.planar = planar
+        self.rectangular = rectangular
+        self.longest_lengths = longest_lengths
+        self.shortest_lengths = shortest_lengths
+        self.end_grain = end_grain
+
+    def __len__(self):
+        return len(self.quad)
+
+    def is_joint_ready(self, face_index):
+        return bool(self.quad[face_index] and self.planar[face_index] and
+                    self.rectangular[face_index])
+
+    # Indices of faces where a joint can be created
+    def joint_faces(self):
+        return [face_index for face_index in range(len(self))
+                if self.is_joint_ready(face_index)]
+
+    # Indices of end grain faces where a joint can be created
+    def end_faces(self):
+        return [face_index for face_index in range(len(self))
+                if self.end_grain[face_index] and
+                self.is_joint_ready(face_index)]
+
+    # Workpiece length is along the longest side of the mesh bounding box
+    @staticmethod
+    def __length_axis(coords, matrix_world):
+        extents = coords.max(axis=0) - coords.min(axis=0)
+        axis = numpy.zeros(3)
+        axis[int(numpy.argmax(extents))] = 1.0
+        if matrix_world is not None:
+            axis = numpy.dot(numpy.array(matrix_world)[:3, :3], axis)
+        return axis / numpy.linalg.norm(axis)
+
+    @staticmethod
+    def __to_world(face_arrays, matrix_world):
+        matrix = numpy.array(matrix_world)
+        rotation_and_scale = matrix[:3, :3]
+        face_arrays.points = numpy.dot(face_arrays.points,
+                                       rotation_and_scale.T) + matrix[:3, 3]
+        normals = numpy.dot(face_arrays.normals,
+                            numpy.linalg.inv(rotation_and_scale))
+        lengths = numpy.linalg.norm(normals, axis=1)
+        lengths[lengths == 0.0] = 1.0
+        face_arrays.normals = normals / lengths[:, None]
+
+    @staticmethod
+    def from_arrays(face_arrays, coords, matrix_world=None):
+        if len(face_arrays) == 0:
+            empty = numpy.zeros(0, dtype=bool)
+            return MeshFaceIndex(empty, empty, empty,
+                                 numpy.zeros(0), numpy.zeros(0), empty)
+        if matrix_world is not None:
+            MeshFaceIndex.__to_world(face_arrays, matrix_world)
+
+        quad = face_arrays.sizes == 4
+        planar = GeomUtils.are_faces_planar(face_arrays)
+        rectangular = GeomUtils.are_faces_rectangular(face_arrays)
+
+        # Sides of quads, as in JointFrame.from_quad
+        points = face_arrays.points
+        starts = face_arrays.starts
+        second_corners = starts + 1
+        third_corners = starts + 2
+        length0 = numpy.linalg.norm(points[starts] - points[second_corners],
+                                    axis=1)
+        length1 = numpy.linalg.norm(points[third_corners] -
+                                    points[second_corners],
+                                    axis=1)
+
+        length_axis = MeshFaceIndex.__length_axis(coords, matrix_world)
+        end_grain = numpy.abs(face_arrays.normals.dot(length_axis)) > \
+            1.0 - MeshFaceIndex.END_GRAIN_TOLERANCE
+        return MeshFaceIndex(quad,
+                             planar,
+                             rectangular,
+                             numpy.maximum(length0, length1),
+                             numpy.minimum(length0, length1),
+                             end_grain)
+
+    # Same classification, face by face (numpy not available)
+    @staticmethod
+    def from_bmesh(bm, matrix_world=None):
+        corners = [vert.co for vert in bm.verts]
+        length_axis = Vector()
+        if len(corners) > 0:
+            extents = [max(co[axis] for co in corners) -
+                       min(co[axis] for co in corners)
+                       for axis in range(3)]
+            length_axis[extents.index(max(extents))] = 1.0
+
+        if matrix_world is not None:
+            length_axis = (matrix_world.to_3x3() * length_axis).normalized()
+            bm.transform(matrix_world)
+            bm.normal_update()
+
+        quad = []
+        planar = []
+        rectangular = []
+        longest_lengths = []
+        shortest_lengths = []
+        end_grain = []
+        for face in bm.faces:
+            quad.append(len(face.verts) == 4)
+            planar.append(GeomUtils.is_face_planar(face))
+            rectangular.append(GeomUtils.is_face_rectangular(face))
+            if quad[-1]:
+                frame = JointFrame.from_quad([tuple(vert.co)
+                                              for vert in face.verts])
+                longest_lengths.append(frame.longest_length)
+                shortest_lengths.append(frame.shortest_length)
+            else:
+                longest_lengths.append(0.0)
+                shortest_lengths.append(0.0)
+            end_grain.append(
+                abs(face.normal.dot(length_axis)) >
+                1.0 - MeshFaceIndex.END_GRAIN_TOLERANCE)
+        return MeshFaceIndex(quad, planar, rectangular, longest_lengths,
+                             shortest_lengths, end_grain)
+
+
+# Face indices by mesh content : the index of a mesh is computed again only
+# when its vertices, faces or object matrix change
+class MeshFaceIndexCache:
+    max_size = 64
+    entries = OrderedDict()
+
+    @staticmethod
+    def clear():
+        MeshFaceIndexCache.entries.clear()
+
+    @staticmethod
+    def __content_hash(face_arrays, coords, matrix_world):
+        content = hashlib.md5()
+        content.update(coords.tobytes())
+        content.update(face_arrays.points.tobytes())
+        content.update(face_arrays.sizes.tobytes())
+        if matrix_world is not None:
+            content.update(repr([tuple(row)
+                                 for row in matrix_world]).encode("utf-8"))
+        return content.hexdigest()
+
+    @staticmethod
+    def __get_with_numpy(mesh, matrix_world):
+        face_arrays, coords = FaceArrays.from_mesh(mesh)
+        key = MeshFaceIndexCache.__content_hash(face_arrays, coords,
+                                                matrix_world)
+        entries = MeshFaceIndexCache.entries
+        index = entries.get(key)
+        if index is not None:
+            entries.move_to_end(key)
+            return index
+
+        index = MeshFaceIndex.from_arrays(face_arrays, coords, matrix_world)
+        entries[key] = index
+        while len(entries) > MeshFaceIndexCache.max_size:
+            entries.popitem(last=False)
+        return index
+
+    # Index of the faces of a mesh (object mode data)
+    @staticmethod
+    def get(mesh, matrix_world=None):
+        if numpy is not None:
+            return MeshFaceIndexCache.__get_with_numpy(mesh, matrix_world)
+
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        index = MeshFaceIndex.from_bmesh(bm, matrix_world)
+        bm.free()
+        return index
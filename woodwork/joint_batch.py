@@ -0,0 +1,198 @@
+from . tenon_mortise_builder import (TenonMortiseBuilder,
+                                     TenonMortiseBuilderProps,
+                                     FaceToBeTransformed,
+                                     FaceTree,
+                                     GeometryRetriever)
+from . joint_cache import JointCache
+from . joint_kernel import JointFrame
+from . joint_plan import JointPlanRequest, JointPlanner
+from . woodwork_geom_utils import GeomUtils, FaceArrays, numpy
+
+
+# Result of a tenon or mortise creation on one face
+class JointResult:
+    def __init__(self, face_index, success, message=None,
+                 cleaned_face_count=0):
+        self.face_index = face_index
+        self.success = success
+        self.message = message
+        self.cleaned_face_count = cleaned_face_count
+
+
+# Create tenons or mortises on several faces of the same mesh in one pass.
+# Mesh is loaded and written back once by the caller, faces are tracked with
+# a dedicated layer because each joint creation changes the geometry.
+class JointBatch:
+    def __init__(self, properties, is_mortise=False):
+        self.properties = properties
+        self.is_mortise = is_mortise
+        if is_mortise:
+            self.joint_name = "mortise"
+        else:
+            self.joint_name = "tenon"
+        self.geometry_retriever = GeometryRetriever("batch_retriever")
+
+    # Check if a face could be used for a joint, returns an error message or
+    # None
+    @staticmethod
+    def check_face(face):
+        if len(face.verts) > 4:
+            return "Selected face is not quad."
+
+        if not GeomUtils.is_face_planar(face):
+            return "Selected face is not planar."
+
+        if not GeomUtils.is_face_rectangular(face):
+            return "Selected face is not rectangular."
+        return None
+
+    # Check all faces at once, returns an error message or None for each face
+    @staticmethod
+    def check_faces(faces):
+        if numpy is None or len(faces) == 0:
+            return [JointBatch.check_face(face) for face in faces]
+
+        face_arrays = FaceArrays.from_faces(faces)
+        planar = GeomUtils.are_faces_planar(face_arrays)
+        rectangular = GeomUtils.are_faces_rectangular(face_arrays)
+        messages = []
+        for face_index, face_size in enumerate(face_arrays.sizes):
+            if face_size > 4:
+                messages.append("Selected face is not quad.")
+            elif not planar[face_index]:
+                messages.append("Selected face is not planar.")
+            elif not rectangular[face_index]:
+                messages.append("Selected face is not rectangular.")
+            else:
+                messages.append(None)
+        return messages
+
+    def __plan_request(self, face_index, face, matrix_world):
+        # Work on a copy : scene properties keep user choices for next faces
+        builder_properties = TenonMortiseBuilderProps.from_properties(
+            self.properties)
+        return JointPlanRequest(face_index,
+                                JointBatch.__face_coords(face, matrix_world),
+                                builder_properties,
+                                self.is_mortise)
+
+    @staticmethod
+    def __face_coords(face, matrix_world):
+        return [tuple(matrix_world * vert.co) for vert in face.verts]
+
+    # templates : joints already built in this batch, by topology signature
+    # (which includes the face frame handedness).
+    # Cleaned up joints are always built (see JointCache.build).
+    @staticmethod
+    def __stamp_or_build(bm, matrix_world, face, frame, plan, templates,
+                         face_tree):
+        face_index = plan.face_index
+        template = templates.get(plan.signature)
+        if template is not None:
+            if JointCache.stamp(bm, matrix_world, face, frame, template,
+                                plan.points, "batch templates"):
+                return JointResult(face_index, True)
+
+        face_to_be_transformed = FaceToBeTransformed(face)
+        face_to_be_transformed.extract_features(matrix_world)
+        if getattr(plan.properties, "clean_up", False):
+            builder = TenonMortiseBuilder(plan.properties, face_tree)
+            cleaned_face_count = builder.create(bm,
+                                                matrix_world,
+                                                face_to_be_transformed)
+            return JointResult(face_index, True,
+                               cleaned_face_count=cleaned_face_count)
+
+        # Joints already created on a face of the same size (in this batch
+        # or before) are stamped from the joint cache
+        template = JointCache.create(bm,
+                                     matrix_world,
+                                     face_to_be_transformed,
+                                     plan.properties,
+                                     face_tree)
+        if template is not None:
+            templates[plan.signature] = template
+        return JointResult(face_index, True)
+
+    def __create_joint(self, bm, matrix_world, face, plan, templates,
+                       face_tree):
+        coords = JointBatch.__face_coords(face, matrix_world)
+        if coords != plan.coords:
+            # Face has been changed by a previous joint, plan it again
+            plan = JointPlanner.compute_plan(
+                self.__plan_request(plan.face_index, face, matrix_world))
+        if plan.message is not None:
+            return JointResult(plan.face_index, False, plan.message)
+
+        frame = JointFrame.from_quad(coords)
+        corner_verts = list(face.verts)
+        result = JointBatch.__stamp_or_build(bm, matrix_world, face, frame,
+                                             plan, templates, face_tree)
+
+        # Faces changed by the joint are not up to date in the tree used by
+        # next through mortises
+        if face_tree.is_built():
+            face_tree.mark_changed(TenonMortiseBuilder.joint_region_faces(
+                matrix_world, frame, plan.points.values(), corner_verts))
+        return result
+
+    # Create joints on given faces, returns a JointResult per face.
+    # Sizes and vertices positions of all joints are planned first, then the
+    # first joint of each topology is built and the next ones are stamped
+    # from it.
+    def create(self, bm, matrix_world, faces):
+        bm.faces.index_update()
+        face_indices = [face.index for face in faces]
+
+        # Faces are checked before any change in the mesh
+        messages = JointBatch.check_faces(faces)
+
+        requests = [self.__plan_request(face_index, face, matrix_world)
+                    for face_index, face, message in zip(face_indices,
+                                                         faces,
+                                                         messages)
+                    if message is None]
+        plans = dict((plan.face_index, plan)
+                     for plan in JointPlanner.compute_plans(requests))
+
+        self.geometry_retriever.create(bm)
+        # References start at 1 : 0 is the layer default value
+        self.geometry_retriever.save_faces(faces, 1)
+
+        templates = dict()
+        # Built by the first through mortise, shared by the next ones
+        face_tree = FaceTree(bm)
+        results = []
+        for reference, face_index in enumerate(face_indices, 1):
+            face = self.geometry_retriever.retrieve_face(reference)
+            if messages[reference - 1] is not None:
+                results.append(JointResult(face_index, False,
+                                           messages[reference - 1]))
+                continue
+            if face is None:
+                results.append(JointResult(face_index, False,
+                                           "Face has been removed by a "
+                                           "previous " + self.joint_name +
+                                           "."))
+                continue
+
+            results.append(self.__create_joint(bm,
+                                               matrix_world,
+                                               face,
+                                               plans[face_index],
+                                               templates,
+                                               face_tree))
+
+        self.geometry_retriever.destroy()
+        return results
+
+    # Create joints on faces given by their indices (usable from scripts)
+    def create_from_indices(self, bm, matrix_world, face_indices):
+        all_faces = list(bm.faces)
+        faces = [all_faces[face_index] for face_index in face_indices]
+        return self.create(bm, matrix_world, faces)
+
+    # Create joints on all selected faces
+    def create_on_selected_faces(self, bm, matrix_world):
+        faces = [face for face in bm.faces if face.select]
+        return self.create(bm, matrix_world, faces)
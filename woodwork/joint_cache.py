@@ -0,0 +1,321 @@
+from collections import OrderedDict
+
+import bmesh
+from mathutils import Vector
+
+from . tenon_mortise_builder import TenonMortiseBuilder
+from . joint_profiler import JointProfiler
+from . joint_kernel import (JointFrame,
+                            JointKernel,
+                            TenonMortiseBuilderProps)
+from . woodwork_geom_utils import GeomUtils
+
+
+# Joint created on a face, in face local space : vertices are given by their
+# distances along the longest side, the shortest side and the normal of the
+# face, faces by the symbols of their vertices. Face vertex orders are only
+# valid on frames of the same handedness.
+class JointCacheEntry:
+    def __init__(self, coords, faces, selected_faces, grid_size, handedness):
+        self.coords = coords
+        self.faces = faces
+        self.selected_faces = selected_faces
+        self.grid_size = grid_size
+        self.handedness = handedness
+
+    # Vertices, edges and faces added to the mesh when the joint is stamped
+    # on a face (face corners and border edges are reused)
+    def mesh_delta(self):
+        edges = set()
+        for face_symbols in self.faces:
+            for index, symbol in enumerate(face_symbols):
+                next_symbol = face_symbols[(index + 1) % len(face_symbols)]
+                edges.add(frozenset((symbol, next_symbol)))
+        return (len(self.coords) - 4,
+                len(edges) - 4,
+                len(self.faces) - 1)
+
+
+# Memoisation of joints : when a joint with the same face sizes, the same
+# frame handedness and the same properties has already been built, the faces
+# created last time are stamped on the new face instead of running the
+# builder again.
+class JointCache:
+    max_size = 64
+    entries = OrderedDict()
+
+    @staticmethod
+    def clear():
+        JointCache.entries.clear()
+
+    # frame : frame of the face (world space)
+    @staticmethod
+    def key(frame, builder_properties):
+        return (round(frame.longest_length, 6),
+                round(frame.shortest_length, 6),
+                frame.handedness(),
+                TenonMortiseBuilderProps.key(builder_properties))
+
+    @staticmethod
+    def __add(key, entry):
+        entries = JointCache.entries
+        entries[key] = entry
+        entries.move_to_end(key)
+        while len(entries) > JointCache.max_size:
+            entries.popitem(last=False)
+
+    @staticmethod
+    def __get(key):
+        entries = JointCache.entries
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+        return entry
+
+    @staticmethod
+    def __is_border(symbol, grid_size):
+        if symbol[0] != "grid":
+            return False
+        rows, columns = grid_size
+        return symbol[1] in (0, rows - 1) or symbol[2] in (0, columns - 1)
+
+    @staticmethod
+    def __is_corner(symbol, grid_size):
+        if symbol[0] != "grid":
+            return False
+        rows, columns = grid_size
+        return symbol[1] in (0, rows - 1) and symbol[2] in (0, columns - 1)
+
+    # Faces made only of joint vertices. Returns None if they don't replace
+    # exactly the initial face (through mortise, unexpected vertices...).
+    @staticmethod
+    def __joint_faces(vert_symbols, grid_size):
+        faces = set()
+        for vert in vert_symbols:
+            for face in vert.link_faces:
+                if all(face_vert in vert_symbols
+                       for face_vert in face.verts):
+                    faces.add(face)
+        if len(faces) == 0:
+            return None
+
+        # Inner vertices are only used by joint faces
+        for vert, symbol in vert_symbols.items():
+            if not JointCache.__is_border(symbol, grid_size):
+                if any(face not in faces for face in vert.link_faces):
+                    return None
+
+        # Joint outline is the initial face border
+        edge_faces = dict()
+        for face in faces:
+            for edge in face.edges:
+                edge_faces[edge] = edge_faces.get(edge, 0) + 1
+        for edge, face_count in edge_faces.items():
+            if face_count == 1:
+                for vert in edge.verts:
+                    if not JointCache.__is_border(vert_symbols[vert],
+                                                  grid_size):
+                        return None
+        return faces
+
+    @staticmethod
+    def __capture(matrix_world, frame, geometry, corner_verts):
+        record = TenonMortiseBuilder.record(matrix_world, geometry,
+                                            corner_verts)
+        if record is None:
+            return None
+
+        grid = geometry.grid()
+        grid_size = (len(grid), len(grid[0]))
+        vert_symbols = record.vert_symbols
+
+        faces = JointCache.__joint_faces(vert_symbols, grid_size)
+        if faces is None:
+            return None
+
+        coords = dict()
+        for vert, symbol in vert_symbols.items():
+            coords[symbol] = frame.local_coords(
+                tuple(matrix_world * vert.co))
+        face_symbols = []
+        selected_faces = []
+        for face in faces:
+            face_symbols.append(tuple(vert_symbols[vert]
+                                      for vert in face.verts))
+            selected_faces.append(face.select)
+        return JointCacheEntry(coords, face_symbols, selected_faces,
+                               grid_size, frame.handedness())
+
+    # Split the initial face edges where border vertices of the joint are
+    # inserted (positions are set afterwards)
+    @staticmethod
+    def __split_border(face, corner_symbols, entry, symbol_verts):
+        corners = [(vert, corner_symbols[vert]) for vert in face.verts]
+        border_symbols = [symbol for symbol in entry.coords
+                          if JointCache.__is_border(symbol, entry.grid_size)
+                          and symbol not in symbol_verts]
+        for corner_index, (start_vert, start_symbol) in enumerate(corners):
+            end_vert, end_symbol = corners[(corner_index + 1) % len(corners)]
+            if start_symbol[1] == end_symbol[1]:
+                fixed, moving = 1, 2
+            else:
+                fixed, moving = 2, 1
+            low = min(start_symbol[moving], end_symbol[moving])
+            high = max(start_symbol[moving], end_symbol[moving])
+            side_symbols = [symbol for symbol in border_symbols
+                            if symbol[fixed] == start_symbol[fixed] and
+                            low < symbol[moving] < high]
+            side_symbols.sort(
+                key=lambda symbol: abs(symbol[moving] -
+                                       start_symbol[moving]))
+
+            vert = start_vert
+            for symbol in side_symbols:
+                edge = [link_edge for link_edge in vert.link_edges
+                        if link_edge.other_vert(vert) is end_vert][0]
+                new_edge, new_vert = bmesh.utils.edge_split(edge, vert, 0.5)
+                symbol_verts[symbol] = new_vert
+                vert = new_vert
+
+    # Replace face with cached joint faces. Vertices are placed at cached
+    # positions or, for a joint with the same topology, at given points
+    # (world space, by kernel symbol). Returns False if face corners don't
+    # match the joint or if the face frame is mirrored. Stamped joints are profiled as hits of cache_name.
+    @staticmethod
+    def stamp(bm, matrix_world, face, frame, entry, points=None,
+              cache_name="joint cache"):
+        profile = JointProfiler.start_joint(bm, cache_hit=cache_name)
+        stamped = False
+        try:
+            with profile.stage("stamp"):
+                stamped = JointCache.__stamp(bm, matrix_world, face, frame,
+                                             entry, points)
+        finally:
+            JointProfiler.end_joint(profile, stamped)
+        return stamped
+
+    @staticmethod
+    def __stamp(bm, matrix_world, face, frame, entry, points):
+        if frame.handedness() != entry.handedness:
+            return False
+        if points is None:
+            symbol_coords = entry.coords
+        else:
+            symbol_coords = dict(
+                (symbol, frame.local_coords(points[symbol]))
+                for symbol in entry.coords)
+
+        grid_size = entry.grid_size
+        corner_coords = [(symbol, coords)
+                         for symbol, coords in symbol_coords.items()
+                         if JointCache.__is_corner(symbol, grid_size)]
+
+        # Cached corners are moved with "remove wood" option, only compare
+        # their positions on the face
+        symbol_verts = dict()
+        corner_symbols = dict()
+        for vert in face.verts:
+            height, thickness, depth = frame.local_coords(
+                tuple(matrix_world * vert.co))
+            best_symbol = None
+            best_distance = None
+            for symbol, coords in corner_coords:
+                distance = (coords[0] - height) ** 2 + \
+                    (coords[1] - thickness) ** 2
+                if best_distance is None or distance < best_distance:
+                    best_symbol = symbol
+                    best_distance = distance
+            if best_symbol is None or best_symbol in symbol_verts or \
+                    best_distance > \
+                    GeomUtils.POINT_ON_SIDE_ABSOLUTE_ERROR_THRESHOLD ** 2:
+                return False
+            symbol_verts[best_symbol] = vert
+            corner_symbols[vert] = best_symbol
+
+        JointCache.__split_border(face, corner_symbols, entry, symbol_verts)
+
+        matrix_world_inverted = matrix_world.inverted()
+        for symbol, coords in symbol_coords.items():
+            co = matrix_world_inverted * Vector(frame.point(*coords))
+            vert = symbol_verts.get(symbol)
+            if vert is None:
+                symbol_verts[symbol] = bm.verts.new(co)
+            else:
+                vert.co = co
+
+        for vert in face.verts:
+            vert.select = False
+        for face_symbols, selected in zip(entry.faces, entry.selected_faces):
+            new_face = bm.faces.new([symbol_verts[symbol]
+                                     for symbol in face_symbols],
+                                    face)
+            new_face.select = selected
+        bm.faces.remove(face)
+
+        # Only faces around joint vertices have new normals
+        verts = symbol_verts.values()
+        for vert in verts:
+            for link_face in vert.link_faces:
+                link_face.normal_update()
+        for vert in verts:
+            vert.normal_update()
+        return True
+
+    @staticmethod
+    def mesh_counts(bm):
+        return (len(bm.verts), len(bm.edges), len(bm.faces))
+
+    # Create a joint with the builder. Returns the joint to be cached or None
+    # if it can't be stamped on other faces. frame is the frame of the face
+    # before the joint creation.
+    # Subdivision also cuts faces around the joint face when they share a
+    # subdivided edge : a joint is cached only when stamping it gives the
+    # same vertices, edges and faces count as building it. Cleaned up joints
+    # are never cached (dissolved faces don't follow the joint grid).
+    @staticmethod
+    def build(bm, matrix_world, face_to_be_transformed, builder_properties,
+              frame, face_tree=None):
+        corner_verts = list(face_to_be_transformed.face.verts)
+        counts = JointCache.mesh_counts(bm)
+        builder = TenonMortiseBuilder(builder_properties, face_tree)
+        builder.create(bm, matrix_world, face_to_be_transformed)
+        if getattr(builder_properties, "clean_up", False):
+            return None
+        built_delta = tuple(count - initial_count
+                            for count, initial_count in
+                            zip(JointCache.mesh_counts(bm), counts))
+
+        geometry = JointKernel.compute(frame, builder_properties)
+        entry = JointCache.__capture(matrix_world, frame, geometry,
+                                     corner_verts)
+        if entry is None or entry.mesh_delta() != built_delta:
+            return None
+        return entry
+
+    # Create a joint, using the cache when possible. Sizes in
+    # builder_properties must have been computed. Returns the joint stamped
+    # or built (None if it can't be stamped on other faces). face_tree is
+    # the tree of mesh faces shared by through mortises (see FaceTree).
+    @staticmethod
+    def create(bm, matrix_world, face_to_be_transformed, builder_properties,
+               face_tree=None):
+        face = face_to_be_transformed.face
+        frame = JointFrame.from_quad([tuple(matrix_world * vert.co)
+                                      for vert in face.verts])
+        key = JointCache.key(frame, builder_properties)
+
+        entry = JointCache.__get(key)
+        if entry is not None:
+            if JointCache.stamp(bm, matrix_world, face, frame, entry):
+                return entry
+            del JointCache.entries[key]
+
+        entry = JointCache.build(bm,
+                                 matrix_world,
+                                 face_to_be_transformed,
+                                 builder_properties,
+                                 frame,
+                                 face_tree)
+        if entry is not None:
+            JointCache.__add(key, entry)
+        return entry
@@ -0,0 +1,692 @@
+from math import sqrt
+
+from . woodwork_math_utils import MathUtils
+
+# Joint geometry kernel : sizes and positions of tenons, mortises and
+# haunches computed from plain coordinates (sequences of 3 floats).
+# This module doesn't use bpy, bmesh or mathutils so it can be used outside
+# Blender (tests, design sweeps...).
+
+
+# TODO: merge thickness and height into a TenonMortiseBuilderSideProperties or something like that
+class TenonMortiseBuilderThickness:
+    def __init__(self):
+        self.haunch_first_side = TenonMortiseBuilderHaunch()
+        self.haunch_second_side = TenonMortiseBuilderHaunch()
+
+
+class TenonMortiseBuilderHaunch:
+    pass
+
+
+class TenonMortiseBuilderHeight:
+    def __init__(self):
+        self.haunch_first_side = TenonMortiseBuilderHaunch()
+        self.haunch_second_side = TenonMortiseBuilderHaunch()
+
+
+class TenonMortiseBuilderProps:
+    def __init__(self):
+        self.height_properties = TenonMortiseBuilderHeight()
+        self.thickness_properties = TenonMortiseBuilderThickness()
+
+    @staticmethod
+    def __copy_haunch_properties(builder_haunch_properties,
+                                 haunch_properties):
+        builder_haunch_properties.type = haunch_properties.type
+        builder_haunch_properties.depth_value = haunch_properties.depth_value
+        builder_haunch_properties.depth_percentage = \
+            haunch_properties.depth_percentage
+        builder_haunch_properties.angle = haunch_properties.angle
+
+    @staticmethod
+    def __copy_side_properties(builder_side_properties, side_properties):
+        builder_side_properties.type = side_properties.type
+        builder_side_properties.value = side_properties.value
+        builder_side_properties.percentage = side_properties.percentage
+        builder_side_properties.centered = side_properties.centered
+        builder_side_properties.shoulder_type = side_properties.shoulder_type
+        builder_side_properties.shoulder_value = side_properties.shoulder_value
+        builder_side_properties.shoulder_percentage = \
+            side_properties.shoulder_percentage
+        builder_side_properties.reverse_shoulder = \
+            side_properties.reverse_shoulder
+        builder_side_properties.haunched_first_side = \
+            side_properties.haunched_first_side
+        builder_side_properties.haunched_second_side = \
+            side_properties.haunched_second_side
+
+        TenonMortiseBuilderProps.__copy_haunch_properties(
+            builder_side_properties.haunch_first_side,
+            side_properties.haunch_first_side)
+        TenonMortiseBuilderProps.__copy_haunch_properties(
+            builder_side_properties.haunch_second_side,
+            side_properties.haunch_second_side)
+
+    # Copy tenon or mortise properties (as set by the user) so that they can
+    # be changed for one face without modifying scene properties
+    @staticmethod
+    def from_properties(properties):
+        builder_properties = TenonMortiseBuilderProps()
+        builder_properties.depth_value = properties.depth_value
+        builder_properties.remove_wood = getattr(properties, "remove_wood",
+                                                 False)
+        builder_properties.clean_up = getattr(properties, "clean_up", False)
+        TenonMortiseBuilderProps.__copy_side_properties(
+            builder_properties.thickness_properties,
+            properties.thickness_properties)
+        TenonMortiseBuilderProps.__copy_side_properties(
+            builder_properties.height_properties,
+            properties.height_properties)
+        return builder_properties
+
+    @staticmethod
+    def __haunch_key(haunch_properties):
+        return (haunch_properties.type,
+                haunch_properties.depth_value,
+                haunch_properties.depth_percentage,
+                haunch_properties.angle)
+
+    @staticmethod
+    def __side_key(side_properties):
+        return (side_properties.type,
+                side_properties.value,
+                side_properties.percentage,
+                side_properties.centered,
+                side_properties.shoulder_type,
+                side_properties.shoulder_value,
+                side_properties.shoulder_percentage,
+                side_properties.reverse_shoulder,
+                side_properties.haunched_first_side,
+                side_properties.haunched_second_side,
+                TenonMortiseBuilderProps.__haunch_key(
+                    side_properties.haunch_first_side),
+                TenonMortiseBuilderProps.__haunch_key(
+                    side_properties.haunch_second_side))
+
+    # Hashable values of tenon, mortise or builder properties
+    @staticmethod
+    def key(properties):
+        return (properties.depth_value,
+                getattr(properties, "remove_wood", False),
+                getattr(properties, "clean_up", False),
+                TenonMortiseBuilderProps.__side_key(
+                    properties.thickness_properties),
+                TenonMortiseBuilderProps.__side_key(
+                    properties.height_properties))
+
+    # Mortise is a tenon dug in the face
+    def negate_depths(self):
+        self.depth_value = -self.depth_value
+        for side_properties in (self.thickness_properties,
+                                self.height_properties):
+            side_properties.haunch_first_side.depth_value = \
+                -side_properties.haunch_first_side.depth_value
+            side_properties.haunch_second_side.depth_value = \
+                -side_properties.haunch_second_side.depth_value
+
+
+# Compute tenon or mortise sizes for a given face. Properties could be scene
+# properties (tenon or mortise) or builder properties.
+class JointSizing:
+
+    @staticmethod
+    def set_default_thickness(properties, shortest_length):
+        thickness_properties = properties.thickness_properties
+        thickness_properties.value = shortest_length / 3.0
+        thickness_properties.percentage = 1.0 / 3.0
+        thickness_properties.centered = True
+
+    @staticmethod
+    def set_default_height(properties, longest_length):
+        height_properties = properties.height_properties
+        height_properties.value = (longest_length * 2.0) / 3.0
+        height_properties.percentage = 2.0 / 3.0
+        height_properties.centered = True
+
+    @staticmethod
+    def set_default_depth(properties, shortest_length):
+        properties.depth_value = shortest_length
+
+        for side_properties in (properties.height_properties,
+                                properties.thickness_properties):
+            for haunch_properties in (side_properties.haunch_first_side,
+                                      side_properties.haunch_second_side):
+                haunch_properties.depth_value = properties.depth_value / 3.0
+                haunch_properties.depth_percentage = 1.0 / 3.0
+
+    # Used when values have never been initialized (no previous face)
+    @staticmethod
+    def set_missing_default_values(properties,
+                                   shortest_length,
+                                   longest_length):
+        if properties.thickness_properties.value == -1.0:
+            JointSizing.set_default_thickness(properties, shortest_length)
+        if properties.height_properties.value == -1.0:
+            JointSizing.set_default_height(properties, longest_length)
+        if properties.depth_value == -1.0:
+            JointSizing.set_default_depth(properties, shortest_length)
+
+    @staticmethod
+    def __compute_side_values(side_properties, side_length):
+        # If percentage specified, compute length values
+        if side_properties.type == "percentage":
+            side_properties.value = side_length * side_properties.percentage
+
+        # Init values linked to shoulder size
+        if side_properties.centered:
+            side_properties.shoulder_value = ((
+                side_length - side_properties.value) / 2.0)
+            side_properties.shoulder_percentage = \
+                side_properties.shoulder_value / side_length
+
+        # If shoulder percentage specified, compute length values
+        if side_properties.shoulder_type == "percentage":
+            side_properties.shoulder_value = \
+                side_length * side_properties.shoulder_percentage
+            if side_properties.type != "max":
+                if (side_properties.shoulder_value + side_properties.value >
+                        side_length):
+                    side_properties.value = \
+                        side_length - side_properties.shoulder_value
+                    side_properties.percentage = \
+                        side_properties.value / side_length
+
+    @staticmethod
+    def __compute_haunch_values(side_properties, depth_value):
+        if side_properties.haunched_first_side:
+            haunch_properties = side_properties.haunch_first_side
+            if haunch_properties.type == "percentage":
+                haunch_properties.depth_value = \
+                    depth_value * haunch_properties.depth_percentage
+
+        if side_properties.haunched_second_side:
+            haunch_properties = side_properties.haunch_second_side
+            if haunch_properties.type == "percentage":
+                haunch_properties.depth_value = \
+                    depth_value * haunch_properties.depth_percentage
+
+    # Compute values given by percentage and shoulders of centered tenons
+    @staticmethod
+    def compute_values(properties, shortest_length, longest_length):
+        thickness_properties = properties.thickness_properties
+        height_properties = properties.height_properties
+
+        JointSizing.__compute_side_values(thickness_properties,
+                                          shortest_length)
+        JointSizing.__compute_side_values(height_properties,
+                                          longest_length)
+
+        JointSizing.__compute_haunch_values(height_properties,
+                                            properties.depth_value)
+        JointSizing.__compute_haunch_values(thickness_properties,
+                                            properties.depth_value)
+
+    @staticmethod
+    def __side_is_too_long(side_properties, side_length):
+        if side_properties.type != "max":
+            total_length = side_properties.shoulder_value + \
+                side_properties.value
+        elif side_properties.centered:
+            total_length = side_length
+        else:
+            total_length = side_properties.shoulder_value
+
+        return ((not MathUtils.almost_equal_relative_or_absolute(
+                total_length,
+                side_length)) and
+                (total_length > side_length))
+
+    # Check input values, returns an error message or None
+    @staticmethod
+    def check_values(properties,
+                     shortest_length,
+                     longest_length,
+                     joint_name="tenon"):
+        if JointSizing.__side_is_too_long(properties.height_properties,
+                                          longest_length):
+            return "Size of length size shoulder and " + joint_name + \
+                   " height are too long."
+
+        if JointSizing.__side_is_too_long(properties.thickness_properties,
+                                          shortest_length):
+            return "Size of width size shoulder and " + joint_name + \
+                   " thickness are too long."
+        return None
+
+
+# Vector operations on sequences of 3 floats
+class Vec3:
+    @staticmethod
+    def add(vector0, vector1):
+        return (vector0[0] + vector1[0],
+                vector0[1] + vector1[1],
+                vector0[2] + vector1[2])
+
+    @staticmethod
+    def sub(vector0, vector1):
+        return (vector0[0] - vector1[0],
+                vector0[1] - vector1[1],
+                vector0[2] - vector1[2])
+
+    @staticmethod
+    def scale(vector, factor):
+        return (vector[0] * factor,
+                vector[1] * factor,
+                vector[2] * factor)
+
+    @staticmethod
+    def dot(vector0, vector1):
+        return (vector0[0] * vector1[0] +
+                vector0[1] * vector1[1] +
+                vector0[2] * vector1[2])
+
+    @staticmethod
+    def cross(vector0, vector1):
+        return (vector0[1] * vector1[2] - vector0[2] * vector1[1],
+                vector0[2] * vector1[0] - vector0[0] * vector1[2],
+                vector0[0] * vector1[1] - vector0[1] * vector1[0])
+
+    @staticmethod
+    def length(vector):
+        return sqrt(Vec3.dot(vector, vector))
+
+    @staticmethod
+    def normalized(vector):
+        length = Vec3.length(vector)
+        if length == 0.0:
+            return (0.0, 0.0, 0.0)
+        return Vec3.scale(vector, 1.0 / length)
+
+    @staticmethod
+    def negated(vector):
+        return (-vector[0], -vector[1], -vector[2])
+
+    @staticmethod
+    def is_zero(vector, tolerance=MathUtils.ZERO_TOLERANCE):
+        return abs(vector[0]) < tolerance and \
+            abs(vector[1]) < tolerance and \
+            abs(vector[2]) < tolerance
+
+
+# Face where the joint is created. Origin is the corner shared by the
+# longest and the shortest edges, as used by FaceToBeTransformed : first
+# shoulders are on the origin side.
+class JointFrame:
+    def __init__(self,
+                 origin,
+                 longest_axis,
+                 shortest_axis,
+                 normal,
+                 longest_length,
+                 shortest_length):
+        self.origin = origin
+        self.longest_axis = longest_axis
+        self.shortest_axis = shortest_axis
+        self.normal = normal
+        self.longest_length = longest_length
+        self.shortest_length = shortest_length
+
+    # coords are the 4 corners of the face, in face loop order
+    @staticmethod
+    def from_quad(coords):
+        c0, c1, c2, c3 = coords[0], coords[1], coords[2], coords[3]
+        edge0 = Vec3.sub(c0, c1)
+        edge1 = Vec3.sub(c2, c1)
+        length0 = Vec3.length(edge0)
+        length1 = Vec3.length(edge1)
+        normal = Vec3.normalized(Vec3.cross(Vec3.sub(c2, c0),
+                                            Vec3.sub(c3, c1)))
+        if length0 > length1:
+            return JointFrame(tuple(c1),
+                              Vec3.normalized(edge0),
+                              Vec3.normalized(edge1),
+                              normal,
+                              length0,
+                              length1)
+        else:
+            return JointFrame(tuple(c1),
+                              Vec3.normalized(edge1),
+                              Vec3.normalized(edge0),
+                              normal,
+                              length1,
+                              length0)
+
+    # vertex_coords : coordinates of all vertices, quad : 4 vertex indices
+    @staticmethod
+    def from_mesh(vertex_coords, quad):
+        return JointFrame.from_quad([vertex_coords[index] for index in quad])
+
+    # 1 when (longest axis, shortest axis, normal) is right handed, -1 when
+    # it is mirrored. Faces of the same size can give mirrored frames (the
+    # normal follows the vertex order, axes follow the longest edge) : face
+    # vertex orders of a joint are reversed from one to the other.
+    def handedness(self):
+        if Vec3.dot(Vec3.cross(self.longest_axis, self.shortest_axis),
+                    self.normal) < 0.0:
+            return -1
+        return 1
+
+    # Point given by its distances along longest and shortest sides and
+    # along the normal
+    def point(self, height, thickness, depth=0.0):
+        point = Vec3.add(self.origin,
+                         Vec3.scale(self.longest_axis, height))
+        point = Vec3.add(point, Vec3.scale(self.shortest_axis, thickness))
+        return Vec3.add(point, Vec3.scale(self.normal, depth))
+
+    # Distances of a point along longest and shortest sides and along the
+    # normal (inverse of point)
+    def local_coords(self, point):
+        vector = Vec3.sub(point, self.origin)
+        return (Vec3.dot(vector, self.longest_axis),
+                Vec3.dot(vector, self.shortest_axis),
+                Vec3.dot(vector, self.normal))
+
+    def translated_along_normal(self, depth):
+        return JointFrame(Vec3.add(self.origin,
+                                   Vec3.scale(self.normal, depth)),
+                          self.longest_axis,
+                          self.shortest_axis,
+                          self.normal,
+                          self.longest_length,
+                          self.shortest_length)
+
+
+# Tenon position on one side of the face. start and end are distances from
+# the origin side.
+class JointSide:
+    def __init__(self, start, end, length, is_max, centered):
+        self.start = start
+        self.end = end
+        self.length = length
+        self.is_max = is_max
+        self.centered = centered
+
+    # Positions where the face is cut on this side (subdivision)
+    def cuts(self):
+        cuts = [0.0]
+        for cut in (self.start, self.end, self.length):
+            if not MathUtils.almost_equal_relative_or_absolute(cut, cuts[-1]):
+                cuts.append(cut)
+        return cuts
+
+
+# Haunch on a shoulder, base and top are given in face loop order
+class JointHaunch:
+    def __init__(self, base, top):
+        self.base = base
+        self.top = top
+
+
+# Result of the kernel for one joint
+class JointGeometry:
+    def __init__(self, frame, height_side, thickness_side, depth):
+        self.frame = frame
+        self.height_side = height_side
+        self.thickness_side = thickness_side
+        self.depth = depth
+        self.haunches = []
+
+    def __rectangle(self, height_start, height_end,
+                    thickness_start, thickness_end,
+                    depths=(0.0, 0.0, 0.0, 0.0)):
+        frame = self.frame
+        return [frame.point(height_start, thickness_start, depths[0]),
+                frame.point(height_end, thickness_start, depths[1]),
+                frame.point(height_end, thickness_end, depths[2]),
+                frame.point(height_start, thickness_end, depths[3])]
+
+    # Vertices of the subdivided face, one row per height cut
+    def grid(self):
+        frame = self.frame
+        return [[frame.point(height, thickness)
+                 for thickness in self.thickness_side.cuts()]
+                for height in self.height_side.cuts()]
+
+    def tenon_base(self):
+        return self.__rectangle(self.height_side.start,
+                                self.height_side.end,
+                                self.thickness_side.start,
+                                self.thickness_side.end)
+
+    def tenon_top(self):
+        depth = self.depth
+        return self.__rectangle(self.height_side.start,
+                                self.height_side.end,
+                                self.thickness_side.start,
+                                self.thickness_side.end,
+                                (depth, depth, depth, depth))
+
+    # Sloped haunches stay on the face on the border side and reach haunch
+    # depth on the tenon side
+    def add_haunch(self, on_height_side, first_side, haunch_properties):
+        height_side = self.height_side
+        thickness_side = self.thickness_side
+        depth = haunch_properties.depth_value
+        sloped = haunch_properties.angle == "sloped"
+
+        if on_height_side:
+            thickness_start = thickness_side.start
+            thickness_end = thickness_side.end
+            if first_side:
+                height_start = 0.0
+                height_end = height_side.start
+                depths = (0.0, depth, depth, 0.0)
+            else:
+                height_start = height_side.end
+                height_end = height_side.length
+                depths = (depth, 0.0, 0.0, depth)
+        else:
+            height_start = height_side.start
+            height_end = height_side.end
+            if first_side:
+                thickness_start = 0.0
+                thickness_end = thickness_side.start
+                depths = (0.0, 0.0, depth, depth)
+            else:
+                thickness_start = thickness_side.end
+                thickness_end = thickness_side.length
+                depths = (depth, depth, 0.0, 0.0)
+        if not sloped:
+            depths = (depth, depth, depth, depth)
+
+        base = self.__rectangle(height_start, height_end,
+                                thickness_start, thickness_end)
+        top = self.__rectangle(height_start, height_end,
+                               thickness_start, thickness_end,
+                               depths)
+        haunch = JointHaunch(base, top)
+        self.haunches.append(haunch)
+        return haunch
+
+    # All vertices positions : subdivided face, tenon top and haunches tops
+    def verts(self):
+        return [point for symbol, point in self.labeled_points()]
+
+    # Same as verts with a label for each point. Labels don't depend on
+    # values so they are used to move vertices when only values change.
+    def labeled_points(self):
+        points = []
+        for height_index, row in enumerate(self.grid()):
+            for thickness_index, point in enumerate(row):
+                points.append((("grid", height_index, thickness_index), point))
+        for corner, point in enumerate(self.tenon_top()):
+            points.append((("top", corner), point))
+        for haunch_index, haunch in enumerate(self.haunches):
+            for corner, point in enumerate(haunch.top):
+                points.append((("haunch", haunch_index, corner), point))
+        return points
+
+
+class JointKernel:
+
+    # Returns (is_max, size) for one side. A shouldered tenon which reaches
+    # the face border is handled as a max one.
+    @staticmethod
+    def side_size(side_properties, side_length):
+        is_max = side_properties.type == "max"
+        centered = side_properties.centered
+        if not centered and not is_max:
+            shoulder_and_tenon_length = side_properties.shoulder_value + \
+                side_properties.value
+            if MathUtils.almost_equal_relative_or_absolute(
+                    shoulder_and_tenon_length,
+                    side_length):
+                is_max = True
+        if is_max and not centered:
+            size = side_length - side_properties.shoulder_value
+        else:
+            size = side_properties.value
+        return is_max, size
+
+    @staticmethod
+    def side(side_properties, side_length):
+        is_max, size = JointKernel.side_size(side_properties, side_length)
+        centered = side_properties.centered
+        if centered:
+            if is_max:
+                start = 0.0
+                end = side_length
+            else:
+                start = (side_length - size) / 2.0
+                end = start + size
+        elif side_properties.reverse_shoulder:
+            end = side_length - side_properties.shoulder_value
+            start = end - size
+        else:
+            start = side_properties.shoulder_value
+            end = start + size
+        return JointSide(start, end, side_length, is_max, centered)
+
+    # Values must have been computed (see JointSizing.compute_values)
+    @staticmethod
+    def compute(frame, builder_properties):
+        depth = builder_properties.depth_value
+        if depth > 0.0 and getattr(builder_properties, "remove_wood", False):
+            frame = frame.translated_along_normal(-depth)
+
+        height_properties = builder_properties.height_properties
+        thickness_properties = builder_properties.thickness_properties
+        geometry = JointGeometry(
+            frame,
+            JointKernel.side(height_properties, frame.longest_length),
+            JointKernel.side(thickness_properties, frame.shortest_length),
+            depth)
+
+        for on_height_side, side_properties in (
+                (True, height_properties),
+                (False, thickness_properties)):
+            if side_properties.centered:
+                continue
+            if side_properties.haunched_first_side:
+                geometry.add_haunch(on_height_side, True,
+                                    side_properties.haunch_first_side)
+            if side_properties.haunched_second_side:
+                geometry.add_haunch(on_height_side, False,
+                                    side_properties.haunch_second_side)
+        return geometry
+
+    # Joints with the same signature have the same topology : only vertex
+    # positions differ. Frames with the same handedness give joint faces in
+    # the same vertex order.
+    @staticmethod
+    def topology_signature(builder_properties, geometry):
+        sides = []
+        for side, side_properties in (
+                (geometry.height_side, builder_properties.height_properties),
+                (geometry.thickness_side,
+                 builder_properties.thickness_properties)):
+            haunch_angles = []
+            if side_properties.haunched_first_side:
+                haunch_angles.append(side_properties.haunch_first_side.angle)
+            else:
+                haunch_angles.append(None)
+            if side_properties.haunched_second_side:
+                haunch_angles.append(side_properties.haunch_second_side.angle)
+            else:
+                haunch_angles.append(None)
+            sides.append((side.centered,
+                          side.is_max,
+                          side_properties.reverse_shoulder,
+                          len(side.cuts()),
+                          tuple(haunch_angles)))
+
+        # Points at the same place are merged in the mesh
+        symbols_by_position = dict()
+        for symbol, point in geometry.labeled_points():
+            position = tuple(round(co, 6) for co in point)
+            symbols_by_position.setdefault(position, []).append(symbol)
+        merged_points = frozenset(tuple(symbols)
+                                  for symbols in symbols_by_position.values()
+                                  if len(symbols) > 1)
+
+        depth = builder_properties.depth_value
+        remove_wood = depth > 0.0 and getattr(builder_properties,
+                                              "remove_wood",
+                                              False)
+        return (depth < 0.0, remove_wood, tuple(sides), merged_points,
+                geometry.frame.handedness())
+
+    # Evaluate several joint variants : properties are copied, defaults and
+    # percentages are computed for the face. Yields (properties, geometry)
+    # or (properties, error message).
+    @staticmethod
+    def sweep(frame, properties_list, is_mortise=False):
+        joint_name = "mortise" if is_mortise else "tenon"
+        for properties in properties_list:
+            builder_properties = TenonMortiseBuilderProps.from_properties(
+                properties)
+            JointSizing.set_missing_default_values(builder_properties,
+                                                   frame.shortest_length,
+                                                   frame.longest_length)
+            JointSizing.compute_values(builder_properties,
+                                       frame.shortest_length,
+                                       frame.longest_length)
+            message = JointSizing.check_values(builder_properties,
+                                               frame.shortest_length,
+                                               frame.longest_length,
+                                               joint_name)
+            if message is not None:
+                yield properties, message
+                continue
+            if is_mortise:
+                builder_properties.negate_depths()
+            yield properties, JointKernel.compute(frame, builder_properties)
+
+    # Used to resize tenon sides : resize_value is a world length
+    @staticmethod
+    def scale_factor(world_vector, resize_value):
+        if Vec3.is_zero(world_vector):
+            return resize_value
+        return resize_value / Vec3.length(world_vector)
+
+    # Translation of tenon vertices on the side opposite to the shoulder
+    @staticmethod
+    def tenon_translation_vector(world_vector,
+                                 world_direction,
+                                 scale_factor,
+                                 same_direction,
+                                 shoulder_beyond_tenon):
+        if Vec3.is_zero(world_vector):
+            return Vec3.scale(Vec3.normalized(world_direction), scale_factor)
+
+        if shoulder_beyond_tenon:
+            # shoulder size is larger than actual tenon end
+            if same_direction:
+                world_vector = Vec3.negated(world_vector)
+            inverted_vector = Vec3.negated(world_vector)
+            final_vector = Vec3.scale(inverted_vector, scale_factor)
+            return Vec3.add(final_vector, inverted_vector)
+
+        if not same_direction:
+            world_vector = Vec3.negated(world_vector)
+        final_vector = Vec3.scale(world_vector, scale_factor)
+        return Vec3.sub(final_vector, world_vector)
+
+    # Translation of shoulder vertices to get shoulder_value length
+    @staticmethod
+    def shoulder_translation_vector(world_edge_vector, shoulder_value):
+        scale_factor = shoulder_value / Vec3.length(world_edge_vector)
+        final_vector = Vec3.scale(world_edge_vector, scale_factor)
+        return Vec3.sub(final_vector, world_edge_vector)
@@ -0,0 +1,278 @@
+import bpy
+import bmesh
+from . joint_batch import JointBatch
+from . face_index import MeshFaceIndexCache
+
+
+# Faces where joints will be created are marked with a face layer, so that
+# joints can be applied later on several workpieces at once
+class JointMarks:
+    LAYER_NAME = "woodwork_joint"
+
+    NONE = 0
+    TENON = 1
+    MORTISE = 2
+
+    @staticmethod
+    def layer(bm, create=False):
+        layer = bm.faces.layers.int.get(JointMarks.LAYER_NAME)
+        if layer is None and create:
+            layer = bm.faces.layers.int.new(JointMarks.LAYER_NAME)
+        return layer
+
+    # Check marks without loading the mesh in a bmesh
+    @staticmethod
+    def has_marked_faces(mesh):
+        mesh_layer = mesh.polygon_layers_int.get(JointMarks.LAYER_NAME)
+        if mesh_layer is None:
+            return False
+        values = [0] * len(mesh.polygons)
+        mesh_layer.data.foreach_get("value", values)
+        return any(values)
+
+    # Mark faces given by their indices without loading the mesh in a bmesh
+    @staticmethod
+    def mark_mesh_faces(mesh, face_indices, mark):
+        mesh_layer = mesh.polygon_layers_int.get(JointMarks.LAYER_NAME)
+        if mesh_layer is None:
+            mesh_layer = mesh.polygon_layers_int.new(JointMarks.LAYER_NAME)
+        values = [0] * len(mesh.polygons)
+        mesh_layer.data.foreach_get("value", values)
+        for face_index in face_indices:
+            values[face_index] = mark
+        mesh_layer.data.foreach_set("value", values)
+
+    @staticmethod
+    def marked_faces(bm, mark):
+        layer = JointMarks.layer(bm)
+        if layer is None:
+            return []
+        return [face for face in bm.faces if face[layer] == mark]
+
+    # Remove marks so that joints are not created twice. Faces created from
+    # marked faces (subdivision) copy their layer value : all marks are
+    # removed except on kept_faces.
+    @staticmethod
+    def clear_marks(bm, kept_faces):
+        layer = JointMarks.layer(bm)
+        for face in bm.faces:
+            if face[layer] != JointMarks.NONE and face not in kept_faces:
+                face[layer] = JointMarks.NONE
+
+
+class MarkJointFacesOperator(bpy.types.Operator):
+    bl_description = "Mark selected faces to create joints on them later"
+    bl_idname = "mesh.woodwork_mark_joint_faces"
+    bl_label = "Mark joint faces"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    joint = bpy.props.EnumProperty(
+        items=[('tenon',
+                "Tenon",
+                "Create tenons on selected faces"),
+               ('mortise',
+                "Mortise",
+                "Create mortises on selected faces"),
+               ('none',
+                "None",
+                "Remove joint marks on selected faces")],
+        name="Joint",
+        default='tenon')
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.active_object
+        return ob and ob.type == 'MESH' and context.mode == 'EDIT_MESH'
+
+    def execute(self, context):
+        mesh = context.object.data
+        bm = bmesh.from_edit_mesh(mesh)
+
+        if self.joint == 'tenon':
+            mark = JointMarks.TENON
+        elif self.joint == 'mortise':
+            mark = JointMarks.MORTISE
+        else:
+            mark = JointMarks.NONE
+
+        layer = JointMarks.layer(bm, create=True)
+        marked_count = 0
+        for face in bm.faces:
+            if face.select:
+                face[layer] = mark
+                marked_count += 1
+
+        if marked_count == 0:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "You must select faces to mark.")
+            return {'CANCELLED'}
+
+        bmesh.update_edit_mesh(mesh)
+        return {'FINISHED'}
+
+
+# Mark all end grain faces where a joint can be created, on all selected
+# workpieces (faces are found with the mesh face index, in object mode)
+class MarkEndFacesOperator(bpy.types.Operator):
+    bl_description = "Mark end grain faces of selected workpieces to " \
+                     "create joints on them later"
+    bl_idname = "object.woodwork_mark_end_faces"
+    bl_label = "Mark end faces"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    joint = bpy.props.EnumProperty(
+        items=[('tenon',
+                "Tenon",
+                "Create tenons on end faces"),
+               ('mortise',
+                "Mortise",
+                "Create mortises on end faces")],
+        name="Joint",
+        default='tenon')
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    def execute(self, context):
+        if self.joint == 'mortise':
+            mark = JointMarks.MORTISE
+        else:
+            mark = JointMarks.TENON
+
+        meshes = set()
+        marked_count = 0
+        for ob in context.selected_objects:
+            if ob.type != 'MESH' or not ob.woodwork.is_workpiece or \
+                    ob.data in meshes:
+                continue
+            meshes.add(ob.data)
+            face_index = MeshFaceIndexCache.get(ob.data, ob.matrix_world)
+            end_faces = face_index.end_faces()
+            if len(end_faces) > 0:
+                JointMarks.mark_mesh_faces(ob.data, end_faces, mark)
+                marked_count += len(end_faces)
+
+        if marked_count == 0:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "No end face found on selected workpieces.")
+            return {'CANCELLED'}
+
+        self.report({'INFO'}, str(marked_count) + " face(s) marked.")
+        return {'FINISHED'}
+
+
+# Create joints on marked faces of all selected workpieces. Each mesh is
+# loaded and written back once, meshes without marked faces are skipped.
+class ApplyJointsOperator(bpy.types.Operator):
+    bl_description = "Create tenons and mortises on marked faces of " \
+                     "selected workpieces"
+    bl_idname = "object.woodwork_apply_joints"
+    bl_label = "Apply joints"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    @staticmethod
+    def __workpieces(context):
+        workpieces = []
+        meshes = set()
+        for ob in context.selected_objects:
+            if ob.type != 'MESH' or not ob.woodwork.is_workpiece:
+                continue
+            # Linked copies share their mesh : joints are created once
+            if ob.data in meshes:
+                continue
+            meshes.add(ob.data)
+            workpieces.append(ob)
+        return workpieces
+
+    # Returns created joints count and faces where the joint can't be
+    # created. Faces removed by joints of the previous pass are skipped.
+    def __apply_joints(self, batch, bm, matrix_world, ob, faces):
+        valid_faces = [face for face in faces if face.is_valid]
+        removed_count = len(faces) - len(valid_faces)
+        if removed_count > 0:
+            self.report({'WARNING'},
+                        ob.name + ": " + str(removed_count) +
+                        " marked face(s) removed by previous joints.")
+        if len(valid_faces) == 0:
+            return 0, []
+        results = batch.create(bm, matrix_world, valid_faces)
+
+        failed_faces = []
+        for face, result in zip(valid_faces, results):
+            if not result.success:
+                failed_faces.append(face)
+                self.report({'WARNING'},
+                            ob.name + ", face " + str(result.face_index) +
+                            ": " + result.message)
+        return len(results) - len(failed_faces), failed_faces
+
+    def execute(self, context):
+        woodwork = context.scene.woodwork
+        tenon_batch = JointBatch(woodwork.tenon_properties, is_mortise=False)
+        mortise_batch = JointBatch(woodwork.mortise_properties,
+                                   is_mortise=True)
+
+        workpieces = ApplyJointsOperator.__workpieces(context)
+        if len(workpieces) == 0:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "You must select workpieces.")
+            return {'CANCELLED'}
+
+        created_count = 0
+        failed_count = 0
+        skipped_count = 0
+        for ob in workpieces:
+            mesh = ob.data
+            if not JointMarks.has_marked_faces(mesh):
+                skipped_count += 1
+                continue
+
+            bm = bmesh.new()
+            bm.from_mesh(mesh)
+            # Both passes use faces marked before any joint creation :
+            # fragments of marked faces are not used
+            joint_faces = ((tenon_batch,
+                            JointMarks.marked_faces(bm, JointMarks.TENON)),
+                           (mortise_batch,
+                            JointMarks.marked_faces(bm, JointMarks.MORTISE)))
+            kept_faces = set()
+            for batch, faces in joint_faces:
+                created, failed_faces = self.__apply_joints(batch,
+                                                            bm,
+                                                            ob.matrix_world,
+                                                            ob,
+                                                            faces)
+                created_count += created
+                failed_count += len(faces) - created
+                kept_faces.update(failed_faces)
+            # Failed faces keep their mark to be applied again
+            JointMarks.clear_marks(bm, kept_faces)
+            bm.to_mesh(mesh)
+            bm.free()
+            mesh.update()
+
+        self.report({'INFO'},
+                    str(created_count) + " joint(s) created, " +
+                    str(failed_count) + " failed, " +
+                    str(skipped_count) + " workpiece(s) unchanged.")
+        return {'FINISHED'}
+
+
+def register():
+    bpy.utils.register_class(MarkJointFacesOperator)
+    bpy.utils.register_class(MarkEndFacesOperator)
+    bpy.utils.register_class(ApplyJointsOperator)
+
+
+def unregister():
+    bpy.utils.unregister_class(ApplyJointsOperator)
+    bpy.utils.unregister_class(MarkEndFacesOperator)
+    bpy.utils.unregister_class(MarkJointFacesOperator)
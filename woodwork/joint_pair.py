@@ -0,0 +1,270 @@
+import copy
+
+import bpy
+import bmesh
+from bpy.props import BoolProperty
+
+from . joint_batch import JointBatch
+from . joint_cache import JointCache
+from . joint_kernel import (JointFrame,
+                            TenonMortiseBuilderProps,
+                            Vec3)
+from . joint_plan import JointPlan, JointPlanRequest, JointPlanner
+from . tenon_mortise_builder import FaceToBeTransformed
+from . woodwork_math_utils import MathUtils
+
+
+# Tenon and matching mortise created from one plan : tenon sizes are computed
+# once on the tenon face and given as values to the mortise, so that both
+# parts fit.
+class JointPair:
+
+    @staticmethod
+    def face_coords(face, matrix_world):
+        return [tuple(matrix_world * vert.co) for vert in face.verts]
+
+    @staticmethod
+    def __same_size(frame, other_frame):
+        return MathUtils.almost_equal_relative_or_absolute(
+            frame.longest_length, other_frame.longest_length) and \
+            MathUtils.almost_equal_relative_or_absolute(
+                frame.shortest_length, other_frame.shortest_length)
+
+    # Tenon side seen from the mortise face when the face axis goes the
+    # other way : shoulder is on the other end and haunches are swapped
+    @staticmethod
+    def __reverse_side(side_properties):
+        if side_properties.centered:
+            return
+        side_properties.reverse_shoulder = not side_properties.reverse_shoulder
+        side_properties.haunched_first_side, \
+            side_properties.haunched_second_side = \
+            side_properties.haunched_second_side, \
+            side_properties.haunched_first_side
+        side_properties.haunch_first_side, \
+            side_properties.haunch_second_side = \
+            side_properties.haunch_second_side, \
+            side_properties.haunch_first_side
+
+    # Tenon frame mirrored across the contact plane gives mortise sides :
+    # in-plane axes are kept, so each tenon side is matched with the mortise
+    # face axis parallel to it. Face frame origins depend on vertex order,
+    # sides going the other way on the mortise face are reversed.
+    @staticmethod
+    def __mirror_sides(properties, tenon_frame, mortise_frame):
+        if abs(Vec3.dot(tenon_frame.longest_axis,
+                        mortise_frame.longest_axis)) < \
+                abs(Vec3.dot(tenon_frame.longest_axis,
+                             mortise_frame.shortest_axis)):
+            # Square faces : longest sides are not the same on both faces
+            properties.height_properties, properties.thickness_properties = \
+                properties.thickness_properties, properties.height_properties
+            tenon_axes = (tenon_frame.shortest_axis, tenon_frame.longest_axis)
+        else:
+            tenon_axes = (tenon_frame.longest_axis, tenon_frame.shortest_axis)
+
+        for side_properties, tenon_axis, mortise_axis in (
+                (properties.height_properties,
+                 tenon_axes[0],
+                 mortise_frame.longest_axis),
+                (properties.thickness_properties,
+                 tenon_axes[1],
+                 mortise_frame.shortest_axis)):
+            if Vec3.dot(tenon_axis, mortise_axis) < 0.0:
+                JointPair.__reverse_side(side_properties)
+
+    # Tenon position on the mortise face : (start, end) of the tenon along
+    # mortise face sides (height then thickness). Tenon vertices are
+    # projected on the mortise face, so sides are matched by world direction.
+    # Returns an error message when the tenon is not inside the face.
+    @staticmethod
+    def __tenon_spans(tenon_plan, tenon_frame, mortise_frame):
+        if not MathUtils.almost_equal_relative_or_absolute(
+                abs(Vec3.dot(tenon_frame.normal, mortise_frame.normal)),
+                1.0):
+            return None, "Tenon and mortise faces are not parallel."
+
+        local_points = [mortise_frame.local_coords(point)
+                        for symbol, point in tenon_plan.points.items()
+                        if symbol[0] == "top"]
+        spans = []
+        for axis, side_length in ((0, mortise_frame.longest_length),
+                                  (1, mortise_frame.shortest_length)):
+            start = min(point[axis] for point in local_points)
+            end = max(point[axis] for point in local_points)
+            if MathUtils.almost_zero(start):
+                start = 0.0
+            if MathUtils.almost_equal_relative_or_absolute(end, side_length):
+                end = side_length
+            if start < 0.0 or end > side_length:
+                return None, "Tenon is not on the mortise face."
+            spans.append((start, end))
+        return spans, None
+
+    # Mortise properties from tenon plan. On a face of the same size, the
+    # mortise is the tenon dug in the face, placed with the mirrored tenon
+    # frame. Otherwise the mortise is placed where the tenon is on the
+    # mortise face (without haunches : they are placed relative to the
+    # tenon face sides). Returns (properties, error message).
+    @staticmethod
+    def mortise_properties(tenon_plan, tenon_frame, mortise_frame):
+        properties = copy.deepcopy(tenon_plan.properties)
+        properties.remove_wood = False
+        if JointPair.__same_size(tenon_frame, mortise_frame):
+            JointPair.__mirror_sides(properties, tenon_frame, mortise_frame)
+            return properties, None
+
+        spans, message = JointPair.__tenon_spans(tenon_plan, tenon_frame,
+                                                 mortise_frame)
+        if message is not None:
+            return None, message
+
+        for side_properties, (start, end) in zip(
+                (properties.height_properties,
+                 properties.thickness_properties),
+                spans):
+            side_properties.type = "value"
+            side_properties.value = end - start
+            side_properties.centered = False
+            side_properties.shoulder_type = "value"
+            side_properties.shoulder_value = start
+            side_properties.reverse_shoulder = False
+            side_properties.haunched_first_side = False
+            side_properties.haunched_second_side = False
+        return properties, None
+
+    # Plans of both joints. Returns (tenon plan, mortise plan), a plan message
+    # is set when the joint can't be created.
+    @staticmethod
+    def compute_plans(tenon_coords, mortise_coords, tenon_properties):
+        tenon_plan = JointPlanner.compute_plan(
+            JointPlanRequest(0,
+                             tenon_coords,
+                             TenonMortiseBuilderProps.from_properties(
+                                 tenon_properties)))
+        if tenon_plan.message is not None:
+            return tenon_plan, None
+
+        mortise_properties, message = JointPair.mortise_properties(
+            tenon_plan,
+            JointFrame.from_quad(tenon_coords),
+            JointFrame.from_quad(mortise_coords))
+        if message is not None:
+            return tenon_plan, JointPlan(1, mortise_coords, message)
+        mortise_plan = JointPlanner.compute_plan(
+            JointPlanRequest(1,
+                             mortise_coords,
+                             mortise_properties,
+                             is_mortise=True))
+        return tenon_plan, mortise_plan
+
+    @staticmethod
+    def create_joint(bm, matrix_world, face, plan):
+        face_to_be_transformed = FaceToBeTransformed(face)
+        face_to_be_transformed.extract_features(matrix_world)
+        JointCache.create(bm,
+                          matrix_world,
+                          face_to_be_transformed,
+                          plan.properties)
+
+
+# Create a tenon on the active face of the active workpiece and the matching
+# mortise on the active face of the other selected workpiece
+class JointPairOperator(bpy.types.Operator):
+    bl_description = "Create a tenon and its matching mortise on active " \
+                     "faces of two workpieces"
+    bl_idname = "object.woodwork_joint_pair"
+    bl_label = "Tenon and mortise"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    mortise_on_active = BoolProperty(
+        name="Mortise on active workpiece",
+        description="Create the mortise on the active workpiece and the "
+                    "tenon on the other one",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.active_object
+        return context.mode == 'OBJECT' and ob is not None and \
+            ob.type == 'MESH'
+
+    @staticmethod
+    def __active_face(bm, mesh):
+        active_index = mesh.polygons.active
+        if active_index < 0 or active_index >= len(bm.faces):
+            return None
+        bm.faces.ensure_lookup_table()
+        return bm.faces[active_index]
+
+    def __workpieces(self, context):
+        active = context.active_object
+        others = [ob for ob in context.selected_objects
+                  if ob != active and ob.type == 'MESH']
+        if len(others) != 1:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "You must select two workpieces.")
+            return None
+        if others[0].data == active.data:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "Workpieces must not share their mesh.")
+            return None
+        if self.mortise_on_active:
+            return others[0], active
+        return active, others[0]
+
+    def execute(self, context):
+        workpieces = self.__workpieces(context)
+        if workpieces is None:
+            return {'CANCELLED'}
+
+        # Both meshes are loaded and written back once
+        joints = []
+        for ob, joint_name in zip(workpieces, ("tenon", "mortise")):
+            bm = bmesh.new()
+            bm.from_mesh(ob.data)
+            face = JointPairOperator.__active_face(bm, ob.data)
+            if face is None:
+                message = "No active face."
+            else:
+                message = JointBatch.check_face(face)
+            if message is not None:
+                self.report({'ERROR_INVALID_INPUT'},
+                            ob.name + " (" + joint_name + "): " + message)
+                bm.free()
+                for joint_bm, joint_face, joint_ob in joints:
+                    joint_bm.free()
+                return {'CANCELLED'}
+            joints.append((bm, face, ob))
+
+        (tenon_bm, tenon_face, tenon_ob), \
+            (mortise_bm, mortise_face, mortise_ob) = joints
+        tenon_plan, mortise_plan = JointPair.compute_plans(
+            JointPair.face_coords(tenon_face, tenon_ob.matrix_world),
+            JointPair.face_coords(mortise_face, mortise_ob.matrix_world),
+            context.scene.woodwork.tenon_properties)
+        for plan, ob in ((tenon_plan, tenon_ob), (mortise_plan, mortise_ob)):
+            if plan is not None and plan.message is not None:
+                self.report({'ERROR_INVALID_INPUT'},
+                            ob.name + ": " + plan.message)
+                tenon_bm.free()
+                mortise_bm.free()
+                return {'CANCELLED'}
+
+        for bm, face, ob, plan in (
+                (tenon_bm, tenon_face, tenon_ob, tenon_plan),
+                (mortise_bm, mortise_face, mortise_ob, mortise_plan)):
+            JointPair.create_joint(bm, ob.matrix_world, face, plan)
+            bm.to_mesh(ob.data)
+            bm.free()
+            ob.data.update()
+        return {'FINISHED'}
+
+
+def register():
+    bpy.utils.register_class(JointPairOperator)
+
+
+def unregister():
+    bpy.utils.unregister_class(JointPairOperator)
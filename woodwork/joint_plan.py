@@ -0,0 +1,74 @@
+from . joint_kernel import (JointFrame,
+                            JointKernel,
+                            JointSizing)
+
+# Joint plans : sizes checks and positions of all joint vertices computed
+# from plain data, before the mesh is changed. Like joint_kernel, this module
+# doesn't use bpy, bmesh or mathutils.
+
+
+# Face where a joint will be created. coords are the 4 face corners (world
+# space, face loop order), properties are builder properties (not scene
+# properties which can be changed by the user).
+class JointPlanRequest:
+    def __init__(self, face_index, coords, properties, is_mortise=False):
+        self.face_index = face_index
+        self.coords = coords
+        self.properties = properties
+        self.is_mortise = is_mortise
+
+
+# Result of planning. When message is not None, joint can't be created.
+# points are the joint vertices positions (world space) given by kernel
+# symbols, signature identifies joint topology.
+class JointPlan:
+    def __init__(self, face_index, coords, message=None, properties=None,
+                 points=None, signature=None):
+        self.face_index = face_index
+        self.coords = coords
+        self.message = message
+        self.properties = properties
+        self.points = points
+        self.signature = signature
+
+
+class JointPlanner:
+
+    @staticmethod
+    def compute_plan(request):
+        if request.is_mortise:
+            joint_name = "mortise"
+        else:
+            joint_name = "tenon"
+        frame = JointFrame.from_quad(request.coords)
+        shortest_length = frame.shortest_length
+        longest_length = frame.longest_length
+
+        properties = request.properties
+        JointSizing.set_missing_default_values(properties,
+                                               shortest_length,
+                                               longest_length)
+        JointSizing.compute_values(properties,
+                                   shortest_length,
+                                   longest_length)
+        message = JointSizing.check_values(properties,
+                                           shortest_length,
+                                           longest_length,
+                                           joint_name)
+        if message is not None:
+            return JointPlan(request.face_index, request.coords, message)
+
+        if request.is_mortise:
+            properties.negate_depths()
+        geometry = JointKernel.compute(frame, properties)
+        return JointPlan(request.face_index,
+                         request.coords,
+                         properties=properties,
+                         points=dict(geometry.labeled_points()),
+                         signature=JointKernel.topology_signature(properties,
+                                                                  geometry))
+
+    # Returns plans in requests order
+    @staticmethod
+    def compute_plans(requests):
+        return [JointPlanner.compute_plan(request) for request in requests]
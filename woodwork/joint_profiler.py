@@ -0,0 +1,190 @@
+import time
+
+
+# Timing and mesh counts of one builder stage
+class JointStage:
+    def __init__(self, name):
+        self.name = name
+        self.time = 0.0
+        self.bmesh_ops = 0
+        self.counts_before = None
+        self.counts_after = None
+
+    def __repr__(self):
+        return "<{}({}), {}, time={:.6f}, bmesh_ops={}>".format(
+            self.__class__.__name__, hex(id(self)), self.name, self.time,
+            self.bmesh_ops)
+
+    def to_dict(self):
+        return {"name": self.name,
+                "time": self.time,
+                "bmesh_ops": self.bmesh_ops,
+                "counts_before": self.counts_before,
+                "counts_after": self.counts_after}
+
+
+# Builders call bmesh operators through a counter instead of bmesh.ops :
+# calls are counted only while a joint is profiled
+class BMeshOpsCounter:
+    def __init__(self, ops):
+        self.ops = ops
+        self.count = 0
+        self.counting = False
+
+    def __getattr__(self, name):
+        op = getattr(self.ops, name)
+        if not self.counting:
+            return op
+
+        def counted_op(*args, **kwargs):
+            self.count += 1
+            return op(*args, **kwargs)
+        return counted_op
+
+
+class JointStageTimer:
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.stage = JointStage(name)
+        self.start = 0.0
+        self.ops_start = 0
+
+    def __enter__(self):
+        profile = self.profile
+        self.stage.counts_before = profile.mesh_counts()
+        self.ops_start = profile.ops_count()
+        self.start = time.perf_counter()
+        return self.stage
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        profile = self.profile
+        stage = self.stage
+        stage.time = time.perf_counter() - self.start
+        stage.bmesh_ops = profile.ops_count() - self.ops_start
+        stage.counts_after = profile.mesh_counts()
+        profile.stages.append(stage)
+        return False
+
+
+# Stages of one joint creation. cache_hit is the name of the cache the joint
+# was stamped from (None when the joint is built).
+class JointProfile:
+    def __init__(self, bm, ops_counter, cache_hit=None):
+        self.bm = bm
+        self.ops_counter = ops_counter
+        self.cache_hit = cache_hit
+        self.stages = []
+
+    def ops_count(self):
+        if self.ops_counter is None:
+            return 0
+        return self.ops_counter.count
+
+    def mesh_counts(self):
+        bm = self.bm
+        return {"verts": len(bm.verts),
+                "edges": len(bm.edges),
+                "faces": len(bm.faces)}
+
+    def stage(self, name):
+        return JointStageTimer(self, name)
+
+    def total_time(self):
+        return sum(stage.time for stage in self.stages)
+
+    def to_dict(self):
+        return {"total_time": self.total_time(),
+                "cache_hit": self.cache_hit,
+                "stages": [stage.to_dict() for stage in self.stages]}
+
+    def report_lines(self):
+        lines = []
+        if self.cache_hit is not None:
+            lines.append("stamped from " + self.cache_hit)
+        for stage in self.stages:
+            counts_after = stage.counts_after
+            lines.append("%s: %.2f ms, %d bmesh ops, %d faces" % (
+                stage.name, stage.time * 1000.0, stage.bmesh_ops,
+                counts_after["faces"]))
+        lines.append("total: %.2f ms" % (self.total_time() * 1000.0))
+        return lines
+
+
+class NullStageTimer:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+# Used when profiling is off
+class NullJointProfile:
+    stage_timer = NullStageTimer()
+
+    def stage(self, name):
+        return NullJointProfile.stage_timer
+
+
+# Opt-in instrumentation of joint builders. Either use it as a context
+# manager :
+#   with JointProfiler() as profiler:
+#       builder.create(...)
+#   profiler.profiles
+# or register a callback called with each JointProfile.
+class JointProfiler:
+    null_profile = NullJointProfile()
+    active_profilers = []
+    callbacks = []
+
+    def __init__(self):
+        self.profiles = []
+
+    def __enter__(self):
+        JointProfiler.active_profilers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        JointProfiler.active_profilers.remove(self)
+        return False
+
+    @staticmethod
+    def register_callback(callback):
+        if callback not in JointProfiler.callbacks:
+            JointProfiler.callbacks.append(callback)
+
+    @staticmethod
+    def unregister_callback(callback):
+        if callback in JointProfiler.callbacks:
+            JointProfiler.callbacks.remove(callback)
+
+    @staticmethod
+    def is_enabled():
+        return len(JointProfiler.active_profilers) > 0 or \
+            len(JointProfiler.callbacks) > 0
+
+    # Called by builders when a joint creation starts. Calls made through
+    # ops_counter are counted until end_joint is called. cache_hit is the
+    # name of the cache when the joint is stamped instead of built.
+    @staticmethod
+    def start_joint(bm, ops_counter=None, cache_hit=None):
+        if not JointProfiler.is_enabled():
+            return JointProfiler.null_profile
+        if ops_counter is not None:
+            ops_counter.counting = True
+        return JointProfile(bm, ops_counter, cache_hit)
+
+    # Profiles of joints which were not created (failed stamps...) are not
+    # given to profilers when keep is False
+    @staticmethod
+    def end_joint(profile, keep=True):
+        if profile is JointProfiler.null_profile:
+            return
+        if profile.ops_counter is not None:
+            profile.ops_counter.counting = False
+        if not keep:
+            return
+        for profiler in JointProfiler.active_profilers:
+            profiler.profiles.append(profile)
+        for callback in JointProfiler.callbacks:
+            callback(profile)
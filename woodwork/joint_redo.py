@@ -0,0 +1,91 @@
+from . tenon_mortise_builder import TenonMortiseBuilder
+from . joint_cache import JointCache
+from . joint_kernel import JointFrame, JointKernel
+
+
+# Last joint created : the face it was created on and the joint faces, in
+# face local space
+class JointRedoEntry:
+    def __init__(self, name, face_key, signature, template):
+        self.name = name
+        self.face_key = face_key
+        self.signature = signature
+        self.template = template
+
+
+# Redo panel fast path : when the operator is run again (Blender undoes it
+# first) on the same face and only sizes have changed, the joint created last
+# time is stamped on the face with the new vertex positions instead of
+# building the whole joint again.
+class JointRedoCache:
+    last_joint = None
+
+    @staticmethod
+    def clear():
+        JointRedoCache.last_joint = None
+
+    # Face, its neighbourhood (vertices of the faces around it) and mesh
+    # counts : the whole mesh is not visited
+    @staticmethod
+    def face_key(bm, matrix_world, face):
+        neighbour_verts = set()
+        for vert in face.verts:
+            for link_face in vert.link_faces:
+                neighbour_verts.update(link_face.verts)
+        return (tuple(tuple(row) for row in matrix_world),
+                len(bm.verts),
+                len(bm.edges),
+                len(bm.faces),
+                tuple(tuple(vert.co) for vert in face.verts),
+                tuple(sorted(tuple(vert.co) for vert in neighbour_verts)))
+
+    # name identifies operator and object. Sizes in builder_properties must
+    # have been computed. Returns the number of faces removed by clean-up :
+    # cleaned up joints are always built, the joint and redo caches are not
+    # used.
+    @staticmethod
+    def create(name,
+               bm,
+               matrix_world,
+               face_to_be_transformed,
+               builder_properties):
+        if getattr(builder_properties, "clean_up", False):
+            JointRedoCache.clear()
+            builder = TenonMortiseBuilder(builder_properties)
+            return builder.create(bm, matrix_world, face_to_be_transformed)
+
+        face = face_to_be_transformed.face
+        face_key = JointRedoCache.face_key(bm, matrix_world, face)
+
+        frame = JointFrame.from_quad([tuple(matrix_world * vert.co)
+                                      for vert in face.verts])
+        geometry = JointKernel.compute(frame, builder_properties)
+        signature = JointKernel.topology_signature(builder_properties,
+                                                   geometry)
+
+        last_joint = JointRedoCache.last_joint
+        if (last_joint is not None and
+                last_joint.name == name and
+                last_joint.face_key == face_key and
+                last_joint.signature == signature and
+                JointCache.stamp(bm,
+                                 matrix_world,
+                                 face,
+                                 frame,
+                                 last_joint.template,
+                                 dict(geometry.labeled_points()),
+                                 "redo cache")):
+            return 0
+
+        template = JointCache.create(bm,
+                                     matrix_world,
+                                     face_to_be_transformed,
+                                     builder_properties)
+
+        JointRedoCache.clear()
+        if template is not None:
+            JointRedoCache.last_joint = JointRedoEntry(name,
+                                                       face_key,
+                                                       signature,
+                                                       template)
+        return 0
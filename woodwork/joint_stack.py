@@ -0,0 +1,383 @@
+import hashlib
+from array import array
+
+import bpy
+from bpy.props import (
+    EnumProperty,
+    IntProperty,
+    PointerProperty,
+    StringProperty,
+    BoolProperty
+)
+from mathutils import Vector
+
+from . joint_batch import JointBatch
+from . joint_kernel import TenonMortiseBuilderProps
+from . tenon_mortise_builder import GeometryRetriever
+from . tenon_properties import TenonPropertyGroup
+from . mortise_properties import MortisePropertyGroup
+from . piece import WorkpieceOperator
+
+
+# Sides of the workpiece box, in WorkpieceOperator.piece_sides order
+SIDES = [('bottom', "Bottom", "Bottom face (-Z)"),
+         ('top', "Top", "Top face (+Z)"),
+         ('front', "Front", "Front face (-Y)"),
+         ('right', "Right end", "Right end (+X)"),
+         ('back', "Back", "Back face (+Y)"),
+         ('left', "Left end", "Left end (-X)")]
+SIDE_NAMES = dict((side[0], side[1].lower()) for side in SIDES)
+
+
+# Joint kept on a workpiece : the box side where it is created and a copy of
+# tenon or mortise properties
+class JointSpec(bpy.types.PropertyGroup):
+    joint = EnumProperty(
+        items=[('tenon',
+                "Tenon",
+                "Create a tenon"),
+               ('mortise',
+                "Mortise",
+                "Create a mortise")],
+        name="Joint",
+        default='tenon')
+
+    side = EnumProperty(
+        items=SIDES,
+        name="Side",
+        default='right')
+
+    tenon_properties = PointerProperty(type=TenonPropertyGroup)
+    mortise_properties = PointerProperty(type=MortisePropertyGroup)
+
+    # Key of the spec when the joint was last built
+    built_key = StringProperty(options={'HIDDEN'})
+
+
+# Joints stacks : workpieces are built again from their box and their joint
+# specs, so that joint properties can be changed after creation. Only
+# objects whose box or specs changed since last build are regenerated, and
+# only their changed joints are built again.
+class JointStack:
+
+    @staticmethod
+    def side_index(spec):
+        return [side[0] for side in SIDES].index(spec.side)
+
+    @staticmethod
+    def joint_properties(spec):
+        if spec.joint == 'mortise':
+            return spec.mortise_properties
+        return spec.tenon_properties
+
+    # Copy tenon or mortise properties (scene properties to spec)
+    @staticmethod
+    def copy_properties(target, source):
+        for prop in source.bl_rna.properties:
+            identifier = prop.identifier
+            if identifier in ("rna_type", "name"):
+                continue
+            if prop.type == 'POINTER':
+                JointStack.copy_properties(getattr(target, identifier),
+                                           getattr(source, identifier))
+            elif not prop.is_readonly:
+                setattr(target, identifier, getattr(source, identifier))
+
+    @staticmethod
+    def spec_key(spec):
+        return repr((spec.joint,
+                     spec.side,
+                     TenonMortiseBuilderProps.key(
+                         JointStack.joint_properties(spec))))
+
+    # Joint sizes are computed in world space : object scale is part of the
+    # key
+    @staticmethod
+    def object_key(ob):
+        woodwork = ob.woodwork
+        base_size = woodwork.base_size
+        values = ((base_size.length, base_size.width, base_size.thickness),
+                  tuple(woodwork.base_offset),
+                  tuple(round(value, 6)
+                        for value in ob.matrix_world.to_scale()),
+                  [JointStack.spec_key(spec)
+                   for spec in woodwork.joint_stack])
+        return hashlib.md5(repr(values).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def __content_key(coords, vertex_indices):
+        content = hashlib.md5(array('f', coords).tobytes())
+        content.update(array('i', vertex_indices).tobytes())
+        return content.hexdigest()
+
+    # Vertices and faces of the mesh : joints created directly in the mesh
+    # (or any edit) change the key
+    @staticmethod
+    def mesh_key(mesh):
+        coords = [0.0] * (len(mesh.vertices) * 3)
+        mesh.vertices.foreach_get("co", coords)
+        vertex_indices = [0] * len(mesh.loops)
+        mesh.loops.foreach_get("vertex_index", vertex_indices)
+        return JointStack.__content_key(coords, vertex_indices)
+
+    # Mesh key of the workpiece box, as created by the workpiece operator
+    @staticmethod
+    def base_mesh_key(ob):
+        woodwork = ob.woodwork
+        coords = WorkpieceOperator.piece_coords(woodwork.base_size,
+                                                Vector(woodwork.base_offset))
+        vertex_indices = [index for side in WorkpieceOperator.piece_sides
+                          for index in side]
+        return JointStack.__content_key(coords, vertex_indices)
+
+    # Mesh is the one built last time (or the workpiece box before the first
+    # build) : regenerating it doesn't lose any change
+    @staticmethod
+    def mesh_matches(ob):
+        built_key = ob.woodwork.stack_mesh_key
+        if built_key == "":
+            built_key = JointStack.base_mesh_key(ob)
+        return JointStack.mesh_key(ob.data) == built_key
+
+    @staticmethod
+    def has_base(ob):
+        base_size = ob.woodwork.base_size
+        return ob.type == 'MESH' and ob.woodwork.is_workpiece and \
+            base_size.length > 0.0 and base_size.width > 0.0 and \
+            base_size.thickness > 0.0
+
+    @staticmethod
+    def is_dirty(ob):
+        return ob.woodwork.stack_key != JointStack.object_key(ob)
+
+    @staticmethod
+    def dirty_specs(ob):
+        return [spec for spec in ob.woodwork.joint_stack
+                if spec.built_key != JointStack.spec_key(spec)]
+
+    # Build workpiece box and all its joints in object mesh. Joints are
+    # created through the joint cache : joints whose spec and face didn't
+    # change are stamped, only changed joints are built again. The mesh is
+    # kept when it has been edited since last build, unless overwrite is
+    # True. Returns (regenerated, messages) where messages are errors of
+    # joints which can't be created.
+    @staticmethod
+    def regenerate(ob, overwrite=False):
+        if not overwrite and not JointStack.mesh_matches(ob):
+            return False, ["mesh has been edited since its joints were "
+                           "built, it is kept (use Overwrite to build it "
+                           "again)."]
+
+        woodwork = ob.woodwork
+        matrix_world = ob.matrix_world
+        bm = WorkpieceOperator.create_piece(woodwork.base_size,
+                                            Vector(woodwork.base_offset))
+        specs = list(woodwork.joint_stack)
+
+        bm.faces.ensure_lookup_table()
+        retriever = GeometryRetriever("stack_retriever")
+        retriever.create(bm)
+        # References start at 1 : 0 is the layer default value
+        retriever.save_faces([bm.faces[JointStack.side_index(spec)]
+                              for spec in specs], 1)
+
+        messages = []
+        for reference, spec in enumerate(specs, 1):
+            spec_name = spec.joint + " on " + SIDE_NAMES[spec.side]
+            face = retriever.retrieve_face(reference)
+            if face is None:
+                messages.append(spec_name + ": side has been removed by a "
+                                            "previous joint.")
+            else:
+                batch = JointBatch(JointStack.joint_properties(spec),
+                                   is_mortise=spec.joint == 'mortise')
+                result = batch.create(bm, matrix_world, [face])[0]
+                if not result.success:
+                    messages.append(spec_name + ": " + result.message)
+            spec.built_key = JointStack.spec_key(spec)
+        retriever.destroy()
+
+        mesh = ob.data
+        bm.to_mesh(mesh)
+        bm.free()
+        mesh.update()
+        woodwork.stack_key = JointStack.object_key(ob)
+        woodwork.stack_mesh_key = JointStack.mesh_key(mesh)
+        return True, messages
+
+    # Regenerate dirty objects (or all objects when force is True). Linked
+    # copies are regenerated once. Returns regenerated objects count and
+    # error messages.
+    @staticmethod
+    def regenerate_objects(objects, force=False, overwrite=False):
+        meshes = set()
+        regenerated_count = 0
+        messages = []
+        for ob in objects:
+            if not JointStack.has_base(ob) or ob.data in meshes:
+                continue
+            meshes.add(ob.data)
+            if not force and not JointStack.is_dirty(ob):
+                continue
+            regenerated, object_messages = JointStack.regenerate(ob,
+                                                                 overwrite)
+            for message in object_messages:
+                messages.append(ob.name + ", " + message)
+            if regenerated:
+                regenerated_count += 1
+        return regenerated_count, messages
+
+
+class AddStackJointOperator(bpy.types.Operator):
+    bl_description = "Add a joint to the workpiece joints stack, using " \
+                     "current tenon or mortise properties"
+    bl_idname = "object.woodwork_add_stack_joint"
+    bl_label = "Add joint"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    joint = EnumProperty(
+        items=[('tenon',
+                "Tenon",
+                "Create a tenon"),
+               ('mortise',
+                "Mortise",
+                "Create a mortise")],
+        name="Joint",
+        default='tenon')
+
+    side = EnumProperty(
+        items=SIDES,
+        name="Side",
+        default='right')
+
+    overwrite = BoolProperty(
+        name="Overwrite",
+        description="Build workpieces again even if their mesh has been "
+                    "edited since their joints were built (changes are lost)",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.active_object
+        return context.mode == 'OBJECT' and ob is not None and \
+            JointStack.has_base(ob)
+
+    def execute(self, context):
+        ob = context.active_object
+        joint_stack = ob.woodwork.joint_stack
+
+        # One joint per side : an existing joint on this side is replaced
+        for index, spec in enumerate(joint_stack):
+            if spec.side == self.side:
+                self.report({'WARNING'},
+                            spec.joint.capitalize() + " on " +
+                            SIDE_NAMES[spec.side] + " replaced.")
+                joint_stack.remove(index)
+                break
+
+        spec = joint_stack.add()
+        spec.joint = self.joint
+        spec.side = self.side
+        woodwork = context.scene.woodwork
+        if self.joint == 'mortise':
+            JointStack.copy_properties(spec.mortise_properties,
+                                       woodwork.mortise_properties)
+        else:
+            JointStack.copy_properties(spec.tenon_properties,
+                                       woodwork.tenon_properties)
+
+        regenerated, messages = JointStack.regenerate(ob, self.overwrite)
+        for message in messages:
+            self.report({'WARNING'}, message)
+        return {'FINISHED'}
+
+
+class RemoveStackJointOperator(bpy.types.Operator):
+    bl_description = "Remove a joint from the workpiece joints stack"
+    bl_idname = "object.woodwork_remove_stack_joint"
+    bl_label = "Remove joint"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index = IntProperty(min=0)
+
+    overwrite = BoolProperty(
+        name="Overwrite",
+        description="Build workpieces again even if their mesh has been "
+                    "edited since their joints were built (changes are lost)",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        ob = context.active_object
+        return context.mode == 'OBJECT' and ob is not None and \
+            JointStack.has_base(ob)
+
+    def execute(self, context):
+        ob = context.active_object
+        joint_stack = ob.woodwork.joint_stack
+        if self.index >= len(joint_stack):
+            return {'CANCELLED'}
+        joint_stack.remove(self.index)
+
+        regenerated, messages = JointStack.regenerate(ob, self.overwrite)
+        for message in messages:
+            self.report({'WARNING'}, message)
+        return {'FINISHED'}
+
+
+class RegenerateJointsOperator(bpy.types.Operator):
+    bl_description = "Build again workpieces whose joints have changed"
+    bl_idname = "object.woodwork_regenerate_joints"
+    bl_label = "Regenerate joints"
+    bl_category = 'Woodwork'
+    bl_options = {'REGISTER', 'UNDO'}
+
+    selected_only = BoolProperty(
+        name="Selected only",
+        description="Regenerate only selected workpieces",
+        default=False)
+
+    force = BoolProperty(
+        name="Force",
+        description="Regenerate workpieces even if they didn't change",
+        default=False)
+
+    overwrite = BoolProperty(
+        name="Overwrite",
+        description="Build workpieces again even if their mesh has been "
+                    "edited since their joints were built (changes are lost)",
+        default=False)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT'
+
+    def execute(self, context):
+        if self.selected_only:
+            objects = context.selected_objects
+        else:
+            objects = context.scene.objects
+
+        regenerated_count, messages = JointStack.regenerate_objects(
+            objects, self.force, self.overwrite)
+        for message in messages:
+            self.report({'WARNING'}, message)
+        self.report({'INFO'},
+                    str(regenerated_count) + " workpiece(s) regenerated.")
+        return {'FINISHED'}
+
+
+def register():
+    bpy.utils.register_class(JointSpec)
+    bpy.utils.register_class(AddStackJointOperator)
+    bpy.utils.register_class(RemoveStackJointOperator)
+    bpy.utils.register_class(RegenerateJointsOperator)
+
+
+def unregister():
+    bpy.utils.unregister_class(RegenerateJointsOperator)
+    bpy.utils.unregister_class(RemoveStackJointOperator)
+    bpy.utils.unregister_class(AddStackJointOperator)
+    bpy.utils.unregister_class(JointSpec)
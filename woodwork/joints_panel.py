@@ -1,4 +1,5 @@
 import bpy
+from . joint_stack import JointStack
 
 
 class JointsPanel(bpy.types.Panel):
@@ -16,6 +17,52 @@ class JointsPanel(bpy.types.Panel):
         row = box.row()
         row.operator("mesh.woodwork_tenon")
         row.operator("mesh.woodwork_mortise")
+        box.operator("object.woodwork_joint_pair")
+
+        box = layout.box()
+        box.label(text="Mark selected faces")
+        row = box.row(align=True)
+        row.operator("mesh.woodwork_mark_joint_faces",
+                     text="Tenon").joint = 'tenon'
+        row.operator("mesh.woodwork_mark_joint_faces",
+                     text="Mortise").joint = 'mortise'
+        row.operator("mesh.woodwork_mark_joint_faces",
+                     text="None").joint = 'none'
+        row = box.row(align=True)
+        row.operator("object.woodwork_mark_end_faces",
+                     text="Tenons on ends").joint = 'tenon'
+        row.operator("object.woodwork_mark_end_faces",
+                     text="Mortises on ends").joint = 'mortise'
+        box.operator("object.woodwork_apply_joints")
+
+        ob = context.active_object
+        if ob is not None and JointStack.has_base(ob):
+            JointsPanel.__draw_joint_stack(layout, ob)
+        layout.operator("object.woodwork_regenerate_joints")
+
+    @staticmethod
+    def __draw_joint_stack(layout, ob):
+        box = layout.box()
+        box.label(text="Joints stack")
+        dirty_specs = JointStack.dirty_specs(ob)
+        for index, spec in enumerate(ob.woodwork.joint_stack):
+            properties = JointStack.joint_properties(spec)
+            row = box.row(align=True)
+            if spec in dirty_specs:
+                row.label(icon='ERROR')
+            row.prop(spec, "joint", text="")
+            row.prop(spec, "side", text="")
+            row.operator("object.woodwork_remove_stack_joint",
+                         text="", icon='X').index = index
+            column = box.column(align=True)
+            column.prop(properties.thickness_properties, "value")
+            column.prop(properties.height_properties, "value")
+            column.prop(properties, "depth_value")
+        row = box.row(align=True)
+        row.operator("object.woodwork_add_stack_joint",
+                     text="Add tenon").joint = 'tenon'
+        row.operator("object.woodwork_add_stack_joint",
+                     text="Add mortise").joint = 'mortise'
 
 
 def register():
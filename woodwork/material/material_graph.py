@@ -0,0 +1,302 @@
+import json
+
+import bpy
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Material node graphs saved as plain data (JSON or msgpack) : nodes with
+# their settings, input values, color ramps, curves and locations, links and
+# node groups used by the graph. Loading a saved graph only creates nodes,
+# node positions are not computed again.
+
+FORMAT_VERSION = 1
+
+
+# Properties written for every node, other node properties are settings
+NODE_BASE_PROPERTIES = frozenset(
+    prop.identifier for prop in bpy.types.Node.bl_rna.properties)
+
+SETTING_TYPES = frozenset(('BOOLEAN', 'INT', 'FLOAT', 'STRING', 'ENUM'))
+
+
+class MaterialGraphWriter:
+
+    @staticmethod
+    def __value(value):
+        if hasattr(value, "__len__") and not isinstance(value, str):
+            return [MaterialGraphWriter.__value(item) for item in value]
+        return value
+
+    @staticmethod
+    def __settings(node):
+        settings = dict()
+        for prop in node.bl_rna.properties:
+            identifier = prop.identifier
+            if identifier in NODE_BASE_PROPERTIES or prop.is_readonly or \
+                    prop.type not in SETTING_TYPES:
+                continue
+            settings[identifier] = MaterialGraphWriter.__value(
+                getattr(node, identifier))
+        return settings
+
+    @staticmethod
+    def __socket_values(sockets):
+        values = []
+        for socket in sockets:
+            if hasattr(socket, "default_value"):
+                values.append(MaterialGraphWriter.__value(
+                    socket.default_value))
+            else:
+                values.append(None)
+        return values
+
+    @staticmethod
+    def __color_ramp(color_ramp):
+        return {"color_mode": color_ramp.color_mode,
+                "interpolation": color_ramp.interpolation,
+                "elements": [[element.position,
+                              MaterialGraphWriter.__value(element.color)]
+                             for element in color_ramp.elements]}
+
+    @staticmethod
+    def __mapping(mapping):
+        return [[MaterialGraphWriter.__value(point.location)
+                 for point in curve.points]
+                for curve in mapping.curves]
+
+    @staticmethod
+    def __node(node):
+        node_data = {"name": node.name,
+                     "type": node.bl_idname,
+                     "label": node.label,
+                     "location": MaterialGraphWriter.__value(node.location),
+                     "width": node.width,
+                     "hide": node.hide,
+                     "parent": node.parent.name if node.parent else None,
+                     "settings": MaterialGraphWriter.__settings(node),
+                     "inputs": MaterialGraphWriter.__socket_values(
+                         node.inputs)}
+        if getattr(node, "color_ramp", None) is not None:
+            node_data["color_ramp"] = MaterialGraphWriter.__color_ramp(
+                node.color_ramp)
+        if getattr(node, "mapping", None) is not None:
+            node_data["mapping"] = MaterialGraphWriter.__mapping(node.mapping)
+        if getattr(node, "node_tree", None) is not None:
+            node_data["node_tree"] = node.node_tree.name
+        return node_data
+
+    @staticmethod
+    def __interface(sockets):
+        return [{"name": socket.name,
+                 "type": socket.bl_socket_idname,
+                 "default_value": MaterialGraphWriter.__value(
+                     socket.default_value)
+                 if hasattr(socket, "default_value") else None}
+                for socket in sockets]
+
+    @staticmethod
+    def __socket_index(sockets, socket):
+        for index, node_socket in enumerate(sockets):
+            if node_socket == socket:
+                return index
+        return None
+
+    @staticmethod
+    def tree(node_tree):
+        links = []
+        for link in node_tree.links:
+            links.append([link.from_node.name,
+                          MaterialGraphWriter.__socket_index(
+                              link.from_node.outputs, link.from_socket),
+                          link.to_node.name,
+                          MaterialGraphWriter.__socket_index(
+                              link.to_node.inputs, link.to_socket)])
+        tree_data = {"nodes": [MaterialGraphWriter.__node(node)
+                               for node in node_tree.nodes],
+                     "links": links}
+        # Group interface (material node trees have no inputs or outputs)
+        if len(node_tree.inputs) + len(node_tree.outputs) > 0:
+            tree_data["inputs"] = MaterialGraphWriter.__interface(
+                node_tree.inputs)
+            tree_data["outputs"] = MaterialGraphWriter.__interface(
+                node_tree.outputs)
+        return tree_data
+
+    # Node groups used by node_tree and by its groups, dependencies first
+    @staticmethod
+    def __groups(node_tree, groups):
+        for node in node_tree.nodes:
+            group_tree = getattr(node, "node_tree", None)
+            if group_tree is not None and group_tree.name not in groups:
+                MaterialGraphWriter.__groups(group_tree, groups)
+                groups[group_tree.name] = MaterialGraphWriter.tree(group_tree)
+
+    @staticmethod
+    def material(material):
+        groups = dict()
+        MaterialGraphWriter.__groups(material.node_tree, groups)
+        return {"version": FORMAT_VERSION,
+                "name": material.name,
+                "groups": [[name, group_data]
+                           for name, group_data in groups.items()],
+                "tree": MaterialGraphWriter.tree(material.node_tree)}
+
+
+class MaterialGraphLoader:
+
+    @staticmethod
+    def __set_value(target, identifier, value):
+        try:
+            setattr(target, identifier, value)
+        except (AttributeError, TypeError, ValueError):
+            # Setting not available in this Blender version
+            pass
+
+    # Setting an element position sorts the ramp again : elements are not
+    # changed by index. The ramp keeps at least one element, which gets the
+    # first saved values, the other ones are added.
+    @staticmethod
+    def __load_color_ramp(color_ramp, ramp_data):
+        color_ramp.color_mode = ramp_data["color_mode"]
+        color_ramp.interpolation = ramp_data["interpolation"]
+        elements = color_ramp.elements
+        elements_data = ramp_data["elements"]
+        if len(elements_data) == 0:
+            return
+        while len(elements) > 1:
+            elements.remove(elements[-1])
+        position, color = elements_data[0]
+        elements[0].position = position
+        elements[0].color = color
+        for position, color in elements_data[1:]:
+            element = elements.new(position)
+            element.color = color
+
+    # Curves keep at least two points : they get the first and last saved
+    # points, the other ones are added
+    @staticmethod
+    def __load_mapping(mapping, curves_data):
+        for curve, points_data in zip(mapping.curves, curves_data):
+            if len(points_data) < 2:
+                continue
+            points = curve.points
+            while len(points) > 2:
+                points.remove(points[1])
+            points[0].location = points_data[0]
+            points[1].location = points_data[-1]
+            for location in points_data[1:-1]:
+                points.new(location[0], location[1])
+        mapping.update()
+
+    @staticmethod
+    def __load_interface(sockets, sockets_data):
+        for socket_data in sockets_data:
+            socket = sockets.new(socket_data["type"], socket_data["name"])
+            if socket_data["default_value"] is not None:
+                socket.default_value = socket_data["default_value"]
+
+    @staticmethod
+    def tree(node_tree, tree_data, groups):
+        if "inputs" in tree_data:
+            MaterialGraphLoader.__load_interface(node_tree.inputs,
+                                                 tree_data["inputs"])
+            MaterialGraphLoader.__load_interface(node_tree.outputs,
+                                                 tree_data["outputs"])
+
+        nodes = node_tree.nodes
+        created = dict()
+        for node_data in tree_data["nodes"]:
+            node = nodes.new(node_data["type"])
+            node.name = node_data["name"]
+            node.label = node_data["label"]
+            node.width = node_data["width"]
+            node.hide = node_data["hide"]
+            if "node_tree" in node_data:
+                node.node_tree = groups[node_data["node_tree"]]
+            for identifier, value in node_data["settings"].items():
+                MaterialGraphLoader.__set_value(node, identifier, value)
+            if "color_ramp" in node_data:
+                MaterialGraphLoader.__load_color_ramp(node.color_ramp,
+                                                      node_data["color_ramp"])
+            if "mapping" in node_data:
+                MaterialGraphLoader.__load_mapping(node.mapping,
+                                                   node_data["mapping"])
+            for socket, value in zip(node.inputs, node_data["inputs"]):
+                if value is not None:
+                    MaterialGraphLoader.__set_value(socket, "default_value",
+                                                    value)
+            created[node_data["name"]] = node
+
+        # Locations are relative to parent frames : parents are set first
+        for node_data in tree_data["nodes"]:
+            if node_data["parent"] is not None:
+                created[node_data["name"]].parent = \
+                    created[node_data["parent"]]
+        for node_data in tree_data["nodes"]:
+            created[node_data["name"]].location = node_data["location"]
+
+        links = node_tree.links
+        for from_name, from_index, to_name, to_index in tree_data["links"]:
+            links.new(created[from_name].outputs[from_index],
+                      created[to_name].inputs[to_index])
+
+    # Returns the created material. Node groups already in the file (same
+    # name) are reused. Raises ValueError for data written with another
+    # format version.
+    @staticmethod
+    def material(material_data):
+        version = material_data.get("version")
+        if version != FORMAT_VERSION:
+            raise ValueError("Unsupported material graph version: " +
+                             str(version) + " (expected " +
+                             str(FORMAT_VERSION) + ").")
+
+        groups = dict()
+        for name, group_data in material_data["groups"]:
+            group = bpy.data.node_groups.get(name)
+            if group is None:
+                group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+                MaterialGraphLoader.tree(group, group_data, groups)
+            groups[name] = group
+
+        material = bpy.data.materials.new(material_data["name"])
+        material.use_nodes = True
+        material.node_tree.nodes.clear()
+        MaterialGraphLoader.tree(material.node_tree,
+                                 material_data["tree"],
+                                 groups)
+        return material
+
+
+# Files ending with .msgpack are written with msgpack when it is available,
+# other files are JSON
+class MaterialGraphFile:
+
+    @staticmethod
+    def __use_msgpack(filepath):
+        return filepath.endswith(".msgpack") and msgpack is not None
+
+    @staticmethod
+    def save(material, filepath):
+        material_data = MaterialGraphWriter.material(material)
+        if MaterialGraphFile.__use_msgpack(filepath):
+            with open(filepath, "wb") as output_file:
+                output_file.write(msgpack.packb(material_data,
+                                                use_bin_type=True))
+        else:
+            with open(filepath, "w") as output_file:
+                json.dump(material_data, output_file, separators=(",", ":"))
+
+    @staticmethod
+    def load(filepath):
+        if MaterialGraphFile.__use_msgpack(filepath):
+            with open(filepath, "rb") as input_file:
+                material_data = msgpack.unpackb(input_file.read(),
+                                                raw=False)
+        else:
+            with open(filepath, "r") as input_file:
+                material_data = json.load(input_file)
+        return MaterialGraphLoader.material(material_data)
@@ -1,6 +1,8 @@
 from math import modf
 from math import pi
 from abc import ABCMeta, abstractmethod
+import hashlib
+import inspect
 
 import bpy
 import mathutils
@@ -264,6 +266,10 @@ class Node:
 
     def __init__(self, bpy_node: bpy.types.Node):
         self.node = bpy_node
+        self.parent_frame = None
+        # Computed once, until node display changes
+        self.computed_height = None
+        self.computed_hidden_radius = None
 
     @staticmethod
     def create(tree: Nodes,
@@ -312,6 +318,7 @@ class Node:
     def set_parent(self, parent: Node) -> Node:
         if type(parent) is Frame:
             parent.set_child(self)
+            self.parent_frame = parent
         self.node.parent = parent.as_bpy_type()
         return self
 
@@ -320,6 +327,8 @@ class Node:
 
     def set_location(self, location: Vector) -> Node:
         self.node.location = location
+        if self.parent_frame is not None:
+            self.parent_frame.invalidate_bounds()
         return self
 
     def get_location(self) -> Vector:
@@ -336,12 +345,21 @@ class Node:
 
     def hide(self) -> Node:
         self.node.hide = True
+        self.invalidate_size()
         return self
 
     def show(self) -> Node:
         self.node.hide = False
+        self.invalidate_size()
         return self
 
+    # Called when sockets or display change
+    def invalidate_size(self):
+        self.computed_height = None
+        self.computed_hidden_radius = None
+        if self.parent_frame is not None:
+            self.parent_frame.invalidate_bounds()
+
     def is_hidden(self) -> bool:
         return self.node.hide
 
@@ -358,6 +376,8 @@ class Node:
         return Socket(self.node.outputs[index])
 
     def __compute_hidden_radius(self) -> float:
+        if self.computed_hidden_radius is not None:
+            return self.computed_hidden_radius
         node_bpy = self.as_bpy_type()
         widget_unit = 20
         hidden_rad = 0.75 * widget_unit
@@ -373,6 +393,7 @@ class Node:
         tot = max(totout, totin)
         if tot > 4:
             hidden_rad += 5.0 * (tot - 4.0)
+        self.computed_hidden_radius = hidden_rad
         return hidden_rad
 
     def compute_location(self) -> Vector:
@@ -403,6 +424,8 @@ class Node:
     # When widget is not drawn yet, dimensions are not available
     # Values taken from node_update_basis in node_draw.c
     def compute_height(self) -> float:
+        if self.computed_height is not None:
+            return self.computed_height
         widget_unit = 20
         node_dy = widget_unit
         node_dys = widget_unit // 2
@@ -450,6 +473,7 @@ class Node:
             if node_bpy.inputs or not has_options_or_preview:
                 dy -= node_dys / 2
             height = node_bpy.location.y - dy
+        self.computed_height = height
         return height
 
     def set_position(self, position: Position) -> Node:
@@ -507,6 +531,8 @@ class Frame(Node):
 class Frame(Node):
     def __init__(self, bpy_node: bpy.types.Node):
         self.children = []
+        # Children bounds, computed again only when a child changes
+        self.bounding_box = None
         Node.__init__(self, bpy_node)
 
     @staticmethod
@@ -519,8 +545,17 @@ class Frame(Node):
 
     def set_child(self, child: Node):
         self.children.append(child)
+        self.invalidate_bounds()
+
+    def invalidate_bounds(self):
+        if self.bounding_box is not None:
+            self.bounding_box = None
+            if self.parent_frame is not None:
+                self.parent_frame.invalidate_bounds()
 
     def __get_bounding_box(self):
+        if self.bounding_box is not None:
+            return self.bounding_box
         lowests = Vector((99999999999999999.0, 99999999999999999.0))
         highests = Vector((-99999999999999999.0, -99999999999999999.0))
         if len(self.children) > 0:
@@ -553,9 +588,10 @@ class Frame(Node):
             highests.y += margin
         else:
             lowests = Vector((0.0, 0.0))
-            highests = Vector(self.get_width(),
-                              self.get_height())
-        return lowests, highests
+            highests = Vector((self.get_width(),
+                               self.get_height()))
+        self.bounding_box = lowests, highests
+        return self.bounding_box
 
     def set_location(self, location: Vector) -> Frame:
         if len(self.children) > 0:
@@ -627,6 +663,7 @@ class GroupNode(Node):
 
     def set_node_tree(self, nodes: Nodes) -> GroupNode:
         self.node.node_tree = nodes.as_bpy_type()
+        self.invalidate_size()
         return self
 
 class GroupInput(Node):
@@ -1336,9 +1373,10 @@ class OutputMaterial(Node):
 
 
 class WoodPatternBartek:
+    group_name = "Wood Grain Base Bartek"
 
     def build(self) -> Group:
-        wood_pattern = Group.create("Wood Grain Base Bartek")
+        wood_pattern = Group.create(self.group_name)
         wood_pattern.\
             set_vector_input("Texture coordinates",
                              mathutils.Vector((0.0, 0.0, 0.0))).\
@@ -1644,8 +1682,10 @@ class WoodPatternBartek:
 
 # support fibres are "dark background"
 class SupportFibresCekhunen:
+    group_name = "Support fibres"
+
     def build(self) -> Group:
-        support_fibres = Group.create("Support fibres")
+        support_fibres = Group.create(self.group_name)
 
         support_fibres.\
             set_vector_input("Texture coordinates",
@@ -1725,9 +1765,10 @@ class SupportFibresCekhunen:
 
 
 class AxialParenchimaCekhunen:
+    group_name = "Axial Parenchima"
 
     def build(self) -> Group:
-        axial_parenchima = Group.create("Axial Parenchima")
+        axial_parenchima = Group.create(self.group_name)
         axial_parenchima.\
             set_vector_input("Texture coordinates",
                              mathutils.Vector((0.0, 0.0, 0.0))).\
@@ -1789,9 +1830,10 @@ class AxialParenchimaCekhunen:
 
 
 class LongGrainVesselsCekhunen:
+    group_name = "Long grain vessels"
 
     def build(self) -> Group:
-        vessels = Group.create("Long grain vessels")
+        vessels = Group.create(self.group_name)
         vessels.\
             set_vector_input("Texture coordinates",
                              mathutils.Vector((0.0, 0.0, 0.0))).\
@@ -1847,9 +1889,11 @@ class LongGrainVesselsCekhunen:
 
 
 class Rays:
+    group_name = "Rays"
+
     @classmethod
     def build(cls) -> Group:
-        rays = Group.create("Rays")
+        rays = Group.create(cls.group_name)
         rays.\
             set_vector_input("Texture coordinates",
                              mathutils.Vector((0.0, 0.0, 0.0))).\
@@ -2239,6 +2283,49 @@ class Rays:
         return frame, mix.get_color_output()
 
 
+# Node groups are built once per file and shared by all materials. A group
+# is found by its name and the hash of its builder source code : when a
+# builder changes, a new group is built.
+class NodeGroupLibrary:
+    VERSION_KEY = "woodwork_version"
+    # Increase when code shared by group builders (node classes, layout
+    # helpers...) changes : builder sources alone don't cover it
+    LIBRARY_VERSION = 1
+
+    @staticmethod
+    def version_hash(builder) -> str:
+        builder_class = builder if isinstance(builder, type) else type(builder)
+        try:
+            source = inspect.getsource(builder_class)
+        except (OSError, TypeError):
+            source = builder_class.__name__
+        source = str(NodeGroupLibrary.LIBRARY_VERSION) + "\n" + source
+        return hashlib.md5(source.encode("utf-8")).hexdigest()[:8]
+
+    @staticmethod
+    def full_name(group_name: str, version: str) -> str:
+        return group_name + " [" + version + "]"
+
+    @staticmethod
+    def get(builder) -> Group:
+        version = NodeGroupLibrary.version_hash(builder)
+        full_name = NodeGroupLibrary.full_name(builder.group_name, version)
+        node_tree = bpy.data.node_groups.get(full_name)
+        if node_tree is not None:
+            if node_tree.get(NodeGroupLibrary.VERSION_KEY) == version:
+                return Group(node_tree)
+            # Group with this name but without this version (renamed or
+            # edited by the user) : its name is freed so that the new group
+            # doesn't get a ".001" suffix
+            node_tree.name = full_name + " (old)"
+
+        group = builder.build()
+        node_tree = group.as_bpy_type()
+        node_tree.name = full_name
+        node_tree[NodeGroupLibrary.VERSION_KEY] = version
+        return group
+
+
 class DiffuseColorBuilder:
     def __init__(self,
                  wood_pattern,
@@ -2309,11 +2396,11 @@ class DiffuseColorBuilder:
         return diffuse, groups
 
     def build_groups(self, tree: Nodes, position: Position) -> tuple:
-        wood_pattern_grp = self.wood_pattern.build()
-        axial_parenchima_grp = self.axial_parenchima.build()
-        support_fibres_grp = self.support_fibres.build()
-        vessels_grp = self.vessels.build()
-        rays_grp = self.rays.build()
+        wood_pattern_grp = NodeGroupLibrary.get(self.wood_pattern)
+        axial_parenchima_grp = NodeGroupLibrary.get(self.axial_parenchima)
+        support_fibres_grp = NodeGroupLibrary.get(self.support_fibres)
+        vessels_grp = NodeGroupLibrary.get(self.vessels)
+        rays_grp = NodeGroupLibrary.get(self.rays)
 
         wood_pattern = GroupNode.\
             create(tree).\
@@ -1,9 +1,11 @@
 import bpy
 import bmesh
-from . tenon_mortise_builder import (TenonMortiseBuilder,
-                                     TenonMortiseBuilderProps,
-                                     FaceToBeTransformed)
-from . woodwork_geom_utils import GeomUtils
+from . tenon_mortise_builder import (TenonMortiseBuilderProps,
+                                     FaceToBeTransformed,
+                                     JointSizing)
+from . joint_batch import JointBatch
+from . joint_redo import JointRedoCache
+from . joint_profiler import JointProfiler
 from . woodwork_math_utils import MathUtils
 
 
@@ -25,6 +27,14 @@ class MortiseOperator(bpy.types.Operator):
                                                          default=True)
     expand_height_properties = bpy.props.BoolProperty(name="Expand",
                                                       default=True)
+    all_selected_faces = bpy.props.BoolProperty(
+        name="All selected faces",
+        description="Create a mortise on each selected face",
+        default=False)
+    report_timings = bpy.props.BoolProperty(
+        name="Report timings",
+        description="Report time spent in each step of mortise creation",
+        default=False)
 
     def __check_face(self, face):
         # If we don't find a selected face, we have problem.  Exit:
@@ -33,20 +43,9 @@ class MortiseOperator(bpy.types.Operator):
                         "You must select a face for the mortise.")
             return False
 
-        # Warn the user if face is not 4 vertices.
-        if len(face.verts) > 4:
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not quad.")
-            return False
-
-        if not GeomUtils.is_face_planar(face):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not planar.")
-            return False
-
-        if not GeomUtils.is_face_rectangular(face):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not rectangular.")
+        message = JointBatch.check_face(face)
+        if message is not None:
+            self.report({'ERROR_INVALID_INPUT'}, message)
             return False
         return True
 
@@ -192,109 +191,60 @@ class MortiseOperator(bpy.types.Operator):
         layout.label(text="Depth")
         layout.prop(mortise_properties, "depth_value", text="")
 
+        layout.prop(mortise_properties, "clean_up")
+
+        layout.prop(self, "all_selected_faces")
+        layout.prop(self, "report_timings")
+
     # used to check if the operator can run
     @classmethod
     def poll(cls, context):
         ob = context.active_object
         return ob and ob.type == 'MESH' and context.mode == 'EDIT_MESH'
 
-    @staticmethod
-    def __mortise_properties_to_builder_properties(mortise_properties):
-        builder_properties = TenonMortiseBuilderProps()
-        builder_properties.depth_value = -mortise_properties.depth_value
-
-        # thickness
-        builder_thickness_properties = builder_properties.thickness_properties
-        mortise_thickness_properties = mortise_properties.thickness_properties
-
-        builder_thickness_properties.type = mortise_thickness_properties.type
-        builder_thickness_properties.value = mortise_thickness_properties.value
-        builder_thickness_properties.percentage = \
-            mortise_thickness_properties.percentage
-        builder_thickness_properties.centered = \
-            mortise_thickness_properties.centered
-        builder_thickness_properties.shoulder_type = \
-            mortise_thickness_properties.shoulder_type
-        builder_thickness_properties.shoulder_value = \
-            mortise_thickness_properties.shoulder_value
-        builder_thickness_properties.shoulder_percentage = \
-            mortise_thickness_properties.shoulder_percentage
-        builder_thickness_properties.reverse_shoulder = \
-            mortise_thickness_properties.reverse_shoulder
-        builder_thickness_properties.haunched_first_side = \
-            mortise_thickness_properties.haunched_first_side
-        builder_thickness_properties.haunched_second_side = \
-            mortise_thickness_properties.haunched_second_side
-
-        builder_haunch_properties = \
-            builder_thickness_properties.haunch_first_side
-        mortise_haunch_properties = \
-            mortise_thickness_properties.haunch_first_side
-
-        builder_haunch_properties.type = mortise_haunch_properties.type
-        builder_haunch_properties.depth_value = \
-            -mortise_haunch_properties.depth_value
-        builder_haunch_properties.depth_percentage = \
-            mortise_haunch_properties.depth_percentage
-        builder_haunch_properties.angle = mortise_haunch_properties.angle
-
-        builder_haunch_properties = \
-            builder_thickness_properties.haunch_second_side
-        mortise_haunch_properties = \
-            mortise_thickness_properties.haunch_second_side
-
-        builder_haunch_properties.type = mortise_haunch_properties.type
-        builder_haunch_properties.depth_value = \
-            -mortise_haunch_properties.depth_value
-        builder_haunch_properties.depth_percentage = \
-            mortise_haunch_properties.depth_percentage
-        builder_haunch_properties.angle = mortise_haunch_properties.angle
-
-        # height
-        builder_height_properties = builder_properties.height_properties
-        mortise_height_properties = mortise_properties.height_properties
-
-        builder_height_properties.type = mortise_height_properties.type
-        builder_height_properties.value = mortise_height_properties.value
-        builder_height_properties.percentage = \
-            mortise_height_properties.percentage
-        builder_height_properties.centered = mortise_height_properties.centered
-        builder_height_properties.shoulder_type = \
-            mortise_height_properties.shoulder_type
-        builder_height_properties.shoulder_value = \
-            mortise_height_properties.shoulder_value
-        builder_height_properties.shoulder_percentage = \
-            mortise_height_properties.shoulder_percentage
-        builder_height_properties.reverse_shoulder = \
-            mortise_height_properties.reverse_shoulder
-        builder_height_properties.haunched_first_side = \
-            mortise_height_properties.haunched_first_side
-        builder_height_properties.haunched_second_side = \
-            mortise_height_properties.haunched_second_side
-
-        builder_haunch_properties = builder_height_properties.haunch_first_side
-        mortise_haunch_properties = mortise_height_properties.haunch_first_side
-
-        builder_haunch_properties.type = mortise_haunch_properties.type
-        builder_haunch_properties.depth_value = \
-            -mortise_haunch_properties.depth_value
-        builder_haunch_properties.depth_percentage = \
-            mortise_haunch_properties.depth_percentage
-        builder_haunch_properties.angle = mortise_haunch_properties.angle
-
-        builder_haunch_properties = builder_height_properties.haunch_second_side
-        mortise_haunch_properties = mortise_height_properties.haunch_second_side
-
-        builder_haunch_properties.type = mortise_haunch_properties.type
-        builder_haunch_properties.depth_value = \
-            -mortise_haunch_properties.depth_value
-        builder_haunch_properties.depth_percentage = \
-            mortise_haunch_properties.depth_percentage
-        builder_haunch_properties.angle = mortise_haunch_properties.angle
-
-        return builder_properties
+    # Create a mortise on each selected face, mesh is written back once
+    def __execute_on_selected_faces(self, mortise_properties, bm, matrix_world):
+        batch = JointBatch(mortise_properties, is_mortise=True)
+        results = batch.create_on_selected_faces(bm, matrix_world)
+
+        if len(results) == 0:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "You must select faces for the mortise.")
+            return False
+
+        failed_count = 0
+        for result in results:
+            if not result.success:
+                failed_count += 1
+                self.report({'WARNING'},
+                            "Face " + str(result.face_index) + ": " +
+                            result.message)
+        self.__report_clean_up(sum(result.cleaned_face_count
+                                   for result in results))
+        self.report({'INFO'},
+                    str(len(results) - failed_count) + " mortise(s) created, " +
+                    str(failed_count) + " failed.")
+        return failed_count < len(results)
+
+    def __report_clean_up(self, cleaned_face_count):
+        if cleaned_face_count > 0:
+            self.report({'INFO'},
+                        "Clean up: " + str(cleaned_face_count) +
+                        " face(s) removed.")
 
     def execute(self, context):
+        if not self.report_timings:
+            result = self.__execute(context)
+        else:
+            with JointProfiler() as profiler:
+                result = self.__execute(context)
+            for profile_index, profile in enumerate(profiler.profiles):
+                for line in profile.report_lines():
+                    self.report({'INFO'},
+                                "Mortise %d, %s" % (profile_index + 1, line))
+        return result
+
+    def __execute(self, context):
 
         mortise_properties = context.scene.woodwork.mortise_properties
         thickness_properties = mortise_properties.thickness_properties
@@ -313,6 +263,23 @@ class MortiseOperator(bpy.types.Operator):
             bm = bmesh.new()
             bm.from_mesh(mesh)
 
+        if self.all_selected_faces:
+            if not self.__execute_on_selected_faces(mortise_properties,
+                                                    bm,
+                                                    matrix_world):
+                return {'CANCELLED'}
+
+            # Flush selection
+            bm.select_flush_mode()
+
+            if mesh.is_editmode:
+                bmesh.update_edit_mesh(mesh)
+            else:
+                bm.to_mesh(mesh)
+                mesh.update()
+
+            return {'FINISHED'}
+
         # Get active face
         faces = bm.faces
         face = faces.active
@@ -330,172 +297,54 @@ class MortiseOperator(bpy.types.Operator):
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.shortest_length,
                     self.shortest_length))):
-            thickness_properties.value = \
-                face_to_be_transformed.shortest_length / 3.0
-            thickness_properties.percentage = 1.0 / 3.0
-            thickness_properties.centered = True
+            JointSizing.set_default_thickness(
+                mortise_properties,
+                face_to_be_transformed.shortest_length)
         if (height_properties.value == -1.0 or
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.longest_length,
                     self.longest_length))):
-            height_properties.value = (face_to_be_transformed.longest_length *
-                                       2.0) / 3.0
-            height_properties.percentage = 2.0 / 3.0
-            height_properties.centered = True
+            JointSizing.set_default_height(
+                mortise_properties,
+                face_to_be_transformed.longest_length)
         if (mortise_properties.depth_value == -1.0 or
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.longest_length,
                     self.longest_length))):
-            mortise_properties.depth_value = \
-                face_to_be_transformed.shortest_length
-
-            haunch_properties = height_properties.haunch_first_side
-            haunch_properties.depth_value = \
-                mortise_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-            haunch_properties = height_properties.haunch_second_side
-            haunch_properties.depth_value = \
-                mortise_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-
-            haunch_properties = thickness_properties.haunch_first_side
-            haunch_properties.depth_value = \
-                mortise_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-            haunch_properties = thickness_properties.haunch_second_side
-            haunch_properties.depth_value = \
-                mortise_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
+            JointSizing.set_default_depth(
+                mortise_properties,
+                face_to_be_transformed.shortest_length)
 
         # used to reinit default values when face changes
         self.shortest_length = face_to_be_transformed.shortest_length
         self.longest_length = face_to_be_transformed.longest_length
 
-        # If percentage specified, compute length values
-        if thickness_properties.type == "percentage":
-            thickness_properties.value = \
-                face_to_be_transformed.shortest_length * \
-                thickness_properties.percentage
-
-        if height_properties.type == "percentage":
-            height_properties.value = face_to_be_transformed.longest_length * \
-                height_properties.percentage
-
-        # Init values linked to shoulder size
-        if thickness_properties.centered:
-            thickness_properties.shoulder_value = ((
-                face_to_be_transformed.shortest_length -
-                thickness_properties.value) / 2.0)
-            thickness_properties.shoulder_percentage = \
-                thickness_properties.shoulder_value / \
-                face_to_be_transformed.shortest_length
-        if height_properties.centered:
-            height_properties.shoulder_value = ((
-                face_to_be_transformed.longest_length -
-                height_properties.value) / 2.0)
-            height_properties.shoulder_percentage = \
-                height_properties.shoulder_value / \
-                face_to_be_transformed.longest_length
-
-        # If shoulder percentage specified, compute length values
-        if thickness_properties.shoulder_type == "percentage":
-            thickness_properties.shoulder_value = \
-                face_to_be_transformed.shortest_length * \
-                thickness_properties.shoulder_percentage
-            if thickness_properties.type != "max":
-                if (thickness_properties.shoulder_value +
-                        thickness_properties.value >
-                        face_to_be_transformed.shortest_length):
-                    thickness_properties.value = \
-                        face_to_be_transformed.shortest_length - \
-                        thickness_properties.shoulder_value
-                    thickness_properties.percentage =\
-                        thickness_properties.value / \
-                        face_to_be_transformed.shortest_length
-
-        if height_properties.shoulder_type == "percentage":
-            height_properties.shoulder_value = \
-                face_to_be_transformed.longest_length * \
-                height_properties.shoulder_percentage
-            if height_properties.type != "max":
-                if (height_properties.shoulder_value + height_properties.value >
-                        face_to_be_transformed.longest_length):
-                    height_properties.value = \
-                        face_to_be_transformed.longest_length - \
-                        height_properties.shoulder_value
-                    height_properties.percentage = \
-                        height_properties.value / \
-                        face_to_be_transformed.longest_length
-
-        if height_properties.haunched_first_side:
-            haunch_properties = height_properties.haunch_first_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    mortise_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if height_properties.haunched_second_side:
-            haunch_properties = height_properties.haunch_second_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    mortise_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if thickness_properties.haunched_first_side:
-            haunch_properties = thickness_properties.haunch_first_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    mortise_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if thickness_properties.haunched_second_side:
-            haunch_properties = thickness_properties.haunch_second_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    mortise_properties.depth_value * \
-                    haunch_properties.depth_percentage
+        # Compute values given by percentages and centered shoulders
+        JointSizing.compute_values(mortise_properties,
+                                   face_to_be_transformed.shortest_length,
+                                   face_to_be_transformed.longest_length)
 
         # Check input values
-        if height_properties.type != "max":
-            total_length = height_properties.shoulder_value + \
-                height_properties.value
-        elif height_properties.centered:
-            total_length = face_to_be_transformed.longest_length
-        else:
-            total_length = height_properties.shoulder_value
-
-        if ((not MathUtils.almost_equal_relative_or_absolute(
-                total_length,
-                face_to_be_transformed.longest_length)) and
-                (total_length > face_to_be_transformed.longest_length)):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Size of length size shoulder and mortise height are "
-                        "too long.")
-            return {'CANCELLED'}
-
-        if thickness_properties.type != "max":
-            total_length = thickness_properties.shoulder_value + \
-                thickness_properties.value
-        elif thickness_properties.centered:
-            total_length = face_to_be_transformed.shortest_length
-        else:
-            total_length = thickness_properties.shoulder_value
-
-        if ((not MathUtils.almost_equal_relative_or_absolute(
-                total_length,
-                face_to_be_transformed.shortest_length)) and
-                (total_length > face_to_be_transformed.shortest_length)):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Size of width size shoulder and mortise thickness are "
-                        "too long.")
+        message = JointSizing.check_values(
+            mortise_properties,
+            face_to_be_transformed.shortest_length,
+            face_to_be_transformed.longest_length,
+            "mortise")
+        if message is not None:
+            self.report({'ERROR_INVALID_INPUT'}, message)
             return {'CANCELLED'}
 
         # Create mortise
-        builder_properties = \
-            MortiseOperator.__mortise_properties_to_builder_properties(
-                mortise_properties)
-        mortise_builder = TenonMortiseBuilder(builder_properties)
-        mortise_builder.create(bm, matrix_world, face_to_be_transformed)
+        builder_properties = TenonMortiseBuilderProps.from_properties(
+            mortise_properties)
+        builder_properties.negate_depths()
+        cleaned_face_count = JointRedoCache.create(
+            self.bl_idname + obj.name,
+            bm,
+            matrix_world,
+            face_to_be_transformed,
+            builder_properties)
+        self.__report_clean_up(cleaned_face_count)
 
         # Flush selection
         bm.select_flush_mode()
@@ -1,12 +1,30 @@
 import bpy.types
 import bpy.utils
 from bpy.props import (
-    StringProperty
+    StringProperty,
+    BoolProperty,
+    CollectionProperty,
+    FloatVectorProperty,
+    PointerProperty
 )
 
+from . joint_stack import JointSpec
+from . piece_properties import WorkpieceSize
+
+
 class ObjectWoodworkProperties(bpy.types.PropertyGroup):
     cutting_list_type = StringProperty()
     comments = StringProperty()
+    is_workpiece = BoolProperty(default=False)
+
+    # Workpiece box and joints built on it (see joint_stack)
+    base_size = PointerProperty(type=WorkpieceSize)
+    base_offset = FloatVectorProperty(size=3)
+    joint_stack = CollectionProperty(type=JointSpec)
+    # Key of box and joints when the mesh was last built
+    stack_key = StringProperty(options={'HIDDEN'})
+    # Key of the mesh content when it was last built
+    stack_mesh_key = StringProperty(options={'HIDDEN'})
 
 
 def register():
@@ -98,48 +98,77 @@ class WorkpieceOperator(bpy.types.Operator):
         "end-right": Vector((-1.0, 0.0, 0.0))
     }
 
+    # Box faces as vertex indices (vertex index bits : x, y, z), wound so
+    # that normals point outside
+    piece_sides = ((0, 2, 3, 1),
+                   (4, 5, 7, 6),
+                   (0, 1, 5, 4),
+                   (1, 3, 7, 5),
+                   (3, 2, 6, 7),
+                   (2, 0, 4, 6))
+
+    # Box vertices coordinates, as a flat list
     @staticmethod
-    def create_piece(piece_size: WorkpieceSize,
-                     origin_offset_scale: Vector) -> bmesh.types.BMesh:
-        mesh = bmesh.new()
-
+    def piece_coords(piece_size: WorkpieceSize,
+                     origin_offset_scale: Vector) -> list:
         len_offset = piece_size.length / 2.0
         width_offset = piece_size.width / 2.0
         thickness_offset = piece_size.thickness / 2.0
 
-        origin_offset = Vector((origin_offset_scale[0] * len_offset,
-                                origin_offset_scale[1] * width_offset,
-                                origin_offset_scale[2] * thickness_offset))
+        origin_offset = (origin_offset_scale[0] * len_offset,
+                         origin_offset_scale[1] * width_offset,
+                         origin_offset_scale[2] * thickness_offset)
+
+        coords = []
+        for z in (-thickness_offset, thickness_offset):
+            for y in (-width_offset, width_offset):
+                for x in (-len_offset, len_offset):
+                    coords.append(x + origin_offset[0])
+                    coords.append(y + origin_offset[1])
+                    coords.append(z + origin_offset[2])
+        return coords
 
-        coords = (Vector((-len_offset, -width_offset, -thickness_offset)),
-                  Vector((len_offset, -width_offset, -thickness_offset)),
-                  Vector((-len_offset, width_offset, -thickness_offset)),
-                  Vector((len_offset, width_offset, -thickness_offset)),
-                  Vector((-len_offset, -width_offset, thickness_offset)),
-                  Vector((len_offset, -width_offset, thickness_offset)),
-                  Vector((-len_offset, width_offset, thickness_offset)),
-                  Vector((len_offset, width_offset, thickness_offset)))
+    @staticmethod
+    def create_piece(piece_size: WorkpieceSize,
+                     origin_offset_scale: Vector) -> bmesh.types.BMesh:
+        mesh = bmesh.new()
 
+        coords = WorkpieceOperator.piece_coords(piece_size,
+                                                origin_offset_scale)
         verts = []
-        for co in coords:
-            vert_co = co + origin_offset
-            verts.append(mesh.verts.new(vert_co.to_tuple()))
-
-        sides = ((0, 2, 3, 1),
-                 (4, 5, 7, 6),
-                 (0, 4, 5, 1),
-                 (1, 3, 7, 5),
-                 (3, 7, 6, 2),
-                 (2, 0, 4, 6))
-        faces = []
-        for side in sides:
+        for index in range(0, len(coords), 3):
+            verts.append(mesh.verts.new(coords[index:index + 3]))
+
+        for side in WorkpieceOperator.piece_sides:
             side_verts = [verts[i] for i in side]
-            faces.append(mesh.faces.new(side_verts))
+            mesh.faces.new(side_verts)
 
-        bmesh.ops.recalc_face_normals(mesh, faces=faces)
+        mesh.normal_update()
 
         return mesh
 
+    # Fill an empty mesh with a workpiece box from flat arrays (no bmesh
+    # conversion). Usable to generate many workpieces.
+    @staticmethod
+    def create_piece_mesh(mesh: bpy.types.Mesh,
+                          piece_size: WorkpieceSize,
+                          origin_offset_scale: Vector):
+        sides = WorkpieceOperator.piece_sides
+        vertex_indices = [index for side in sides for index in side]
+
+        mesh.vertices.add(8)
+        mesh.vertices.foreach_set("co",
+                                  WorkpieceOperator.piece_coords(
+                                      piece_size,
+                                      origin_offset_scale))
+        mesh.loops.add(len(vertex_indices))
+        mesh.loops.foreach_set("vertex_index", vertex_indices)
+        mesh.polygons.add(len(sides))
+        mesh.polygons.foreach_set("loop_start",
+                                  list(range(0, len(vertex_indices), 4)))
+        mesh.polygons.foreach_set("loop_total", [4] * len(sides))
+        mesh.update(calc_edges=True)
+
     # Adapted from blender code "rotation_between_quats_to_quat"
     @staticmethod
     def quaternion_rotation(quat0: Quaternion, quat1: Quaternion):
@@ -310,6 +339,33 @@ class WorkpieceOperator(bpy.types.Operator):
                 self.report({'WARNING'},
                             "Woodworking: One object should be selected")
 
+    # Copies are created directly in data (no duplicate operator call for
+    # each copy), each one translated by distance from the previous one.
+    # Last copy is selected and active, as with duplicate operators.
+    @staticmethod
+    def create_copies(scene: bpy.types.Scene,
+                      scene_object: bpy.types.Object,
+                      count_properties: WorkpieceCount):
+        distance = Vector(count_properties.distance)
+        location = scene_object.location.copy()
+        groups = list(scene_object.users_group)
+        mesh = scene_object.data
+
+        copy_object = scene_object
+        for counter in range(count_properties.count - 1):
+            copy_object = scene_object.copy()
+            if not count_properties.use_same_mesh:
+                copy_object.data = mesh.copy()
+            location += distance
+            copy_object.location = location
+            scene.objects.link(copy_object)
+            for group in groups:
+                group.objects.link(copy_object)
+
+        scene_object.select = False
+        copy_object.select = True
+        scene.objects.active = copy_object
+
     def execute(self, context):
         if bpy.context.mode == "OBJECT":
 
@@ -337,16 +393,26 @@ class WorkpieceOperator(bpy.types.Operator):
             scene_object.woodwork.cutting_list_type = \
                 description_properties.cutting_list_type
             scene_object.woodwork.comments = description_properties.comments
+            scene_object.woodwork.is_workpiece = True
 
             base = scene.objects.link(scene_object)
             base.select = True
 
             origin_offset_scale = WorkpieceOperator.origin_offset_scale(
                 position_properties)
-            piece_mesh = WorkpieceOperator.create_piece(
+            WorkpieceOperator.create_piece_mesh(
+                mesh,
                 piece_properties.size_properties,
                 origin_offset_scale)
 
+            # save workpiece box, to build it again with its joints
+            base_size = scene_object.woodwork.base_size
+            size_properties = piece_properties.size_properties
+            base_size.length = size_properties.length
+            base_size.width = size_properties.width
+            base_size.thickness = size_properties.thickness
+            scene_object.woodwork.base_offset = origin_offset_scale
+
             WorkpieceOperator.set_object_rotation(context,
                                                   position_properties,
                                                   scene_object)
@@ -354,10 +420,6 @@ class WorkpieceOperator(bpy.types.Operator):
             self.set_object_location(position_properties, scene, scene_object,
                                      selected_objects)
 
-            piece_mesh.to_mesh(mesh)
-            piece_mesh.free()
-
-            mesh.update()
             scene.objects.active = scene_object
 
             # create group list
@@ -365,21 +427,9 @@ class WorkpieceOperator(bpy.types.Operator):
 
             # create copies
             if count_properties.count > 1:
-                distance = Vector(count_properties.distance)
-                for counter in range(count_properties.count - 1):
-                    if count_properties.use_same_mesh:
-                        bpy.ops.object.duplicate_move_linked(
-                            TRANSFORM_OT_translate={
-                                "value": (distance[0], distance[1], distance[2])
-                            }
-                        )
-                    else:
-                        bpy.ops.object.duplicate_move(
-                            TRANSFORM_OT_translate={
-                                "value": (distance[0], distance[1], distance[2])
-                            }
-                        )
-
+                WorkpieceOperator.create_copies(scene,
+                                                scene_object,
+                                                count_properties)
 
             return {'FINISHED'}
         else:
@@ -1,8 +1,10 @@
 import bpy
 import bmesh
-from . tenon_mortise_builder import (TenonMortiseBuilder,
-                                     FaceToBeTransformed)
-from . woodwork_geom_utils import GeomUtils
+from . tenon_mortise_builder import (FaceToBeTransformed,
+                                     JointSizing)
+from . joint_batch import JointBatch
+from . joint_redo import JointRedoCache
+from . joint_profiler import JointProfiler
 from . woodwork_math_utils import MathUtils
 
 
@@ -24,6 +26,14 @@ class TenonOperator(bpy.types.Operator):
                                                          default=True)
     expand_height_properties = bpy.props.BoolProperty(name="Expand",
                                                       default=True)
+    all_selected_faces = bpy.props.BoolProperty(
+        name="All selected faces",
+        description="Create a tenon on each selected face",
+        default=False)
+    report_timings = bpy.props.BoolProperty(
+        name="Report timings",
+        description="Report time spent in each step of tenon creation",
+        default=False)
 
     def __check_face(self, face):
         # If we don't find a selected face, we have problem.  Exit:
@@ -32,20 +42,9 @@ class TenonOperator(bpy.types.Operator):
                         "You must select a face for the tenon.")
             return False
 
-        # Warn the user if face is not 4 vertices.
-        if len(face.verts) > 4:
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not quad.")
-            return False
-
-        if not GeomUtils.is_face_planar(face):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not planar.")
-            return False
-
-        if not GeomUtils.is_face_rectangular(face):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Selected face is not rectangular.")
+        message = JointBatch.check_face(face)
+        if message is not None:
+            self.report({'ERROR_INVALID_INPUT'}, message)
             return False
         return True
 
@@ -188,6 +187,10 @@ class TenonOperator(bpy.types.Operator):
         layout.prop(tenon_properties, "depth_value", text="")
 
         layout.prop(tenon_properties, "remove_wood")
+        layout.prop(tenon_properties, "clean_up")
+
+        layout.prop(self, "all_selected_faces")
+        layout.prop(self, "report_timings")
 
     # used to check if the operator can run
     @classmethod
@@ -195,7 +198,49 @@ class TenonOperator(bpy.types.Operator):
         ob = context.active_object
         return ob and ob.type == 'MESH' and context.mode == 'EDIT_MESH'
 
+    # Create a tenon on each selected face, mesh is written back once
+    def __execute_on_selected_faces(self, tenon_properties, bm, matrix_world):
+        batch = JointBatch(tenon_properties, is_mortise=False)
+        results = batch.create_on_selected_faces(bm, matrix_world)
+
+        if len(results) == 0:
+            self.report({'ERROR_INVALID_INPUT'},
+                        "You must select faces for the tenon.")
+            return False
+
+        failed_count = 0
+        for result in results:
+            if not result.success:
+                failed_count += 1
+                self.report({'WARNING'},
+                            "Face " + str(result.face_index) + ": " +
+                            result.message)
+        self.__report_clean_up(sum(result.cleaned_face_count
+                                   for result in results))
+        self.report({'INFO'},
+                    str(len(results) - failed_count) + " tenon(s) created, " +
+                    str(failed_count) + " failed.")
+        return failed_count < len(results)
+
+    def __report_clean_up(self, cleaned_face_count):
+        if cleaned_face_count > 0:
+            self.report({'INFO'},
+                        "Clean up: " + str(cleaned_face_count) +
+                        " face(s) removed.")
+
     def execute(self, context):
+        if not self.report_timings:
+            result = self.__execute(context)
+        else:
+            with JointProfiler() as profiler:
+                result = self.__execute(context)
+            for profile_index, profile in enumerate(profiler.profiles):
+                for line in profile.report_lines():
+                    self.report({'INFO'},
+                                "Tenon %d, %s" % (profile_index + 1, line))
+        return result
+
+    def __execute(self, context):
 
         tenon_properties = context.scene.woodwork.tenon_properties
         thickness_properties = tenon_properties.thickness_properties
@@ -214,6 +259,23 @@ class TenonOperator(bpy.types.Operator):
             bm = bmesh.new()
             bm.from_mesh(mesh)
 
+        if self.all_selected_faces:
+            if not self.__execute_on_selected_faces(tenon_properties,
+                                                    bm,
+                                                    matrix_world):
+                return {'CANCELLED'}
+
+            # Flush selection
+            bm.select_flush_mode()
+
+            if mesh.is_editmode:
+                bmesh.update_edit_mesh(mesh)
+            else:
+                bm.to_mesh(mesh)
+                mesh.update()
+
+            return {'FINISHED'}
+
         # Get active face
         faces = bm.faces
         face = faces.active
@@ -231,169 +293,51 @@ class TenonOperator(bpy.types.Operator):
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.shortest_length,
                     self.shortest_length))):
-            thickness_properties.value = \
-                face_to_be_transformed.shortest_length / 3.0
-            thickness_properties.percentage = 1.0 / 3.0
-            thickness_properties.centered = True
+            JointSizing.set_default_thickness(
+                tenon_properties,
+                face_to_be_transformed.shortest_length)
         if (height_properties.value == -1.0 or
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.longest_length,
                     self.longest_length))):
-            height_properties.value = (face_to_be_transformed.longest_length *
-                                       2.0) / 3.0
-            height_properties.percentage = 2.0 / 3.0
-            height_properties.centered = True
+            JointSizing.set_default_height(
+                tenon_properties,
+                face_to_be_transformed.longest_length)
         if (tenon_properties.depth_value == -1.0 or
                 (not MathUtils.almost_equal_relative_or_absolute(
                     face_to_be_transformed.longest_length,
                     self.longest_length))):
-            tenon_properties.depth_value = \
-                face_to_be_transformed.shortest_length
-
-            haunch_properties = height_properties.haunch_first_side
-            haunch_properties.depth_value = \
-                tenon_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-            haunch_properties = height_properties.haunch_second_side
-            haunch_properties.depth_value = \
-                tenon_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-
-            haunch_properties = thickness_properties.haunch_first_side
-            haunch_properties.depth_value = \
-                tenon_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
-            haunch_properties = thickness_properties.haunch_second_side
-            haunch_properties.depth_value = \
-                tenon_properties.depth_value / 3.0
-            haunch_properties.depth_percentage = 1.0 / 3.0
+            JointSizing.set_default_depth(
+                tenon_properties,
+                face_to_be_transformed.shortest_length)
 
         # used to reinit default values when face changes
         self.shortest_length = face_to_be_transformed.shortest_length
         self.longest_length = face_to_be_transformed.longest_length
 
-        # If percentage specified, compute length values
-        if thickness_properties.type == "percentage":
-            thickness_properties.value = \
-                face_to_be_transformed.shortest_length * \
-                thickness_properties.percentage
-
-        if height_properties.type == "percentage":
-            height_properties.value = face_to_be_transformed.longest_length * \
-                height_properties.percentage
-
-        # Init values linked to shoulder size
-        if thickness_properties.centered:
-            thickness_properties.shoulder_value = ((
-                face_to_be_transformed.shortest_length -
-                thickness_properties.value) / 2.0)
-            thickness_properties.shoulder_percentage = \
-                thickness_properties.shoulder_value / \
-                face_to_be_transformed.shortest_length
-        if height_properties.centered:
-            height_properties.shoulder_value = ((
-                face_to_be_transformed.longest_length -
-                height_properties.value) / 2.0)
-            height_properties.shoulder_percentage = \
-                height_properties.shoulder_value / \
-                face_to_be_transformed.longest_length
-
-        # If shoulder percentage specified, compute length values
-        if thickness_properties.shoulder_type == "percentage":
-            thickness_properties.shoulder_value = \
-                face_to_be_transformed.shortest_length * \
-                thickness_properties.shoulder_percentage
-            if thickness_properties.type != "max":
-                if (thickness_properties.shoulder_value +
-                        thickness_properties.value >
-                        face_to_be_transformed.shortest_length):
-                    thickness_properties.value = \
-                        face_to_be_transformed.shortest_length - \
-                        thickness_properties.shoulder_value
-                    thickness_properties.percentage =\
-                        thickness_properties.value / \
-                        face_to_be_transformed.shortest_length
-
-        if height_properties.shoulder_type == "percentage":
-            height_properties.shoulder_value = \
-                face_to_be_transformed.longest_length * \
-                height_properties.shoulder_percentage
-            if height_properties.type != "max":
-                if (height_properties.shoulder_value + height_properties.value >
-                        face_to_be_transformed.longest_length):
-                    height_properties.value = \
-                        face_to_be_transformed.longest_length - \
-                        height_properties.shoulder_value
-                    height_properties.percentage = \
-                        height_properties.value / \
-                        face_to_be_transformed.longest_length
-
-        if height_properties.haunched_first_side:
-            haunch_properties = height_properties.haunch_first_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    tenon_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if height_properties.haunched_second_side:
-            haunch_properties = height_properties.haunch_second_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    tenon_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if thickness_properties.haunched_first_side:
-            haunch_properties = thickness_properties.haunch_first_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    tenon_properties.depth_value * \
-                    haunch_properties.depth_percentage
-
-        if thickness_properties.haunched_second_side:
-            haunch_properties = thickness_properties.haunch_second_side
-            if haunch_properties.type == "percentage":
-                haunch_properties.depth_value = \
-                    tenon_properties.depth_value * \
-                    haunch_properties.depth_percentage
+        # Compute values given by percentages and centered shoulders
+        JointSizing.compute_values(tenon_properties,
+                                   face_to_be_transformed.shortest_length,
+                                   face_to_be_transformed.longest_length)
 
         # Check input values
-        if height_properties.type != "max":
-            total_length = height_properties.shoulder_value + \
-                height_properties.value
-        elif height_properties.centered:
-            total_length = face_to_be_transformed.longest_length
-        else:
-            total_length = height_properties.shoulder_value
-
-        if ((not MathUtils.almost_equal_relative_or_absolute(
-                total_length,
-                face_to_be_transformed.longest_length)) and
-                (total_length > face_to_be_transformed.longest_length)):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Size of length size shoulder and tenon height are "
-                        "too long.")
-            return {'CANCELLED'}
-
-        if thickness_properties.type != "max":
-            total_length = thickness_properties.shoulder_value + \
-                thickness_properties.value
-        elif thickness_properties.centered:
-            total_length = face_to_be_transformed.shortest_length
-        else:
-            total_length = thickness_properties.shoulder_value
-
-        if ((not MathUtils.almost_equal_relative_or_absolute(
-                total_length,
-                face_to_be_transformed.shortest_length)) and
-                (total_length > face_to_be_transformed.shortest_length)):
-            self.report({'ERROR_INVALID_INPUT'},
-                        "Size of width size shoulder and tenon thickness are "
-                        "too long.")
+        message = JointSizing.check_values(
+            tenon_properties,
+            face_to_be_transformed.shortest_length,
+            face_to_be_transformed.longest_length,
+            "tenon")
+        if message is not None:
+            self.report({'ERROR_INVALID_INPUT'}, message)
             return {'CANCELLED'}
 
         # Create tenon
-        tenon_builder = TenonMortiseBuilder(tenon_properties)
-        tenon_builder.create(bm, matrix_world, face_to_be_transformed)
+        cleaned_face_count = JointRedoCache.create(
+            self.bl_idname + obj.name,
+            bm,
+            matrix_world,
+            face_to_be_transformed,
+            tenon_properties)
+        self.__report_clean_up(cleaned_face_count)
 
         # Flush selection
         bm.select_flush_mode()
@@ -3,20 +3,31 @@ from sys import float_info
 from collections import namedtuple
 
 import bmesh
-import bpy
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+from mathutils.kdtree import KDTree
 from mathutils.geometry import (intersect_point_line,
                                 distance_point_to_plane,
-                                intersect_line_plane,
-                                tessellate_polygon,
-                                normal,
-                                intersect_ray_tri)
+                                intersect_line_plane)
 from enum import Enum, IntEnum, unique
 from . woodwork_math_utils import MathUtils
 from . woodwork_geom_utils import (GeomUtils,
                                    VectorUtils,
                                    BBox,
-                                   Position)
+                                   BBoxArray,
+                                   BBoxList,
+                                   Position,
+                                   numpy)
+from . joint_profiler import BMeshOpsCounter, JointProfiler
+from . joint_kernel import (TenonMortiseBuilderThickness,
+                            TenonMortiseBuilderHaunch,
+                            TenonMortiseBuilderHeight,
+                            TenonMortiseBuilderProps,
+                            JointSizing,
+                            JointKernel)
+
+# bmesh operators called by builders (counted when joints are profiled)
+builder_ops = BMeshOpsCounter(bmesh.ops)
 
 #TODO : handle mortise with 0 length shoulder (sort of inverted max)
 # Used to retrieve faces when geometry has been deleted and faces reordered
@@ -35,88 +46,167 @@ class ReferenceGeometry(IntEnum):
 
 
 # Use bmesh layers to retrieve faces
+# Saved elements are also indexed by reference so that a lookup costs O(1)
+# while the element survives the bmesh operators (delete, extrude... keep
+# untouched elements alive). Weld based operators (automerge, pointmerge)
+# rebuild the faces and edges using merged vertices, copying their custom
+# data : the index is refreshed around merged vertices after them (see
+# weld_region). Layers are only scanned when an indexed element has been
+# destroyed elsewhere (scan_count counts these scans).
 class GeometryRetriever:
-    def __init__(self):
+    def __init__(self, name="retriever"):
+        self.name = name
         self.bm = None
         self.face_retriever = None
         self.edge_retriever = None
+        self.face_index = dict()
+        self.edge_index = dict()
+        self.scan_count = 0
 
     def create(self, bm):
         self.bm = bm
-        self.face_retriever = bm.faces.layers.int.new("face_retriever")
-        self.edge_retriever = bm.edges.layers.int.new("edge_retriever")
+        self.face_retriever = bm.faces.layers.int.new("face_" + self.name)
+        self.edge_retriever = bm.edges.layers.int.new("edge_" + self.name)
+        self.face_index.clear()
+        self.edge_index.clear()
+        self.scan_count = 0
+
+    # Get indexed element if it still holds the reference
+    @staticmethod
+    def __indexed_element(index, layer, reference):
+        element = index.get(reference)
+        if element is not None:
+            if not element.is_valid or element[layer] != reference:
+                del index[reference]
+                element = None
+        return element
+
+    # Index elements holding a reference, unless the indexed element still
+    # holds it
+    @staticmethod
+    def __index_elements(elements, index, layer):
+        for element in elements:
+            reference = element[layer]
+            if reference != 0 and \
+                    GeometryRetriever.__indexed_element(
+                        index, layer, reference) is None:
+                index[reference] = element
+
+    # Fallback : scan every element of the sequence looking for references
+    # between min_reference and max_reference (excluded)
+    def __scan_elements(self, elements, index, layer, min_reference,
+                        max_reference):
+        self.scan_count += 1
+        for element in elements:
+            val = element[layer]
+            if min_reference <= val < max_reference:
+                index.setdefault(val, element)
+
+    # Vertices whose faces and edges may be rebuilt by a weld based operator
+    # merging given vertices (merged vertices and merge targets) : vertices
+    # of their faces and edges, to be given to update_after_weld
+    @staticmethod
+    def weld_region(verts):
+        region = set(verts)
+        for vert in verts:
+            for face in vert.link_faces:
+                region.update(face.verts)
+            for edge in vert.link_edges:
+                region.update(edge.verts)
+        return region
+
+    # Faces and edges rebuilt by a weld use at least one vertex of the
+    # region that is still valid : index their references
+    def update_after_weld(self, region):
+        faces = set()
+        edges = set()
+        for vert in region:
+            if vert.is_valid:
+                faces.update(vert.link_faces)
+                edges.update(vert.link_edges)
+        GeometryRetriever.__index_elements(faces, self.face_index,
+                                           self.face_retriever)
+        GeometryRetriever.__index_elements(edges, self.edge_index,
+                                           self.edge_retriever)
+
+    def __retrieve(self, elements, index, layer, reference, remove_ref):
+        found = GeometryRetriever.__indexed_element(index, layer, reference)
+        if found is None:
+            self.__scan_elements(elements, index, layer,
+                                 reference, reference + 1)
+            found = index.get(reference)
+        if found is not None and remove_ref:
+            found[layer] = 0
+            del index[reference]
+        return found
 
     def save_face(self, face, reference_geometry):
-        face[self.face_retriever] = int(reference_geometry)
+        reference = int(reference_geometry)
+        face[self.face_retriever] = reference
+        self.face_index[reference] = face
 
     def retrieve_face(self, reference_geometry, remove_ref=True):
-        found = None
-        for f in self.bm.faces:
-            if f[self.face_retriever] == int(reference_geometry):
-                found = f
-                if remove_ref:
-                    f[self.face_retriever] = 0
-                break
-        return found
+        return self.__retrieve(self.bm.faces,
+                               self.face_index,
+                               self.face_retriever,
+                               int(reference_geometry),
+                               remove_ref)
 
     def save_faces(self, faces, reference_geometry_start):
         for idx, face in enumerate(faces):
-            face[self.face_retriever] = int(reference_geometry_start) + idx
+            self.save_face(face, int(reference_geometry_start) + idx)
 
     def retrieve_faces(self, reference_geometry_start,
                              max_count):
-        found_faces = dict()
         min_int = int(reference_geometry_start)
         max_int = min_int + max_count
-        for f in self.bm.faces:
-            val = f[self.face_retriever]
-            if int(reference_geometry_start) <= val < max_int:
-                found_faces[val - min_int] = f
-                f[self.face_retriever] = 0
+        found_faces = dict()
+        missing = False
+        for reference in range(min_int, max_int):
+            saved = reference in self.face_index
+            face = GeometryRetriever.__indexed_element(self.face_index,
+                                                       self.face_retriever,
+                                                       reference)
+            if face is not None:
+                found_faces[reference] = face
+            elif saved:
+                missing = True
+        if missing or len(found_faces) == 0:
+            self.__scan_elements(self.bm.faces,
+                                 self.face_index,
+                                 self.face_retriever,
+                                 min_int,
+                                 max_int)
+            for reference in range(min_int, max_int):
+                face = self.face_index.get(reference)
+                if face is not None:
+                    found_faces[reference] = face
+
         result_list = []
         for key in sorted(found_faces):
-            result_list.append(found_faces[key])
+            face = found_faces[key]
+            face[self.face_retriever] = 0
+            del self.face_index[key]
+            result_list.append(face)
         return result_list
 
     def save_edge(self, edge, reference_geometry):
-        edge[self.edge_retriever] = int(reference_geometry)
+        reference = int(reference_geometry)
+        edge[self.edge_retriever] = reference
+        self.edge_index[reference] = edge
 
     def retrieve_edge(self, reference_geometry, remove_ref=True):
-        found = None
-        for e in self.bm.edges:
-            if e[self.edge_retriever] == int(reference_geometry):
-                found = e
-                if remove_ref:
-                    e[self.edge_retriever] = 0
-                break
-        return found
+        return self.__retrieve(self.bm.edges,
+                               self.edge_index,
+                               self.edge_retriever,
+                               int(reference_geometry),
+                               remove_ref)
 
     def destroy(self):
         self.bm.faces.layers.int.remove(self.face_retriever)
         self.bm.edges.layers.int.remove(self.edge_retriever)
-
-
-# TODO: merge thickness and height into a TenonMortiseBuilderSideProperties or something like that
-class TenonMortiseBuilderThickness:
-    def __init__(self):
-        self.haunch_first_side = TenonMortiseBuilderHaunch()
-        self.haunch_second_side = TenonMortiseBuilderHaunch()
-
-
-class TenonMortiseBuilderHaunch:
-    pass
-
-
-class TenonMortiseBuilderHeight:
-    def __init__(self):
-        self.haunch_first_side = TenonMortiseBuilderHaunch()
-        self.haunch_second_side = TenonMortiseBuilderHaunch()
-
-
-class TenonMortiseBuilderProps:
-    def __init__(self):
-        self.height_properties = TenonMortiseBuilderHeight()
-        self.thickness_properties = TenonMortiseBuilderThickness()
+        self.face_index.clear()
+        self.edge_index.clear()
 
 
 # This describes the initial face where the tenon will be created
@@ -170,7 +260,7 @@ class FaceToBeTransformed:
     # Subdivide given edges and return created faces
     @staticmethod
     def __subdivide_edges(bm, edges_to_subdivide, cuts=2):
-        ret = bmesh.ops.subdivide_edges(
+        ret = builder_ops.subdivide_edges(
             bm,
             edges=edges_to_subdivide,
             cuts=cuts,
@@ -225,10 +315,10 @@ class FaceToBeTransformed:
         normal_world = rot_mat * self.face.normal
         normal_world = normal_world * depth
 
-        bmesh.ops.translate(bm,
-                            verts=self.face.verts,
-                            vec=normal_world,
-                            space=matrix_world)
+        builder_ops.translate(bm,
+                              verts=self.face.verts,
+                              vec=normal_world,
+                              space=matrix_world)
 
 
 # This structure keep info about the newly created tenon face
@@ -319,13 +409,7 @@ class TenonFace:
     def get_scale_factor(vector_to_be_resized, matrix_world, resize_value):
         rotate_scale_world = GeomUtils.rotation_and_scale_matrix(matrix_world)
         world_vector = rotate_scale_world * vector_to_be_resized
-
-        if VectorUtils.is_zero(world_vector):
-            scale_factor = resize_value
-        else:
-            scale_factor = resize_value / world_vector.length
-
-        return scale_factor
+        return JointKernel.scale_factor(world_vector, resize_value)
 
     @staticmethod
     def compute_translation_vector(local_vector_to_be_resized,
@@ -335,30 +419,16 @@ class TenonFace:
                                    shoulder_beyond_tenon):
         rotate_scale_world = GeomUtils.rotation_and_scale_matrix(matrix_world)
         vector_to_be_resized = rotate_scale_world * local_vector_to_be_resized
-
-        if VectorUtils.is_zero(vector_to_be_resized):
-            world_direction = rotate_scale_world * direction
-            translate_vector = world_direction.normalized() * scale_factor
-        else:
-            same_direction = VectorUtils.same_direction(local_vector_to_be_resized,
-                                                        direction)
-            if shoulder_beyond_tenon:
-                # shoulder size is larger than actual tenon end
-                if same_direction:
-                    vector_to_be_resized.negate()
-                vector_to_be_resized_inverted = vector_to_be_resized.copy()
-                vector_to_be_resized_inverted.negate()
-
-                final_vector = vector_to_be_resized_inverted * scale_factor
-
-                translate_vector = final_vector + vector_to_be_resized_inverted
-            else:
-                if not same_direction:
-                    vector_to_be_resized.negate()
-                final_vector = vector_to_be_resized * scale_factor
-
-                translate_vector = final_vector - vector_to_be_resized
-
+        world_direction = rotate_scale_world * direction
+        same_direction = not VectorUtils.is_zero(vector_to_be_resized) and \
+            VectorUtils.same_direction(local_vector_to_be_resized, direction)
+
+        translate_vector = Vector(JointKernel.tenon_translation_vector(
+            vector_to_be_resized,
+            world_direction,
+            scale_factor,
+            same_direction,
+            shoulder_beyond_tenon))
         return translate_vector
 
     @staticmethod
@@ -475,96 +545,200 @@ class ShoulderFace:
     def compute_translation_vector(self, shoulder_value, matrix_world):
         rotate_scale_world = GeomUtils.rotation_and_scale_matrix(matrix_world)
         edge_vector = rotate_scale_world * self.vector_to_be_resized
-        shoulder_length_to_resize = edge_vector.length
-        scale_factor = shoulder_value / shoulder_length_to_resize
-        final_vector = edge_vector * scale_factor
-        return final_vector - edge_vector
+        return Vector(JointKernel.shoulder_translation_vector(edge_vector,
+                                                              shoulder_value))
+
+
+# BVH tree of mesh faces shared by the through mortises of one operator or
+# batch call. The tree of the whole mesh is built on first use. Faces changed
+# afterwards by other joints (see mark_changed) are skipped in it and
+# searched in a small tree built from changed faces only.
+class FaceTree:
+    def __init__(self, bm):
+        self.bm = bm
+        self.tree = None
+        self.tree_faces = None
+        self.changed_faces = set()
+        self.changed_tree = None
+        self.changed_tree_faces = None
+
+    def is_built(self):
+        return self.tree is not None
+
+    def __build(self):
+        bm = self.bm
+        bm.faces.index_update()
+        self.tree_faces = list(bm.faces)
+        self.tree = BVHTree.FromBMesh(bm)
+        self.changed_faces = set()
+        self.changed_tree = None
+        self.changed_tree_faces = None
+
+    # Faces changed or created since the tree was built
+    def mark_changed(self, faces):
+        if self.tree is None:
+            return
+        self.changed_faces.update(faces)
+        self.changed_tree = None
+        self.changed_tree_faces = None
+
+    def __build_changed_tree(self):
+        faces = [face for face in self.changed_faces if face.is_valid]
+        vert_indices = dict()
+        coords = []
+        polygons = []
+        for face in faces:
+            polygon = []
+            for vert in face.verts:
+                if vert not in vert_indices:
+                    vert_indices[vert] = len(coords)
+                    coords.append(vert.co.copy())
+                polygon.append(vert_indices[vert])
+            polygons.append(polygon)
+        self.changed_tree_faces = faces
+        if len(faces) > 0:
+            self.changed_tree = BVHTree.FromPolygons(coords, polygons)
+
+    def __trees(self):
+        if self.tree is None:
+            self.__build()
+        if self.changed_tree_faces is None:
+            self.__build_changed_tree()
+        trees = [(self.tree, self.tree_faces)]
+        if self.changed_tree is not None:
+            trees.append((self.changed_tree, self.changed_tree_faces))
+        return trees
+
+    def __is_up_to_date(self, face):
+        return face.is_valid and face not in self.changed_faces
+
+    # Nearest face hit by the ray : returns (location, face) or
+    # (None, None)
+    def ray_cast(self, origin, direction):
+        trees = self.__trees()
+        best_location = None
+        best_face = None
+        best_distance = None
+        for tree, tree_faces in trees:
+            cast_origin = origin
+            location, normal, index, distance = tree.ray_cast(cast_origin,
+                                                              direction)
+            while location is not None:
+                face = tree_faces[index]
+                if tree is not self.tree or self.__is_up_to_date(face):
+                    break
+                cast_origin = location + direction * \
+                    ThroughMortiseIntersection.RAY_CAST_OFFSET
+                location, normal, index, distance = tree.ray_cast(
+                    cast_origin, direction)
+            if location is None:
+                continue
+            distance = (location - origin).length
+            if best_distance is None or distance < best_distance:
+                best_location = location
+                best_face = tree_faces[index]
+                best_distance = distance
+        return best_location, best_face
+
+    # Faces at most radius away from center
+    def find_nearest_range(self, center, radius):
+        faces = set()
+        for tree, tree_faces in self.__trees():
+            for location, normal, index, distance in \
+                    tree.find_nearest_range(center, radius):
+                face = tree_faces[index]
+                if tree is not self.tree or self.__is_up_to_date(face):
+                    faces.add(face)
+        return faces
 
 
 class ThroughMortiseIntersection:
+    RAY_CAST_OFFSET = GeomUtils.POINTS_ARE_NEAR_ABSOLUTE_ERROR_THRESHOLD
 
-    def __init__(self, bm, top_face):
+    # face_tree is shared with other joints of the same call, a tree is
+    # built for this mortise when it is None
+    def __init__(self, bm, top_face, face_tree=None):
         self.bm = bm
         self.top_face = top_face
-
-    def __find_possible_intersection_triangles(self,
-                                               intersect_faces,
-                                               intersect_faces_bbox,
-                                               face_to_be_transformed,
-                                               not_intersecting_faces):
-        tri_faces = []
-        TriFace = namedtuple('TriFace', 'orig_face, v0, v1, v2, normal')
-        for face in self.bm.faces:
-            if not (face in intersect_faces or
-                    face is self.top_face or
-                    face in not_intersecting_faces):
+        if face_tree is None:
+            face_tree = FaceTree(bm)
+        self.face_tree = face_tree
+
+    # Check if a face crossed by an edge could be an opposite face
+    def __is_possible_intersection_face(self,
+                                        face,
+                                        intersect_faces,
+                                        intersect_faces_bbox,
+                                        face_to_be_transformed,
+                                        not_intersecting_faces):
+        if (face in intersect_faces or
+                face is self.top_face or
+                face in not_intersecting_faces):
+            return False
+
+        # Check possible intersection with boundary boxes
+        face_bbox = BBox.from_face(face)
+        possible_intersection = any(
+            intersect_faces_bbox.intersect_bbox(face_bbox))
+
+        # Check if face is behind reference face
+        if possible_intersection:
+            face_position = GeomUtils.face_position(
+                face,
+                face_to_be_transformed.median,
+                face_to_be_transformed.normal)
+            if face_position is Position.in_front or \
+                    face_position is Position.on_plane:
                 possible_intersection = False
-                # Check possible intersection with boundary boxes
-                for intersect_face_bbox in intersect_faces_bbox:
-                    face_bbox = BBox.from_face(face)
-                    if intersect_face_bbox.intersect(face_bbox):
-                        possible_intersection = True
-                        break
-
-                # Check if face is behind reference face
-                if possible_intersection:
-                    face_position = GeomUtils.face_position(
-                        face,
-                        face_to_be_transformed.median,
-                        face_to_be_transformed.normal)
-                    if face_position is Position.in_front or \
-                            face_position is Position.on_plane:
-                        possible_intersection = False
-
-                if possible_intersection:
-                    if len(face.verts) > 3:
-                        co_list = [vert.co for vert in face.verts]
-                        tris = tessellate_polygon((co_list,))
-                        for tri in tris:
-                            v0 = co_list[tri[0]]
-                            v1 = co_list[tri[1]]
-                            v2 = co_list[tri[2]]
-                            tri_normal = normal(v0, v1, v2)
-
-                            tri_face = TriFace(face,
-                                               v0=v0,
-                                               v1=v1,
-                                               v2=v2,
-                                               normal=tri_normal)
-                            tri_faces.append(tri_face)
-                    else:
-                        verts = face.verts
-                        v0 = verts[0].co
-                        v1 = verts[1].co
-                        v2 = verts[2].co
-                        tri_face = TriFace(face,
-                                           v0=v0,
-                                           v1=v1,
-                                           v2=v2,
-                                           normal=face.normal)
-                        tri_faces.append(tri_face)
-        return tri_faces
-
-    @staticmethod
-    def __find_intersection_points(intersect_edges, tri_faces):
+        return possible_intersection
+
+    # Cast a ray along each edge, from the reference face towards the top
+    # face, using the tree of mesh faces. Ray is cast again from each hit so
+    # that every face crossed by the edge line is found.
+    def __find_intersection_points(self,
+                                   intersect_edges,
+                                   intersect_faces,
+                                   intersect_faces_bbox,
+                                   face_to_be_transformed,
+                                   not_intersecting_faces):
         IntersectionPt = namedtuple('IntersectionPt',
-                                    'intersection_pt, tri, edge')
+                                    'intersection_pt, face, edge')
         intersection_pts = []
+        face_tree = self.face_tree
         for edge in intersect_edges:
-            for tri in tri_faces:
-                v1 = edge.verts[0].co
-                v2 = edge.verts[1].co
-                ray = v2 - v1
-                intersection_pt = intersect_ray_tri(tri.v0,
-                                                    tri.v1,
-                                                    tri.v2,
-                                                    ray,
-                                                    v1)
-                if intersection_pt is not None:
-                    intersection = IntersectionPt(intersection_pt, tri, edge)
-                    intersection_pts.append(intersection)
+            top_vert = edge.verts[0]
+            other_vert = edge.verts[1]
+            if not self.top_face in top_vert.link_faces:
+                top_vert, other_vert = other_vert, top_vert
+            direction = (top_vert.co - other_vert.co).normalized()
+
+            crossed_faces = set()
+            location, face = face_tree.ray_cast(other_vert.co, direction)
+            while location is not None:
+                if face not in crossed_faces:
+                    crossed_faces.add(face)
+                    if self.__is_possible_intersection_face(
+                            face,
+                            intersect_faces,
+                            intersect_faces_bbox,
+                            face_to_be_transformed,
+                            not_intersecting_faces):
+                        intersection = IntersectionPt(location, face, edge)
+                        intersection_pts.append(intersection)
+                origin = location + direction * \
+                    ThroughMortiseIntersection.RAY_CAST_OFFSET
+                location, face = face_tree.ray_cast(origin, direction)
         return intersection_pts
 
+    # Faces inside bounding box, only faces near the box are tested
+    def __inside_faces(self, bbox, moved_faces):
+        radius = (bbox.max - bbox.center()).length + \
+            GeomUtils.POINTS_ARE_NEAR_ABSOLUTE_ERROR_THRESHOLD
+        near_faces = set(moved_faces)
+        near_faces.update(self.face_tree.find_nearest_range(bbox.center(),
+                                                            radius))
+        return bbox.inside_faces(near_faces)
+
     # faces are connected (they form a box) when at least two edges are
     # connected with the others
     @staticmethod
@@ -606,22 +780,27 @@ class ThroughMortiseIntersection:
             if not self.top_face in vert.link_faces:
                 vert = edge.verts[1]
             translation_vector = intersection_pt - vert.co
-            bmesh.ops.translate(self.bm, vec=translation_vector, verts=[vert])
+            builder_ops.translate(self.bm, vec=translation_vector, verts=[vert])
 
     def __create_hole(self, intersection_pts):
         # remove intersected faces
         faces_to_delete = set()
         for intersection in intersection_pts:
-            tri = intersection.tri
-            faces_to_delete.add(tri.orig_face)
+            faces_to_delete.add(intersection.face)
 
         # find external loop in faces to be deleted
         if not ThroughMortiseIntersection.__faces_are_box_connected(
                 faces_to_delete):
             # There are faces in between intersected faces
             # Compute bounding box and select faces inside
+            # (tree is not updated for faces moved to intersection)
             faces_to_delete_bbox = BBox.from_faces(faces_to_delete)
-            inside_faces = faces_to_delete_bbox.inside_faces(self.bm.faces)
+            moved_faces = set()
+            for intersection in intersection_pts:
+                for vert in intersection.edge.verts:
+                    moved_faces.update(vert.link_faces)
+            inside_faces = self.__inside_faces(faces_to_delete_bbox,
+                                               moved_faces)
             faces_to_delete.update(inside_faces)
 
         edges_to_fill = ThroughMortiseIntersection.__outer_edge_loop(
@@ -633,11 +812,12 @@ class ThroughMortiseIntersection:
             edges_to_fill.add(edge)
 
         delete_faces = 5
-        bmesh.ops.delete(self.bm,
-                         geom=list(faces_to_delete),
-                         context=delete_faces)
-        bmesh.ops.bridge_loops(self.bm, edges=list(edges_to_fill))
-        #TODO: do a clean-up / limited dissolve
+        builder_ops.delete(self.bm,
+                           geom=list(faces_to_delete),
+                           context=delete_faces)
+        builder_ops.bridge_loops(self.bm, edges=list(edges_to_fill))
+        # Coplanar faces left around the hole are dissolved by the builder
+        # clean-up stage (clean_up property)
 
     # Calculate edge intersection with opposite face
     # Used for through mortise
@@ -658,24 +838,19 @@ class ThroughMortiseIntersection:
                         intersect_faces.add(edge_face)
 
         # Compute bounding box for faces
-        intersect_faces_bbox = []
-        for face in intersect_faces:
-            bbox = BBox.from_face(face)
-            intersect_faces_bbox.append(bbox)
+        if numpy is not None and len(intersect_faces) > 0:
+            intersect_faces_bbox = BBoxArray.from_faces(intersect_faces)
+        else:
+            intersect_faces_bbox = BBoxList.from_faces(intersect_faces)
 
-        # Map each original face index to one or more triangle if needed
-        tri_faces = self.__find_possible_intersection_triangles(
+        # Try to intersect with faces
+        intersection_pts = self.__find_intersection_points(
+            intersect_edges,
             intersect_faces,
             intersect_faces_bbox,
             face_to_be_transformed,
             not_intersecting_faces)
 
-        # Try to intersect with triangles
-        intersection_pts = \
-            ThroughMortiseIntersection.__find_intersection_points(
-                intersect_edges,
-                tri_faces)
-
         intersections_count = len(intersection_pts)
         if intersections_count == 4:
             self.__translate_top_face_to_intersection(intersection_pts)
@@ -751,11 +926,11 @@ class HeightAndThicknessSetup:
                         translate_vector_pos = final_vector_pos - \
                             vector_to_translate_pos
 
-        bmesh.ops.translate(
+        builder_ops.translate(
             bm,
             vec=translate_vector_pos,
             verts=list(verts_to_translate_side_pos))
-        bmesh.ops.translate(
+        builder_ops.translate(
             bm,
             vec=translate_vector_neg,
             verts=list(verts_to_translate_side_neg))
@@ -805,7 +980,7 @@ class HeightAndThicknessSetup:
             shoulder_value,
             mesh_object_data.matrix_world)
 
-        bmesh.ops.translate(
+        builder_ops.translate(
             mesh_object_data.bm,
             vec=translate_vector,
             space=mesh_object_data.matrix_world,
@@ -911,10 +1086,10 @@ class HeightAndThicknessSetup:
                         mesh_object_data.matrix_world,
                         shoulder_beyond_tenon)
 
-                bmesh.ops.translate(mesh_object_data.bm,
-                                    vec=translate_vector,
-                                    space=mesh_object_data.matrix_world,
-                                    verts=list(verts_to_translate))
+                builder_ops.translate(mesh_object_data.bm,
+                                      vec=translate_vector,
+                                      space=mesh_object_data.matrix_world,
+                                      verts=list(verts_to_translate))
 
                 # if shouldered and tenon size set to the max, delete
                 # shoulder on the other side. This operation re-order faces ids
@@ -922,9 +1097,13 @@ class HeightAndThicknessSetup:
                 if max:
                     merge_threshold = \
                         GeomUtils.POINTS_ARE_NEAR_ABSOLUTE_ERROR_THRESHOLD
-                    bmesh.ops.automerge(mesh_object_data.bm,
-                                        verts=list(verts_to_translate),
-                                        dist=merge_threshold)
+                    # Merge targets are on the collapsed shoulder faces
+                    weld_region = GeometryRetriever.weld_region(
+                        verts_to_translate)
+                    builder_ops.automerge(mesh_object_data.bm,
+                                          verts=list(verts_to_translate),
+                                          dist=merge_threshold)
+                    self.geometry_retriever.update_after_weld(weld_region)
 
     def __set_tenon_or_mortise_size(self,
                                     mesh_object_data: MeshObjectData,
@@ -933,21 +1112,10 @@ class HeightAndThicknessSetup:
                                     height_properties,
                                     thickness_properties):
         # Set tenon thickness
-        max = thickness_properties.type == "max"
+        max, size = JointKernel.side_size(
+            thickness_properties,
+            face_to_be_transformed.shortest_length)
         centered = thickness_properties.centered
-        if not centered and not max:
-            shoulder_and_tenon_length = thickness_properties.shoulder_value + \
-                thickness_properties.value
-            if MathUtils.almost_equal_relative_or_absolute(
-                    shoulder_and_tenon_length,
-                    face_to_be_transformed.shortest_length
-            ):
-                max = True
-        if max and not centered:
-            size = face_to_be_transformed.shortest_length - \
-                thickness_properties.shoulder_value
-        else:
-            size = thickness_properties.value
 
         if max:
             self.geometry_retriever.save_faces(
@@ -980,21 +1148,10 @@ class HeightAndThicknessSetup:
                 )
 
         # Set tenon height
-        max = height_properties.type == "max"
+        max, size = JointKernel.side_size(
+            height_properties,
+            face_to_be_transformed.longest_length)
         centered = height_properties.centered
-        if not centered and not max:
-            shoulder_and_tenon_length = height_properties.shoulder_value + \
-                height_properties.value
-            if MathUtils.almost_equal_relative_or_absolute(
-                    shoulder_and_tenon_length,
-                    face_to_be_transformed.longest_length
-            ):
-                max = True
-        if max and not centered:
-            size = face_to_be_transformed.longest_length - \
-                height_properties.shoulder_value
-        else:
-            size = height_properties.value
 
         if max:
             self.geometry_retriever.save_face(
@@ -1043,9 +1200,32 @@ class HeightAndThicknessSetup:
 
 
 class DepthSetup:
-    def __init__(self, geometry_retriever, builder_properties):
+    def __init__(self, geometry_retriever, builder_properties,
+                 face_tree=None):
         self.geometry_retriever = geometry_retriever
         self.builder_properties = builder_properties
+        self.face_tree = face_tree
+
+    # Select only the tenon top face, without bpy.ops (no edit mode context
+    # needed, works on any bmesh). Faces created from the initial face keep
+    # its selection : selected faces connected to the tenon top are
+    # deselected, the rest of the mesh is not visited.
+    @staticmethod
+    def __select_only(face):
+        visited = {face}
+        faces_to_visit = [face]
+        while faces_to_visit:
+            current_face = faces_to_visit.pop()
+            current_face.select = False
+            for vert in current_face.verts:
+                vert.select = False
+            for edge in current_face.edges:
+                edge.select = False
+                for linked_face in edge.link_faces:
+                    if linked_face.select and linked_face not in visited:
+                        visited.add(linked_face)
+                        faces_to_visit.append(linked_face)
+        face.select = True
 
     def set_depth(self,
                   mesh_object_data: MeshObjectData,
@@ -1081,8 +1261,8 @@ class DepthSetup:
     def __set_face_depth(mesh_object_data: MeshObjectData,
                          face,
                          depth):
-        ret = bmesh.ops.extrude_discrete_faces(mesh_object_data.bm,
-                                               faces=[face])
+        ret = builder_ops.extrude_discrete_faces(mesh_object_data.bm,
+                                                 faces=[face])
 
         extruded_face = ret['faces'][0]
         del ret
@@ -1093,10 +1273,10 @@ class DepthSetup:
         normal_world = rot_mat * extruded_face.normal
         normal_world = normal_world * depth
 
-        bmesh.ops.translate(mesh_object_data.bm,
-                            vec=normal_world,
-                            space=matrix_world,
-                            verts=extruded_face.verts)
+        builder_ops.translate(mesh_object_data.bm,
+                              vec=normal_world,
+                              space=matrix_world,
+                              verts=extruded_face.verts)
 
         return extruded_face
 
@@ -1113,7 +1293,7 @@ class DepthSetup:
         face_normal = face_to_extrude.normal
 
         # Extrude face
-        ret = bmesh.ops.extrude_discrete_faces(bm, faces=[face_to_extrude])
+        ret = builder_ops.extrude_discrete_faces(bm, faces=[face_to_extrude])
         extruded_face = ret['faces'][0]
         del ret
 
@@ -1145,7 +1325,7 @@ class DepthSetup:
                                           ReferenceGeometry.edgeToRaise)
 
         delete_faces = 5
-        bmesh.ops.delete(bm, geom=[face_to_remove], context=delete_faces)
+        builder_ops.delete(bm, geom=[face_to_remove], context=delete_faces)
 
         extruded_face = self.geometry_retriever.retrieve_face(
             ReferenceGeometry.extruded, remove_ref=False)
@@ -1169,10 +1349,13 @@ class DepthSetup:
                             if not has_linked_extruded_face:
                                 edges_to_collapse.append(link_edge)
 
+        weld_region = GeometryRetriever.weld_region(
+            [vert for edge in edges_to_collapse for vert in edge.verts])
         for edge in edges_to_collapse:
             verts = edge.verts
             merge_co = verts[0].co
-            bmesh.ops.pointmerge(bm, verts=verts, merge_co=merge_co)
+            builder_ops.pointmerge(bm, verts=verts, merge_co=merge_co)
+        self.geometry_retriever.update_after_weld(weld_region)
 
         extruded_face = self.geometry_retriever.retrieve_face(
             ReferenceGeometry.extruded)
@@ -1180,10 +1363,10 @@ class DepthSetup:
             ReferenceGeometry.edgeToRaise)
 
         # Translate edge up
-        bmesh.ops.translate(bm,
-                            vec=normal_world,
-                            space=matrix_world,
-                            verts=edge_to_raise.verts)
+        builder_ops.translate(bm,
+                              vec=normal_world,
+                              space=matrix_world,
+                              verts=edge_to_raise.verts)
 
         return extruded_face
 
@@ -1306,9 +1489,14 @@ class DepthSetup:
             verts_to_merge.append(new_vert)
 
         merge_threshold = GeomUtils.POINTS_ARE_NEAR_ABSOLUTE_ERROR_THRESHOLD
-        bmesh.ops.automerge(bm,
-                            verts=verts_to_merge,
-                            dist=merge_threshold)
+        # Split vertices are merged with haunch vertices
+        weld_region = GeometryRetriever.weld_region(
+            verts_to_merge +
+            [connection['haunch_vert'] for connection in connections])
+        builder_ops.automerge(bm,
+                              verts=verts_to_merge,
+                              dist=merge_threshold)
+        self.geometry_retriever.update_after_weld(weld_region)
 
         # Geometry has changed from now on so all old references may be wrong
         #  (adjacent_edge, adjacent_face ...)
@@ -1324,11 +1512,11 @@ class DepthSetup:
                 geom_to_delete.append(face)
 
         delete_only_faces = 3
-        bmesh.ops.delete(bm, geom=geom_to_delete, context=delete_only_faces)
+        builder_ops.delete(bm, geom=geom_to_delete, context=delete_only_faces)
 
         # 6. Remove old tenon face and unneeded edge below haunch
         delete_faces = 5
-        bmesh.ops.delete(bm, geom=[adjacent_face], context=delete_faces)
+        builder_ops.delete(bm, geom=[adjacent_face], context=delete_faces)
 
         # 7. Rebuild tenon face using new vertices
         face_vertices = [adjacent_edge.verts[0], adjacent_edge.verts[1]]
@@ -1353,7 +1541,7 @@ class DepthSetup:
             faces_to_dissolve.extend(
                 DepthSetup.__find_linked_faces_by_opposite_direction(
                     face_to_be_transformed, haunch_top, side_tangent))
-            bmesh.ops.dissolve_faces(bm, faces=faces_to_dissolve)
+            builder_ops.dissolve_faces(bm, faces=faces_to_dissolve)
 
     # Find hole face
     @staticmethod
@@ -1436,12 +1624,12 @@ class DepthSetup:
 
                     if not GeomUtils.points_are_same(intersection_pt,
                                                      origin_pt.co):
-                        bmesh.ops.translate(bm,
-                                            verts=[origin_pt],
-                                            vec=translate_vec)
+                        builder_ops.translate(bm,
+                                              verts=[origin_pt],
+                                              vec=translate_vec)
             # dissolve top edge
             if could_intersect:
-                bmesh.ops.dissolve_edges(bm, edges=[top_edge_to_dissolve])
+                builder_ops.dissolve_edges(bm, edges=[top_edge_to_dissolve])
 
     def __raise_haunched_tenon_side(self,
                                     mesh_object_data: MeshObjectData,
@@ -1608,13 +1796,13 @@ class DepthSetup:
         if builder_properties.depth_value < 0.0:
             through_mortise_hole_builder = ThroughMortiseIntersection(
                 mesh_object_data.bm,
-                tenon_top)
+                tenon_top,
+                self.face_tree)
             through_mortise_hole_builder.create_hole_in_opposite_faces(
                 face_to_be_transformed,
                 haunches_faces)
         else:
-            bpy.ops.mesh.select_all(action="DESELECT")
-            tenon_top.select = True
+            DepthSetup.__select_only(tenon_top)
 
     # Raise a not haunched tenon
     def __raise_simple_tenon(self,
@@ -1633,22 +1821,16 @@ class DepthSetup:
         if builder_properties.depth_value < 0.0:
             through_mortise_hole_builder = ThroughMortiseIntersection(
                 mesh_object_data.bm,
-                tenon_top)
+                tenon_top,
+                self.face_tree)
             through_mortise_hole_builder.create_hole_in_opposite_faces(
                 face_to_be_transformed, [])
 
-            max = thickness_properties.type == "max"
+            max, size = JointKernel.side_size(
+                thickness_properties,
+                face_to_be_transformed.shortest_length)
             centered = thickness_properties.centered
 
-            if not centered and not max:
-                shoulder_and_tenon_length = thickness_properties.shoulder_value + \
-                    thickness_properties.value
-                if MathUtils.almost_equal_relative_or_absolute(
-                        shoulder_and_tenon_length,
-                        face_to_be_transformed.shortest_length
-                ):
-                    max = True
-
             if max:
                 side_tangent = \
                     face_to_be_transformed.longest_side_tangent.copy()
@@ -1679,18 +1861,11 @@ class DepthSetup:
                         tenon_top,
                         side_tangent)
 
-            max = height_properties.type == "max"
+            max, size = JointKernel.side_size(
+                height_properties,
+                face_to_be_transformed.longest_length)
             centered = height_properties.centered
 
-            if not centered and not max:
-                shoulder_and_tenon_length = height_properties.shoulder_value + \
-                    height_properties.value
-                if MathUtils.almost_equal_relative_or_absolute(
-                        shoulder_and_tenon_length,
-                        face_to_be_transformed.longest_length
-                ):
-                    max = True
-
             if max:
                 side_tangent = \
                     face_to_be_transformed.shortest_side_tangent.copy()
@@ -1720,21 +1895,104 @@ class DepthSetup:
                         tenon_top,
                         side_tangent)
         else:
-            bpy.ops.mesh.select_all(action="DESELECT")
-            tenon_top.select = True
+            DepthSetup.__select_only(tenon_top)
+
+
+# Vertices of a created joint labeled with joint kernel points, used to
+# capture the joint faces in face local space
+class JointRecord:
+    # vert_symbols : kernel symbol by BMVert
+    def __init__(self, vert_symbols):
+        self.vert_symbols = vert_symbols
 
 
 # Build a tenon or a mortise on a face
 class TenonMortiseBuilder:
-    def __init__(self, builder_properties):
+    # Maximum angle between faces merged by clean-up (radians)
+    CLEAN_UP_ANGLE_LIMIT = 0.001
+
+    # face_tree : tree of mesh faces shared by the joints of one operator or
+    # batch call (see FaceTree), used by through mortises
+    def __init__(self, builder_properties, face_tree=None):
         self.builder_properties = builder_properties
         self.geometry_retriever = GeometryRetriever()
         self.height_and_thickness_setup = HeightAndThicknessSetup(
             self.geometry_retriever)
         self.depth_setup = DepthSetup(self.geometry_retriever,
-                                      builder_properties)
+                                      builder_properties,
+                                      face_tree)
+
+    # Face to be transformed after layers creation. Only if the face
+    # reference has been invalidated, look for the face with the same center
+    # (slow path, whole mesh is scanned).
+    @staticmethod
+    def __layer_safe_face(bm, face_to_be_transformed):
+        face = face_to_be_transformed.face
+        if face.is_valid:
+            return face
+        median = face_to_be_transformed.median
+        for face in bm.faces:
+            if GeomUtils.points_are_same(face.calc_center_median(), median):
+                return face
+        return None
 
+    # Seed faces and faces at most rings faces away from them
+    @staticmethod
+    def __faces_around(seed_faces, rings):
+        faces = set(seed_faces)
+        ring_faces = faces
+        for ring in range(rings):
+            next_ring_faces = set()
+            for face in ring_faces:
+                for vert in face.verts:
+                    for linked_face in vert.link_faces:
+                        if linked_face not in faces:
+                            next_ring_faces.add(linked_face)
+            faces.update(next_ring_faces)
+            ring_faces = next_ring_faces
+        return faces
+
+    # Dissolve coplanar faces and straight edges left by subdivision and
+    # through mortise holes. Only the joint region is visited : shoulders
+    # and the two rings of faces around them (tenon or mortise sides and
+    # top). Vertices and edges with a linked face outside the region are
+    # kept, so faces outside the region are not changed. Returns the number
+    # of faces removed.
+    @staticmethod
+    def __clean_up(bm, subdivided_faces):
+        seed_faces = [face for face in subdivided_faces if face.is_valid]
+        faces = TenonMortiseBuilder.__faces_around(seed_faces, 2)
+        if len(faces) == 0:
+            return 0
+        verts = set()
+        edges = set()
+        for face in faces:
+            verts.update(face.verts)
+            edges.update(face.edges)
+        verts = [vert for vert in verts
+                 if all(face in faces for face in vert.link_faces)]
+        edges = [edge for edge in edges
+                 if all(face in faces for face in edge.link_faces)]
+
+        face_count = len(bm.faces)
+        builder_ops.dissolve_limit(
+            bm,
+            angle_limit=TenonMortiseBuilder.CLEAN_UP_ANGLE_LIMIT,
+            use_dissolve_boundaries=False,
+            verts=verts,
+            edges=edges)
+        return face_count - len(bm.faces)
+
+    # Returns the number of faces removed by clean-up
     def create(self, bm, matrix_world, face_to_be_transformed):
+        profile = JointProfiler.start_joint(bm, builder_ops)
+        try:
+            return self.__create(profile, bm, matrix_world,
+                                 face_to_be_transformed)
+        finally:
+            JointProfiler.end_joint(profile)
+
+    def __create(self, profile, bm, matrix_world, face_to_be_transformed):
 
         mesh_object_data = MeshObjectData(bm, matrix_world)
 
@@ -1742,57 +2000,145 @@ class TenonMortiseBuilder:
         thickness_properties = builder_properties.thickness_properties
         height_properties = builder_properties.height_properties
 
-        # Create layers to retrieve geometry when data are deleted (this will
-        # reorder face so face_to_be_transformed is not valid anymore ...)
-        for face in bm.faces:
-            face.tag = False
-        for edge in bm.edges:
-            edge.tag = False
-        face_to_be_transformed.face.tag = True
-        self.geometry_retriever.create(bm)
-        tagged_faces = [f for f in bm.faces if f.tag]
-        face_to_be_transformed.face = tagged_faces[0]
-        face_to_be_transformed.face.tag = False
-        face_to_be_transformed.extract_features(matrix_world)
+        # Create layers to retrieve geometry when data are deleted
+        with profile.stage("setup"):
+            self.geometry_retriever.create(bm)
+            face_to_be_transformed.face = \
+                TenonMortiseBuilder.__layer_safe_face(bm,
+                                                      face_to_be_transformed)
+            face_to_be_transformed.extract_features(matrix_world)
 
         if builder_properties.depth_value > 0:
             if builder_properties.remove_wood:
-                face_to_be_transformed.translate_along_normal(
-                    bm,
-                    matrix_world,
-                    -builder_properties.depth_value)
+                with profile.stage("remove_wood"):
+                    face_to_be_transformed.translate_along_normal(
+                        bm,
+                        matrix_world,
+                        -builder_properties.depth_value)
 
         # Subdivide face
-        subdivided_faces = face_to_be_transformed.subdivide_face(
-            bm,
-            height_properties,
-            thickness_properties)
+        with profile.stage("subdivide"):
+            subdivided_faces = face_to_be_transformed.subdivide_face(
+                bm,
+                height_properties,
+                thickness_properties)
 
         # Find tenon face (face containing median center)
-        if len(subdivided_faces) == 0:
-            # when max height centered and max thickness centered
-            # (stupid choice but should handle this case too...)
-            tenon = TenonFace(face_to_be_transformed.face)
-
-        for f in subdivided_faces:
-            if bmesh.geometry.intersect_face_point(
-                    f,
-                    face_to_be_transformed.median):
-                tenon = TenonFace(f)
-                break
+        with profile.stage("find_tenon"):
+            if len(subdivided_faces) == 0:
+                # when max height centered and max thickness centered
+                # (stupid choice but should handle this case too...)
+                tenon = TenonFace(face_to_be_transformed.face)
+
+            for f in subdivided_faces:
+                if bmesh.geometry.intersect_face_point(
+                        f,
+                        face_to_be_transformed.median):
+                    tenon = TenonFace(f)
+                    break
 
         # Set shoulder and tenon height and thickness
-        self.height_and_thickness_setup.set_size(mesh_object_data,
-                                                 tenon,
-                                                 face_to_be_transformed,
-                                                 height_properties,
-                                                 thickness_properties)
+        with profile.stage("set_size"):
+            self.height_and_thickness_setup.set_size(mesh_object_data,
+                                                     tenon,
+                                                     face_to_be_transformed,
+                                                     height_properties,
+                                                     thickness_properties)
 
         # Raise tenon / dig mortise
-        self.depth_setup.set_depth(mesh_object_data,
-                                   tenon,
-                                   face_to_be_transformed,
-                                   self.height_and_thickness_setup.height_shoulders,
-                                   self.height_and_thickness_setup.thickness_shoulders)
+        with profile.stage("set_depth"):
+            self.depth_setup.set_depth(
+                mesh_object_data,
+                tenon,
+                face_to_be_transformed,
+                self.height_and_thickness_setup.height_shoulders,
+                self.height_and_thickness_setup.thickness_shoulders)
+
+        cleaned_face_count = 0
+        if getattr(builder_properties, "clean_up", False):
+            with profile.stage("clean_up"):
+                cleaned_face_count = TenonMortiseBuilder.__clean_up(
+                    bm, subdivided_faces)
+
+        with profile.stage("destroy"):
+            self.geometry_retriever.destroy()
+        return cleaned_face_count
 
-        self.geometry_retriever.destroy()
+    # Vertices of the joint region : faces connected to the initial face
+    # corners whose vertices all lie in the box of joint points (world space)
+    @staticmethod
+    def __joint_region_verts(matrix_world, frame, points, corner_verts):
+        local_points = [frame.local_coords(point) for point in points]
+        tolerance = GeomUtils.POINT_ON_SIDE_ABSOLUTE_ERROR_THRESHOLD
+        low = [min(point[axis] for point in local_points) - tolerance
+               for axis in range(3)]
+        high = [max(point[axis] for point in local_points) + tolerance
+                for axis in range(3)]
+
+        inside = dict()
+        visited_faces = set()
+        faces = set()
+        faces_to_visit = [face
+                          for vert in corner_verts if vert.is_valid
+                          for face in vert.link_faces]
+        while len(faces_to_visit) > 0:
+            face = faces_to_visit.pop()
+            if face in visited_faces:
+                continue
+            visited_faces.add(face)
+            for vert in face.verts:
+                if vert not in inside:
+                    point = frame.local_coords(tuple(matrix_world * vert.co))
+                    inside[vert] = all(low[axis] <= point[axis] <= high[axis]
+                                       for axis in range(3))
+            if not all(inside[vert] for vert in face.verts):
+                continue
+            faces.add(face)
+            for vert in face.verts:
+                faces_to_visit.extend(vert.link_faces)
+
+        verts = set()
+        for face in faces:
+            verts.update(face.verts)
+        return verts
+
+    # Faces changed by a joint : faces using a vertex of the joint region.
+    # points are the joint kernel points (world space) and corner_verts the
+    # initial face corners.
+    @staticmethod
+    def joint_region_faces(matrix_world, frame, points, corner_verts):
+        faces = set()
+        for vert in TenonMortiseBuilder.__joint_region_verts(matrix_world,
+                                                             frame,
+                                                             points,
+                                                             corner_verts):
+            faces.update(vert.link_faces)
+        return faces
+
+    # Label joint vertices with kernel points. corner_verts are the initial
+    # face corners : only the joint region around them is searched. Returns
+    # None when a kernel point is not found in the mesh (through
+    # mortise...) : joint can't be updated by moving vertices.
+    @staticmethod
+    def record(matrix_world, geometry, corner_verts):
+        verts = list(TenonMortiseBuilder.__joint_region_verts(
+            matrix_world, geometry.frame, geometry.verts(), corner_verts))
+        if len(verts) == 0:
+            return None
+        matrix_world_inverted = matrix_world.inverted()
+        kd_tree = KDTree(len(verts))
+        for index, vert in enumerate(verts):
+            kd_tree.insert(vert.co, index)
+        kd_tree.balance()
+
+        vert_symbols = dict()
+        for symbol, point in geometry.labeled_points():
+            local_point = matrix_world_inverted * Vector(point)
+            found = kd_tree.find_range(
+                local_point,
+                GeomUtils.POINT_ON_SIDE_ABSOLUTE_ERROR_THRESHOLD)
+            if len(found) == 0:
+                return None
+            for co, index, distance in found:
+                vert_symbols.setdefault(verts[index], symbol)
+        return JointRecord(vert_symbols)
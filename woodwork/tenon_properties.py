@@ -227,6 +227,12 @@ class TenonPropertyGroup(bpy.types.PropertyGroup):
         precision=3,
         step=0.1)
 
+    clean_up = bpy.props.BoolProperty(
+        name="Clean up",
+        description="Dissolve coplanar faces left around the tenon "
+                    "(joints are always built, joint caches are not used)",
+        default=False)
+
 
 def register():
     bpy.utils.register_class(TenonHaunch)
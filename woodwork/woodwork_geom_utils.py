@@ -6,6 +6,12 @@ from mathutils.geometry import intersect_point_line
 
 from . woodwork_math_utils import MathUtils
 
+# numpy is shipped with Blender but batch predicates are optional
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class Position(Enum):
     in_front = 1
@@ -109,6 +115,40 @@ class GeomUtils:
                     same = True
         return same
 
+    #
+    # Batch predicates (numpy) : faces are given as FaceArrays
+    #
+
+    @staticmethod
+    def are_faces_planar(face_arrays):
+        corner_faces = face_arrays.corner_faces()
+        first_points = face_arrays.points[face_arrays.starts][corner_faces]
+        normals = face_arrays.normals[corner_faces]
+        dist = numpy.einsum('ij,ij->i',
+                            face_arrays.points - first_points,
+                            normals)
+        off_plane = (numpy.abs(dist) >=
+                     GeomUtils.POINT_ON_SIDE_ABSOLUTE_ERROR_THRESHOLD)
+        return numpy.logical_not(
+            numpy.maximum.reduceat(off_plane, face_arrays.starts))
+
+    @staticmethod
+    def are_faces_rectangular(face_arrays, error=0.0005):
+        previous_corners, next_corners = face_arrays.adjacent_corners()
+        points = face_arrays.points
+        to_previous = points[previous_corners] - points
+        to_next = points[next_corners] - points
+        lengths = numpy.linalg.norm(to_previous, axis=1) * \
+            numpy.linalg.norm(to_next, axis=1)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            cos_angles = numpy.einsum('ij,ij->i', to_previous, to_next) / \
+                lengths
+        angles = numpy.arccos(numpy.clip(cos_angles, -1.0, 1.0))
+        not_perpendicular = numpy.logical_not(
+            numpy.abs(angles - (pi / 2)) <= error)
+        return numpy.logical_not(
+            numpy.maximum.reduceat(not_perpendicular, face_arrays.starts))
+
     @staticmethod
     def rotation_and_scale_matrix(space):
         return space.copy().to_3x3()
@@ -118,6 +158,74 @@ class GeomUtils:
         return space.copy().to_3x3().normalized()
 
 
+# Faces stored in arrays for batch predicates : points of all faces one
+# after the other, index of first point and point count of each face
+class FaceArrays:
+    def __init__(self, points, starts, sizes, normals):
+        self.points = points
+        self.starts = starts
+        self.sizes = sizes
+        self.normals = normals
+
+    @staticmethod
+    def from_faces(faces):
+        points = []
+        starts = []
+        sizes = []
+        normals = []
+        for face in faces:
+            verts = face.verts
+            starts.append(len(points))
+            sizes.append(len(verts))
+            points.extend(tuple(vert.co) for vert in verts)
+            normals.append(tuple(face.normal))
+        return FaceArrays(
+            numpy.array(points, dtype=numpy.float64).reshape(-1, 3),
+            numpy.array(starts, dtype=numpy.intp),
+            numpy.array(sizes, dtype=numpy.intp),
+            numpy.array(normals, dtype=numpy.float64).reshape(-1, 3))
+
+    # All faces of a mesh (object mode data), read with foreach_get. Returns
+    # face arrays and vertices coordinates.
+    @staticmethod
+    def from_mesh(mesh):
+        coords = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", coords)
+        loop_verts = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+        polygon_count = len(mesh.polygons)
+        starts = numpy.empty(polygon_count, dtype=numpy.int32)
+        mesh.polygons.foreach_get("loop_start", starts)
+        sizes = numpy.empty(polygon_count, dtype=numpy.int32)
+        mesh.polygons.foreach_get("loop_total", sizes)
+        normals = numpy.empty(polygon_count * 3, dtype=numpy.float32)
+        mesh.polygons.foreach_get("normal", normals)
+
+        coords = coords.astype(numpy.float64).reshape(-1, 3)
+        return FaceArrays(
+            coords[loop_verts],
+            starts.astype(numpy.intp),
+            sizes.astype(numpy.intp),
+            normals.astype(numpy.float64).reshape(-1, 3)), coords
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Face index of each point
+    def corner_faces(self):
+        return numpy.repeat(numpy.arange(len(self.starts)), self.sizes)
+
+    # Index of previous and next point in face for each point
+    def adjacent_corners(self):
+        corner_faces = self.corner_faces()
+        starts = self.starts[corner_faces]
+        sizes = self.sizes[corner_faces]
+        local_corners = numpy.arange(len(self.points)) - starts
+        previous_corners = starts + (local_corners - 1) % sizes
+        next_corners = starts + (local_corners + 1) % sizes
+        return previous_corners, next_corners
+
+
 class VectorUtils:
     PARALLEL_VECTORS_ABSOLUTE_ERROR_THRESHOLD = 1.e-5
 
@@ -162,17 +270,25 @@ class BBox:
                 max_values[i] = max(max_values[i], axe_co)
         return BBox(min_values, max_values)
 
+    # Bounding box of all faces. BMesh faces have no foreach_get : with
+    # numpy, their points are read once into FaceArrays (as for face
+    # classification).
     @staticmethod
     def from_faces(faces):
-        min_values = Vector.Fill(3, MathUtils.VECTOR_MAX_FLOAT_VALUE)
-        max_values = Vector.Fill(3, MathUtils.VECTOR_MIN_FLOAT_VALUE)
-        for face in faces:
-            for v in face.verts:
-                co = v.co
-                for i, axe_co in enumerate(co):
-                    min_values[i] = min(min_values[i], axe_co)
-                    max_values[i] = max(max_values[i], axe_co)
-        return BBox(min_values, max_values)
+        if numpy is not None:
+            face_arrays = FaceArrays.from_faces(faces)
+            if len(face_arrays.points) > 0:
+                return BBox(Vector(face_arrays.points.min(axis=0)),
+                            Vector(face_arrays.points.max(axis=0)))
+
+        verts = set(vert for face in faces for vert in face.verts)
+        if len(verts) == 0:
+            return BBox(Vector.Fill(3, MathUtils.VECTOR_MAX_FLOAT_VALUE),
+                        Vector.Fill(3, MathUtils.VECTOR_MIN_FLOAT_VALUE))
+        return BBox(Vector([min(vert.co[axis] for vert in verts)
+                            for axis in range(3)]),
+                    Vector([max(vert.co[axis] for vert in verts)
+                            for axis in range(3)]))
 
     def intersect(self, bbox):
         possible_intersection = True
@@ -204,6 +320,18 @@ class BBox:
         return face_inside
 
     def inside_faces(self, faces):
+        if numpy is not None:
+            faces = list(faces)
+            if len(faces) == 0:
+                return []
+            face_arrays = FaceArrays.from_faces(faces)
+            points_inside = BBoxArray.from_bbox(self).contains_points(
+                face_arrays.points)[0]
+            faces_inside = numpy.minimum.reduceat(points_inside,
+                                                  face_arrays.starts)
+            return [face for face, inside in zip(faces, faces_inside)
+                    if inside]
+
         inside_faces = []
         for face in faces:
             if self.face_inside(face):
@@ -212,3 +340,86 @@ class BBox:
 
     def center(self):
         return (self.min + self.max) * 0.5
+
+
+# N bounding boxes in one contiguous buffer : each row is
+# (min x, min y, min z, max x, max y, max z). Needs numpy.
+class BBoxArray:
+    __slots__ = ("buffer",)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __repr__(self):
+        return "<{}({}), count={}>".format(self.__class__.__name__,
+                                           hex(id(self)), len(self))
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def __getitem__(self, index):
+        row = self.buffer[index]
+        return BBox(Vector(row[:3]), Vector(row[3:]))
+
+    @property
+    def min(self):
+        return self.buffer[:, :3]
+
+    @property
+    def max(self):
+        return self.buffer[:, 3:]
+
+    @staticmethod
+    def from_bbox(bbox):
+        buffer = numpy.empty((1, 6), dtype=numpy.float64)
+        buffer[0, :3] = tuple(bbox.min)
+        buffer[0, 3:] = tuple(bbox.max)
+        return BBoxArray(buffer)
+
+    # One box per face
+    @staticmethod
+    def from_face_arrays(face_arrays):
+        buffer = numpy.empty((len(face_arrays), 6), dtype=numpy.float64)
+        buffer[:, :3] = numpy.minimum.reduceat(face_arrays.points,
+                                               face_arrays.starts)
+        buffer[:, 3:] = numpy.maximum.reduceat(face_arrays.points,
+                                               face_arrays.starts)
+        return BBoxArray(buffer)
+
+    @staticmethod
+    def from_faces(faces):
+        return BBoxArray.from_face_arrays(FaceArrays.from_faces(faces))
+
+    # Boolean matrix (len(self), len(other)) : True where boxes intersect
+    def intersect(self, other):
+        return numpy.logical_and(
+            numpy.all(self.min[:, None, :] <= other.max[None, :, :], axis=2),
+            numpy.all(self.max[:, None, :] >= other.min[None, :, :], axis=2))
+
+    # Boolean array : True for boxes intersecting given BBox
+    def intersect_bbox(self, bbox):
+        return self.intersect(BBoxArray.from_bbox(bbox))[:, 0]
+
+    # Boolean matrix (len(self), len(points)) : True where point is inside
+    def contains_points(self, points):
+        return numpy.logical_and(
+            numpy.all(points[None, :, :] >= self.min[:, None, :], axis=2),
+            numpy.all(points[None, :, :] <= self.max[:, None, :], axis=2))
+
+
+# Boxes queried as with BBoxArray.intersect_bbox, box by box (numpy not
+# available)
+class BBoxList:
+    def __init__(self, bboxes):
+        self.bboxes = bboxes
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    @staticmethod
+    def from_faces(faces):
+        return BBoxList([BBox.from_face(face) for face in faces])
+
+    # True for boxes intersecting given BBox
+    def intersect_bbox(self, bbox):
+        return [other.intersect(bbox) for other in self.bboxes]